@@ -20,5 +20,7 @@ except ImportError:
     cython_exists = False
 
 
-if ripyl.config.settings.use_cython and cython_exists:
+# Prebuilt extensions don't need Cython installed. Load failures are
+# reported by ripyl.config.settings.capabilities().
+if ripyl.config.settings.use_cython:
     import ripyl.cython
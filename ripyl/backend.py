@@ -0,0 +1,500 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Registry of alternate implementations for hot functions
+
+Performance critical functions can have more than one implementation (pure Python,
+NumPy, Cython, etc.). Each implementation is registered under a backend name and
+calls to the public function are dispatched to the selected backend. By default
+the backend with the highest priority is used. Setting the RIPYL_AUTOTUNE
+environment variable or calling :meth:`BackendRegistry.autotune` selects the
+fastest backend with a short benchmark instead. Benchmark results are only saved
+to disk when RIPYL_BACKEND_CACHE is set to the path of a cache file.
+
+The selection can be overridden globally with :meth:`BackendRegistry.select`,
+for the current thread with :meth:`BackendRegistry.use_backend`, or on a single
+call by passing a ``backend`` keyword argument to the dispatching function.
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import functools
+import json
+import os
+import sys
+import threading
+import timeit
+from contextlib import contextmanager
+
+
+class BackendError(Exception):
+    '''Error for unknown or unavailable backends'''
+    pass
+
+
+class HotFunction(object):
+    '''A function with multiple registered implementations'''
+    def __init__(self, name, bench=None):
+        '''
+        name (string)
+            Registry name of the function in dotted notation (ex: 'decode.find_edges').
+
+        bench (function or None)
+            Benchmark setup function. It is called with no arguments and returns a workload
+            function that takes an implementation as its only argument and exercises it.
+            When None, the backend with the highest priority is used.
+        '''
+        self.name = name
+        self.bench = bench
+        self.impls = {}       # Implementations keyed by backend name
+        self.priorities = {}  # Registration priority keyed by backend name
+        self.order = []       # Backend names in registration order
+        self.pinned = None    # Backend selected with BackendRegistry.select()
+        self.impl = None      # Cached implementation for the default selection
+        self.backend = None   # Backend name for the cached implementation
+
+    def __str__(self):
+        return '{} [{}]'.format(self.name, ', '.join(self.order))
+
+
+class BackendRegistry(object):
+    '''Container for hot functions and their backend implementations'''
+    def __init__(self, cache_path=None, autotune=True):
+        '''
+        cache_path (string or None)
+            Path to the JSON file used to save benchmark results. Results are not
+            saved to disk when this is None.
+
+        autotune (bool)
+            Benchmark the backends to select the default implementation. When False
+            the backend with the highest priority is used.
+        '''
+        self.cache_path = cache_path
+        self.autotune_enabled = autotune
+        self.functions = {}
+        self.disabled = set()
+
+        self._cache = None
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._override_count = 0
+
+    def add_function(self, name, bench=None):
+        '''Add a hot function to the registry
+
+        name (string)
+            Registry name of the function.
+
+        bench (function or None)
+            Benchmark setup function. See :class:`HotFunction`.
+
+        Returns the HotFunction object for the name.
+        '''
+        with self._lock:
+            if name not in self.functions:
+                self.functions[name] = HotFunction(name, bench)
+            elif bench is not None:
+                self.functions[name].bench = bench
+
+            return self.functions[name]
+
+    def _get_function(self, name):
+        try:
+            return self.functions[name]
+        except KeyError:
+            raise BackendError('Unknown hot function: {}'.format(name))
+
+    def register(self, name, backend, impl, priority=0):
+        '''Register a backend implementation for a hot function
+
+        name (string)
+            Registry name of the function.
+
+        backend (string)
+            Name of the backend (ex: 'python', 'numpy', 'cython').
+
+        impl (function)
+            The implementation. It must accept the same arguments as the other
+            implementations of the function.
+
+        priority (int)
+            Preference for this backend when no benchmark results are available.
+            Higher values are preferred.
+        '''
+        with self._lock:
+            hf = self.add_function(name)
+            if backend not in hf.impls:
+                hf.order.append(backend)
+            hf.impls[backend] = impl
+            hf.priorities[backend] = priority
+            hf.impl = None
+
+    def backends(self, name):
+        '''Get the registered backends for a function
+
+        Returns a list of backend names in registration order.
+        '''
+        return list(self._get_function(name).order)
+
+    def enable_backend(self, backend, enabled=True):
+        '''Enable or disable a backend for all functions
+
+        A disabled backend is never selected. Functions that have no other
+        backends remain callable with their disabled implementation.
+
+        backend (string)
+            Name of the backend.
+
+        enabled (bool)
+            New state for the backend.
+        '''
+        with self._lock:
+            if enabled:
+                self.disabled.discard(backend)
+            else:
+                self.disabled.add(backend)
+            self._clear_selections()
+
+    def select(self, name, backend):
+        '''Select a backend for a function in all threads
+
+        name (string)
+            Registry name of the function.
+
+        backend (string or None)
+            Name of the backend to use. Pass None to restore automatic selection.
+
+        Raises BackendError if the backend is not registered for the function.
+        '''
+        with self._lock:
+            hf = self._get_function(name)
+            if backend is not None and backend not in hf.impls:
+                raise BackendError('No "{}" backend for {}'.format(backend, name))
+            hf.pinned = backend
+            hf.impl = None
+
+    def _clear_selections(self):
+        for hf in self.functions.itervalues():
+            hf.impl = None
+
+    @contextmanager
+    def use_backend(self, backend, *names):
+        '''Context manager that selects a backend for the current thread
+
+        backend (string)
+            Name of the backend to use.
+
+        names (sequence of string)
+            Registry names of the functions to override. When empty all functions
+            with an implementation for the backend are overridden. Functions without
+            the backend are unaffected.
+        '''
+        overrides = self._thread_overrides()
+        overrides.append((backend, frozenset(names) if names else None))
+        with self._lock:
+            self._override_count += 1
+        try:
+            yield
+        finally:
+            overrides.pop()
+            with self._lock:
+                self._override_count -= 1
+
+    def _thread_overrides(self):
+        try:
+            return self._local.overrides
+        except AttributeError:
+            self._local.overrides = []
+            return self._local.overrides
+
+    def _enabled_backends(self, hf):
+        enabled = [b for b in hf.order if b not in self.disabled]
+        return enabled if enabled else list(hf.order)
+
+    def selected(self, name):
+        '''Get the name of the backend that will be used for a function
+
+        This accounts for any overrides active in the current thread.
+
+        Returns a backend name.
+        '''
+        hf = self._get_function(name)
+        backend = self._override_backend(hf)
+        if backend is None:
+            self._resolve_default(hf)
+            backend = hf.backend
+        return backend
+
+    def implementation(self, name, backend=None):
+        '''Get the implementation of a function
+
+        name (string)
+            Registry name of the function.
+
+        backend (string or None)
+            Name of a specific backend to retrieve. When None the thread overrides,
+            global selection, and benchmark results are used in that order.
+
+        Returns a function.
+
+        Raises BackendError if the backend is not registered for the function.
+        '''
+        hf = self._get_function(name)
+        if backend is not None:
+            try:
+                return hf.impls[backend]
+            except KeyError:
+                raise BackendError('No "{}" backend for {}'.format(backend, name))
+
+        backend = self._override_backend(hf)
+        if backend is not None:
+            return hf.impls[backend]
+
+        return self._resolve_default(hf)
+
+    def _override_backend(self, hf):
+        if self._override_count > 0:
+            for backend, names in reversed(self._thread_overrides()):
+                if backend in hf.impls and (names is None or hf.name in names):
+                    return backend
+        return None
+
+    def _resolve_default(self, hf, tune=None):
+        impl = hf.impl
+        if impl is not None:
+            return impl
+
+        if tune is None:
+            tune = self.autotune_enabled
+
+        with self._lock:
+            enabled = self._enabled_backends(hf)
+            if hf.pinned is not None and hf.pinned in enabled:
+                backend = hf.pinned
+            else:
+                backend = None
+                if tune and hf.bench is not None and len(enabled) > 1:
+                    backend = self._tune(hf, enabled)
+                if backend is None:
+                    # Highest priority wins. Ties go to the earliest registration.
+                    backend = max(enabled, key=lambda b: (hf.priorities[b], -hf.order.index(b)))
+
+            hf.backend = backend
+            hf.impl = hf.impls[backend]
+            return hf.impl
+
+    def autotune(self, names=None, force=False):
+        '''Benchmark the backends of hot functions
+
+        This works even when automatic benchmarking is disabled.
+
+        names (sequence of string or None)
+            Registry names of the functions to benchmark. All functions are
+            benchmarked when None.
+
+        force (bool)
+            Rerun the benchmarks even if results are cached.
+
+        Returns a dict of selected backend names keyed by function name.
+        '''
+        if names is None:
+            names = sorted(self.functions.iterkeys())
+
+        selections = {}
+        with self._lock:
+            for name in names:
+                hf = self._get_function(name)
+                if force:
+                    self._cached_times(hf).clear()
+                hf.impl = None
+                self._resolve_default(hf, tune=True)
+                selections[name] = self.selected(name)
+
+        return selections
+
+    def benchmark_times(self, name):
+        '''Get the cached benchmark results for a function
+
+        Returns a dict of run times in seconds keyed by backend name. Backends
+        that failed their benchmark have a time of None.
+        '''
+        with self._lock:
+            return dict(self._cached_times(self._get_function(name)))
+
+    def _tune(self, hf, enabled):
+        times = self._cached_times(hf)
+        untimed = [b for b in enabled if b not in times]
+        if len(untimed) > 0:
+            workload = hf.bench()
+            for backend in untimed:
+                times[backend] = _time_workload(workload, hf.impls[backend])
+            self._save_cache()
+
+        timed = [b for b in enabled if times.get(b) is not None]
+        if len(timed) == 0:
+            return None
+
+        return min(timed, key=lambda b: times[b])
+
+    def _cached_times(self, hf):
+        cache = self._load_cache()
+        return cache['functions'].setdefault(hf.name, {})
+
+    def _load_cache(self):
+        if self._cache is None:
+            cache = None
+            if self.cache_path is not None:
+                try:
+                    with open(self.cache_path, 'r') as fh:
+                        cache = json.load(fh)
+                except (IOError, OSError, ValueError):
+                    pass
+
+            if not isinstance(cache, dict) or cache.get('environment') != _environment_key():
+                cache = {'environment': _environment_key(), 'functions': {}}
+
+            self._cache = cache
+
+        return self._cache
+
+    def _save_cache(self):
+        if self.cache_path is None:
+            return
+
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(self.cache_path, 'w') as fh:
+                json.dump(self._cache, fh, indent=1, sort_keys=True)
+        except (IOError, OSError):
+            pass # Caching is only an optimization
+
+    def report(self):
+        '''Report summary of backend selections'''
+        print('Backend selections')
+        for name in sorted(self.functions.iterkeys()):
+            hf = self.functions[name]
+            print('  {}: {} {}'.format(name, self.selected(name), hf.order))
+
+
+def _time_workload(workload, impl, repeat=3):
+    '''Measure the best run time of a benchmark workload
+
+    Returns the time in seconds or None if the implementation raised an exception.
+    '''
+    best = None
+    for _ in xrange(repeat):
+        t_start = timeit.default_timer()
+        try:
+            workload(impl)
+        except Exception:
+            return None
+        elapsed = timeit.default_timer() - t_start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def _environment_key():
+    '''Identify the interpreter and library version that benchmark results apply to'''
+    import ripyl
+    return 'python {} {}; ripyl {}'.format(sys.version.split()[0], sys.platform, \
+        getattr(ripyl, '__version__', 'unknown'))
+
+
+def _default_cache_path():
+    # Nothing is written to disk unless a cache file is requested
+    cache_path = os.getenv('RIPYL_BACKEND_CACHE')
+    return cache_path if cache_path else None
+
+
+def _autotune_setting():
+    env = os.getenv('RIPYL_AUTOTUNE')
+    if env is None:
+        return False
+    return env.lower() in ('1', 'true', 't', 'y', 'yes')
+
+
+registry = BackendRegistry(_default_cache_path(), _autotune_setting())
+
+
+def hot_function(name, bench=None, backend='python', priority=0):
+    '''Decorator that registers a function as a backend of a hot function
+
+    The decorated function is replaced by a dispatcher that calls the selected
+    implementation. The dispatcher accepts an additional ``backend`` keyword
+    argument to select a specific implementation for one call.
+
+    name (string)
+        Registry name of the function.
+
+    bench (function or None)
+        Benchmark setup function. See :class:`HotFunction`.
+
+    backend (string)
+        Name of the backend for the decorated implementation.
+
+    priority (int)
+        Preference for this backend when no benchmark results are available.
+
+    Returns the dispatching function.
+    '''
+    def decorator(func):
+        hf = registry.add_function(name, bench)
+        registry.register(name, backend, func, priority)
+
+        def dispatch(*args, **kwargs):
+            if kwargs and 'backend' in kwargs:
+                impl = registry.implementation(name, kwargs.pop('backend'))
+            else:
+                impl = hf.impl
+                if impl is None or registry._override_count > 0:
+                    impl = registry.implementation(name)
+
+            return impl(*args, **kwargs)
+
+        functools.update_wrapper(dispatch, func)
+        dispatch.hot_function = hf
+        return dispatch
+
+    return decorator
+
+
+def backend_impl(name, backend, priority=0):
+    '''Decorator that registers an alternate implementation of a hot function
+
+    The decorated function is returned unchanged.
+
+    name (string)
+        Registry name of the function.
+
+    backend (string)
+        Name of the backend for the decorated implementation.
+
+    priority (int)
+        Preference for this backend when no benchmark results are available.
+    '''
+    def decorator(func):
+        registry.register(name, backend, func, priority)
+        return func
+
+    return decorator
@@ -0,0 +1,520 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Protocol classification of unknown channels
+
+Trial decoding every protocol on every channel of an unknown capture is slow.
+This module measures a set of inexpensive statistics from the start of a
+channel and uses them to rank the decoders that are likely to work on it along
+with suggested parameters:
+
+  >>> candidates = classify_channel(iter(samples))
+  >>> for cand in candidates:
+  ...     print(cand.protocol, cand.score, cand.params)
+  >>> records = candidates[0].decode(iter(samples))
+
+The statistics are collected by :func:`channel_stats` in one vectorized pass over
+a window of samples. They include the number of signal levels found with
+find_hist_peaks(), the idle polarity, the widths of the pulses between edges, the
+symbol rate from the harmonic product spectrum in find_symbol_rate(), and the
+frequency of any carrier modulating the signal. :func:`rank_candidates` scores
+each single channel decoder against them.
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import numpy as np
+
+import ripyl.decode as decode
+import ripyl.protocol as protocol
+from ripyl.streaming import SampleChunk
+
+# Common CAN bit rates
+_CAN_RATES = (10.0e3, 20.0e3, 33.333e3, 50.0e3, 83.333e3, 100.0e3, 125.0e3, 250.0e3, \
+    500.0e3, 800.0e3, 1.0e6)
+
+# Characteristic pulse widths of the fixed rate protocols
+_J1850_VPW_WIDTHS = (64.0e-6, 128.0e-6, 200.0e-6)
+_J1850_PWM_WIDTHS = (8.0e-6, 16.0e-6, 31.0e-6)
+_IR_WIDTHS = {
+    'nec': (560.0e-6, 1.69e-3, 2.25e-3, 4.5e-3, 9.0e-3),
+    'rc5': (889.0e-6, 1778.0e-6),
+    'rc6': (444.0e-6, 889.0e-6, 1333.0e-6, 2666.0e-6),
+    'sirc': (600.0e-6, 1200.0e-6, 2400.0e-6)
+}
+
+_USB_RATES = (1.5e6, 12.0e6, 480.0e6)
+_ETHERNET_10BT_RATE = 20.0e6 # Manchester half-bit rate
+
+
+class ChannelStats(object):
+    '''Statistics of a channel used for classification
+
+    :ivar sample_period: The sample period of the channel
+    :ivar duration: The length of the analyzed window in seconds
+    :ivar levels: A list of the signal levels found in the sample histogram
+    :ivar logic_levels: The (low, high) logic levels used to find edges or None
+    :ivar edge_times: Array of edge times. The first element is the start of the window.
+    :ivar edge_states: Array of the logic state after each edge
+    :ivar idle_state: The state held for the longest time without an edge
+    :ivar symbol_rate: The symbol rate from the HPS of the edge spans or 0
+    :ivar carrier_freq: The frequency of a modulating carrier or None
+    :ivar widths: Array of the widths of complete pulses between edges
+    :ivar width_states: Array of the state of each pulse in widths
+    :ivar envelope_widths: Pulse widths with any carrier removed
+    :ivar envelope_states: Array of the state of each pulse in envelope_widths
+    '''
+    def __init__(self, sample_period, duration, levels, logic_levels):
+        self.sample_period = sample_period
+        self.duration = duration
+        self.levels = levels
+        self.logic_levels = logic_levels
+        self.edge_times = np.zeros(0)
+        self.edge_states = np.zeros(0, dtype=int)
+        self.idle_state = None
+        self.symbol_rate = 0
+        self.carrier_freq = None
+        self.widths = np.zeros(0)
+        self.width_states = np.zeros(0, dtype=int)
+        self.envelope_widths = self.widths
+        self.envelope_states = self.width_states
+
+    @property
+    def edge_count(self):
+        '''The number of edges in the window'''
+        return max(len(self.edge_times) - 1, 0)
+
+    @property
+    def differential(self):
+        '''True when the levels indicate a differential bus
+
+        Three or more levels are the states of a differential bus. Two levels
+        balanced around 0V are a differential bus that rarely idles.
+        '''
+        if len(self.levels) >= 3:
+            return True
+        if len(self.levels) < 2:
+            return False
+        low, high = self.levels[0], self.levels[-1]
+        return low < 0.0 < high and abs(low + high) < 0.25 * (high - low)
+
+    def width_histogram(self, unit, max_units=16, envelope=False):
+        '''Histogram of the pulse widths in multiples of a time unit
+
+        unit (float)
+            The time unit, typically a bit period.
+
+        max_units (int)
+            The largest multiple to count. Longer pulses are counted in the last bin.
+
+        envelope (bool)
+            Use the widths with any carrier removed.
+
+        Returns an array of max_units + 1 counts. Element n is the number of pulses
+          that are closest to n units wide.
+        '''
+        widths = self.envelope_widths if envelope else self.widths
+        units = np.minimum(np.round(widths / unit), max_units).astype(int)
+        return np.bincount(units, minlength=max_units + 1)
+
+    def __repr__(self):
+        return 'ChannelStats(levels={}, edges={}, idle_state={}, symbol_rate={}, carrier_freq={})'.format( \
+            len(self.levels), self.edge_count, self.idle_state, self.symbol_rate, self.carrier_freq)
+
+
+class Candidate(object):
+    '''A decoder that is likely to work on a channel
+
+    :ivar protocol: Name of the protocol
+    :ivar decoder: The decoder function
+    :ivar score: A value from 0.0 to 1.0 indicating how well the channel fits the protocol
+    :ivar params: A dict of suggested keyword arguments for the decoder
+    '''
+    def __init__(self, protocol, decoder, score, params=None):
+        self.protocol = protocol
+        self.decoder = decoder
+        self.score = score
+        self.params = params if params is not None else {}
+
+    def decode(self, stream_data, **kwargs):
+        '''Run the decoder with the suggested parameters
+
+        stream_data (iterable of SampleChunk objects)
+            The sample stream to decode.
+
+        kwargs (dict)
+            Additional arguments for the decoder. These override the suggested parameters.
+
+        Returns the decoder's iterator of StreamRecord objects.
+        '''
+        params = dict(self.params)
+        params.update(kwargs)
+        return self.decoder(stream_data, **params)
+
+    def __repr__(self):
+        return 'Candidate({!r}, score={:.2f}, params={!r})'.format(self.protocol, self.score, self.params)
+
+
+def _hist_levels(samples, bins=100):
+    '''Find the centers of the peaks in a sample histogram'''
+    hist, bin_edges = np.histogram(samples, bins=bins)
+    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    peaks = decode.find_hist_peaks(hist)
+    return [bin_centers[p[0] + np.argmax(hist[p[0]:p[1]+1])] for p in peaks]
+
+def _symbol_rate(edges):
+    try:
+        rate = decode.find_symbol_rate(iter(edges), spectra=2)
+        if rate == 0: # Some sequences lack a second harmonic
+            rate = decode.find_symbol_rate(iter(edges), spectra=1)
+    except ValueError:
+        rate = 0
+    return rate
+
+def _find_carrier(times, min_freq=20.0e3, max_freq=100.0e3):
+    '''Find the frequency of a carrier modulating the pulses
+
+    Returns the carrier frequency or None if the pulses aren't modulated.
+    '''
+    if len(times) < 20:
+        return None
+
+    cycles = times[2:] - times[:-2] # Full cycles between alternate edges
+    period = np.median(cycles)
+    if not min_freq <= 1.0 / period <= max_freq:
+        return None
+
+    # A carrier keeps nearly all cycles at the same period. Only the
+    # ends of each burst differ.
+    if np.mean(np.abs(cycles - period) < 0.1 * period) < 0.75:
+        return None
+
+    return round(1.0 / period)
+
+def _demodulate(times, states, period, idle_state):
+    '''Remove the gaps between carrier pulses
+
+    Returns a tuple of the envelope edge times and states.
+    '''
+    # Idle gaps shorter than two carrier periods are inside a burst
+    short = np.nonzero((states[1:-1] == idle_state) & (np.diff(times[1:]) < 2.0 * period))[0] + 1
+    keep = np.ones(len(times), dtype=bool)
+    keep[short] = False
+    keep[short[short + 1 < len(times)] + 1] = False
+    return times[keep], states[keep]
+
+def _pulse_widths(times, states):
+    '''Widths of the complete pulses between edges'''
+    if len(times) < 3:
+        return np.zeros(0), np.zeros(0, dtype=int)
+    return np.diff(times[1:]), states[1:-1]
+
+
+def channel_stats(samples, logic_levels=None, max_samples=1000000, max_edges=2000):
+    '''Measure the statistics of a channel for classification
+
+    A window of samples is taken from the start of the stream and analyzed
+    in one pass.
+
+    samples (iterable of SampleChunk objects)
+        An iterable sample stream. Up to max_samples are consumed from it.
+
+    logic_levels ((float, float) or None)
+        Optional pair that indicates (low, high) logic levels of the sample
+        stream. When present, auto level detection is disabled.
+
+    max_samples (int)
+        The size of the window to analyze.
+
+    max_edges (int)
+        The maximum number of edges used to find the symbol rate.
+
+    Returns a ChannelStats object.
+    '''
+    chunks = []
+    count = 0
+    for sc in samples:
+        chunks.append(sc)
+        count += len(sc.samples)
+        if count >= max_samples:
+            break
+
+    if count == 0:
+        return ChannelStats(0.0, 0.0, [], logic_levels)
+
+    window = np.concatenate([sc.scaled_samples() for sc in chunks])[:max_samples]
+    start_time = chunks[0].start_time
+    sample_period = chunks[0].sample_period
+
+    levels = _hist_levels(window)
+    if logic_levels is None:
+        if len(levels) >= 2:
+            logic_levels = (levels[0], levels[-1])
+        else:
+            logic_levels = decode.find_logic_levels(iter(chunks))
+
+    cs = ChannelStats(sample_period, len(window) * sample_period, levels, logic_levels)
+    if logic_levels is None: # No activity
+        return cs
+
+    if len(levels) >= 3:
+        # Multi-level signals use the thresholds of a differential bus
+        center = (logic_levels[0] + logic_levels[1]) / 2.0
+        thresholds = decode.gen_hyst_thresholds((logic_levels[0], center, logic_levels[1]), hysteresis=0.1)
+        edges = list(decode.find_multi_edges(iter([SampleChunk(window, start_time, sample_period)]), thresholds))
+        cs.edge_times = np.array([e[0] for e in edges])
+        cs.edge_states = np.array([e[1] for e in edges], dtype=int)
+        rate_edges = [e for e in edges if e[1] != 0] # Diff-0 states confuse the HPS
+    else:
+        edge_ix, edge_states = decode.find_edge_arrays(window, logic_levels, hysteresis=0.4)
+        cs.edge_times = start_time + edge_ix * sample_period
+        cs.edge_states = np.asarray(edge_states, dtype=int)
+        rate_edges = zip(cs.edge_times[:max_edges + 1], cs.edge_states[:max_edges + 1])
+
+    if cs.edge_count == 0:
+        cs.idle_state = int(cs.edge_states[0]) if len(cs.edge_states) > 0 else None
+        return cs
+
+    # The idle state is the one held longest including the partial pulses at each end
+    runs = np.diff(np.append(cs.edge_times, start_time + cs.duration))
+    cs.idle_state = int(cs.edge_states[np.argmax(runs)])
+
+    cs.widths, cs.width_states = _pulse_widths(cs.edge_times, cs.edge_states)
+    cs.symbol_rate = _symbol_rate(rate_edges[:max_edges + 1])
+
+    cs.carrier_freq = _find_carrier(cs.edge_times[1:max_edges + 1])
+    if cs.carrier_freq is not None:
+        times, states = _demodulate(cs.edge_times, cs.edge_states, 1.0 / cs.carrier_freq, cs.idle_state)
+        cs.envelope_widths, cs.envelope_states = _pulse_widths(times, states)
+    else:
+        cs.envelope_widths, cs.envelope_states = cs.widths, cs.width_states
+
+    return cs
+
+
+def _nearest_rate(rate, std_rates, tolerance=0.03):
+    '''Coerce a measured rate to a standard one if it is within the tolerance'''
+    nearest = min(std_rates, key=lambda r: abs(r - rate))
+    return nearest if abs(nearest - rate) <= tolerance * nearest else rate
+
+def _matched_fraction(widths, expected, tolerance=0.2):
+    '''Fraction of widths that are within a relative tolerance of an expected width'''
+    if len(widths) == 0:
+        return 0.0
+    expected = np.asarray(expected)
+    rel_err = np.abs(widths[:, np.newaxis] - expected) / expected
+    return float(np.mean(np.min(rel_err, axis=1) <= tolerance))
+
+def _quantized_fraction(widths, unit, max_units, tolerance=0.25):
+    '''Fraction of widths that are close to a whole number of units no more than max_units'''
+    if len(widths) == 0:
+        return 0.0
+    units = widths / unit
+    nearest = np.round(units)
+    return float(np.mean((nearest >= 1) & (nearest <= max_units) & (np.abs(units - nearest) <= tolerance)))
+
+def _uart_frames(cs, unit, bits=8):
+    '''Check the framing of UART characters
+
+    Characters are located from their start bits and checked for an idle
+    level stop bit with and without a parity bit.
+
+    Returns a tuple (framed, frames, breaks) with the number of correctly framed
+      characters, the total number of characters, and the number of break
+      conditions (11 or more active bits) for the best parity setting.
+    '''
+    times = cs.edge_times
+    states = cs.edge_states
+    idle = cs.idle_state
+
+    def state_at(t):
+        return states[np.searchsorted(times, t, side='right') - 1]
+
+    starts = times[1:][states[1:] != idle]
+    best = (0, 0, 0)
+    for parity_bits in (0, 1):
+        framed = 0
+        frames = 0
+        breaks = 0
+        next_start = -np.inf
+        stop_offset = (bits + parity_bits + 1.5) * unit
+        for t in starts:
+            if t < next_start:
+                continue
+            frames += 1
+            end = times[min(np.searchsorted(times, t, side='right'), len(times) - 1)]
+            if end - t >= 10.5 * unit:
+                breaks += 1
+            elif state_at(t + stop_offset) == idle:
+                framed += 1
+            next_start = t + stop_offset
+
+        if frames > 0 and (best[1] == 0 or framed / frames > best[0] / best[1]):
+            best = (framed, frames, breaks)
+
+    return best
+
+
+def _score_uart(cs):
+    if cs.symbol_rate <= 0 or len(cs.levels) > 2:
+        return []
+    std_bauds = protocol.uart.StandardBaudRates
+    baud = _nearest_rate(cs.symbol_rate, std_bauds)
+    unit = 1.0 / baud
+    framed, frames, breaks = _uart_frames(cs, unit)
+    if frames == 0:
+        return []
+
+    score = framed / frames
+    polarity = protocol.uart.UARTConfig.IdleHigh if cs.idle_state == 1 else protocol.uart.UARTConfig.IdleLow
+    candidates = [Candidate('uart', protocol.uart.uart_decode, score if baud in std_bauds else score * 0.5, \
+        {'baud_rate': baud, 'polarity': polarity})] # Non-standard rates are unlikely
+
+    # LIN and K-line are UART based and idle high
+    if cs.idle_state == 1:
+        if breaks > 0 and baud <= 20.0e3 and frames > breaks:
+            # Breaks are a normal part of LIN frames
+            candidates.append(Candidate('lin', protocol.lin.lin_decode, framed / (frames - breaks), \
+                {'baud_rate': baud}))
+
+        if abs(baud - 10400) <= 0.03 * 10400:
+            candidates.append(Candidate('iso_k_line', protocol.iso_k_line.iso_k_line_decode, score))
+
+    return candidates
+
+def _score_can(cs):
+    if cs.symbol_rate <= 0 or len(cs.levels) > 2:
+        return []
+    bit_rate = _nearest_rate(cs.symbol_rate, _CAN_RATES)
+    unit = 1.0 / bit_rate
+
+    # Bit stuffing limits runs to 5 bits inside a frame. Idle runs of 10 or
+    # more bits are between frames.
+    in_frame = cs.widths[(cs.width_states != cs.idle_state) | (cs.widths < 9.5 * unit)]
+    score = _quantized_fraction(in_frame, unit, 5)
+    if bit_rate not in _CAN_RATES: # Non-standard rates are unlikely
+        score *= 0.5
+
+    # Runs in random frame data are often 3 or more bits. Signals with almost none
+    # are more likely to be fixed period PWM.
+    if len(in_frame) > 0 and np.mean(np.round(in_frame / unit) >= 3) < 0.05:
+        score *= 0.5
+
+    polarity = protocol.can.CANConfig.IdleHigh if cs.idle_state == 1 else protocol.can.CANConfig.IdleLow
+    return [Candidate('can', protocol.can.can_decode, score, {'bit_rate': int(round(bit_rate)), \
+        'polarity': polarity})]
+
+def _score_j1850(cs):
+    if len(cs.levels) > 2:
+        return []
+    # Both variants idle low
+    polarity_factor = 1.0 if cs.idle_state == 0 else 0.5
+
+    active = cs.widths[(cs.width_states != cs.idle_state) | (cs.widths <= 239.0e-6)]
+    vpw = _matched_fraction(active, _J1850_VPW_WIDTHS) * polarity_factor
+
+    active = cs.widths[(cs.width_states != cs.idle_state) | (cs.widths <= 40.0e-6)]
+    pwm = _matched_fraction(active, _J1850_PWM_WIDTHS) * polarity_factor
+
+    return [Candidate('j1850_vpw', protocol.j1850.j1850_vpw_decode, vpw), \
+        Candidate('j1850_pwm', protocol.j1850.j1850_pwm_decode, pwm)]
+
+def _score_ir(cs):
+    if len(cs.levels) > 2:
+        return []
+    ir = protocol.infrared
+    params = {'polarity': ir.ir_common.IRConfig.IdleHigh if cs.idle_state == 1 else ir.ir_common.IRConfig.IdleLow}
+    if cs.carrier_freq is not None:
+        params['carrier_freq'] = cs.carrier_freq
+
+    # Gaps between messages are not part of the timing
+    widths = cs.envelope_widths[(cs.envelope_states != cs.idle_state) | (cs.envelope_widths <= 10.0e-3)]
+    decoders = {'nec': ir.nec.nec_decode, 'rc5': ir.rc5.rc5_decode, 'rc6': ir.rc6.rc6_decode, \
+        'sirc': ir.sirc.sirc_decode}
+
+    return [Candidate(name, decoders[name], _matched_fraction(widths, expected, 0.15), dict(params)) \
+        for name, expected in sorted(_IR_WIDTHS.iteritems())]
+
+def _score_differential(cs):
+    if not cs.differential or cs.symbol_rate <= 0:
+        return []
+
+    def rate_score(expected):
+        return max(0.0, 1.0 - abs(cs.symbol_rate - expected) / (0.1 * expected))
+
+    return [Candidate('usb_diff', protocol.usb.usb_diff_decode, max(rate_score(r) for r in _USB_RATES)), \
+        Candidate('ethernet', protocol.ethernet.ethernet_decode, rate_score(_ETHERNET_10BT_RATE))]
+
+_SCORERS = (_score_uart, _score_can, _score_j1850, _score_ir, _score_differential)
+
+# Protocols layered on another one. They win ties with the base protocol.
+_SPECIALIZED = ('lin', 'iso_k_line')
+
+
+def rank_candidates(stats, min_score=0.5, min_edges=20):
+    '''Rank the decoders that could be used on a channel
+
+    stats (ChannelStats)
+        The statistics of the channel from channel_stats().
+
+    min_score (float)
+        Candidates with a lower score are not returned.
+
+    min_edges (int)
+        The minimum number of edges needed to classify the channel.
+
+    Returns a list of Candidate objects sorted from the best to the worst match.
+      Protocols built on UART are placed ahead of UART when their scores are equal.
+      The list is empty if the channel has too few edges.
+    '''
+    if stats.edge_count < min_edges:
+        return []
+
+    # The edges of a modulated signal only describe the carrier. Only IR uses one.
+    scorers = (_score_ir,) if stats.carrier_freq is not None else _SCORERS
+
+    candidates = []
+    for scorer in scorers:
+        candidates.extend(c for c in scorer(stats) if c.score >= min_score)
+
+    return sorted(candidates, key=lambda c: (c.score, c.protocol in _SPECIALIZED), reverse=True)
+
+
+def classify_channel(samples, logic_levels=None, min_score=0.5, max_samples=1000000):
+    '''Rank the decoders that could be used on a channel
+
+    This is a combination of channel_stats() and rank_candidates().
+
+    samples (iterable of SampleChunk objects)
+        An iterable sample stream. Up to max_samples are consumed from it.
+
+    logic_levels ((float, float) or None)
+        Optional pair that indicates (low, high) logic levels of the sample
+        stream. When present, auto level detection is disabled.
+
+    min_score (float)
+        Candidates with a lower score are not returned.
+
+    max_samples (int)
+        The number of samples to analyze.
+
+    Returns a list of Candidate objects sorted from the best to the worst match.
+    '''
+    return rank_candidates(channel_stats(samples, logic_levels, max_samples), min_score)
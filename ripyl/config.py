@@ -70,12 +70,43 @@ class PatchObject(object):
             self.active = False
 
 
+def find_references(objs, obj_name, lib_base='ripyl'):
+    '''Find the loaded library modules that reference an object by name
+
+    objs (sequence of objects)
+        The objects to look for.
+
+    obj_name (string)
+        The name the object is bound to in the modules.
+
+    lib_base (string)
+        The base name of the library modules to search. Its Cython extension
+        modules are excluded.
+
+    Returns a list of module names in dotted notation.
+    '''
+    ref_mnames = []
+    for mname, module in sys.modules.items():
+        if module is None or not mname.startswith(lib_base + '.') or mname.startswith(lib_base + '.cython'):
+            continue
+
+        ref = module.__dict__.get(obj_name)
+        if any(ref is obj for obj in objs):
+            ref_mnames.append(mname)
+
+    return sorted(ref_mnames)
+
+
 class ConfigSettings(object):
     '''Container for general ripyl library settings'''
     def __init__(self):
         self.use_cython = False       # Indicates Cython should be used
         self.cython_prebuild = False  # Tracks whether Cython code was compiled during library installation
         self.cython_x = False
+        self.cython_modules = None    # Manifest of compiled Cython module names written at build time
+        self.cython_pyximport = False # Compile Cython modules at import time with pyximport
+        self.cython_module_status = {}  # (status, detail) tuples for each Cython module keyed by name
+        self.build_version = None     # Ripyl version the Cython modules were compiled for
         self.python_fallback = True   # Silently ignore any failed cython import
         self.patched_objs = []        # List of PatchObject to control monkeypatching
         self.config_source = 'unknown'
@@ -85,25 +116,101 @@ class ConfigSettings(object):
     def cython_active(self):
         '''Identify if Cython modules have been monkeypatched
 
-        Returns True if any patches have been applied'''
-        return any(po.active for po in self.patched_objs)
+        Returns True if any patches have been applied or any Cython backends are enabled'''
+        import ripyl.backend as backend
+        cy_backends = 'cython' not in backend.registry.disabled and \
+            any('cython' in hf.impls for hf in backend.registry.functions.itervalues())
+
+        return cy_backends or any(po.active for po in self.patched_objs)
 
     @cython_active.setter
     def cython_active(self, value):
+        import ripyl.backend as backend
+        backend.registry.enable_backend('cython', value)
+
+        self._track_new_references()
         for po in self.patched_objs:
             if value:
                 po.activate()
             else:
                 po.revert()
 
+    def _track_new_references(self):
+        '''Add patches for library modules imported after the patches were made
+
+        A module that imports a patched object by name (ex: "from ripyl.decode import *")
+        holds whichever object was active at the time. It needs its own PatchObject so
+        that it follows later changes to cython_active.
+        '''
+        tracked = set((po.py_mname, po.obj_name) for po in self.patched_objs)
+        for po in list(self.patched_objs):
+            for mname in find_references((po.obj, po.orig_obj), po.obj_name):
+                if (mname, po.obj_name) in tracked:
+                    continue
+
+                new_po = PatchObject(mname, po.obj_name, po.obj, po.orig_obj)
+                new_po.active = sys.modules[mname].__dict__[po.obj_name] is po.obj
+                self.patched_objs.append(new_po)
+                tracked.add((mname, po.obj_name))
+
     def cython_status(self):
         '''Report summary of Cython status'''
         print 'Cython status'
         print '  Enabled: {}'.format(self.use_cython)
         print '  Prebuild: {}'.format(self.cython_prebuild)
         print '  Active: {}'.format(self.cython_active)
+        print '  Modules:\n    {}'.format('\n    '.join('{}: {} {}'.format(m, st, detail) \
+            for m, (st, detail) in sorted(self.cython_module_status.iteritems())))
         print '  Patched objects:\n    {}'.format('\n    '.join(str(po) for po in self.patched_objs))
 
+        import ripyl.backend as backend
+        cy_funcs = sorted(name for name, hf in backend.registry.functions.iteritems() if 'cython' in hf.impls)
+        print '  Cython backends:\n    {}'.format('\n    '.join(cy_funcs))
+
+
+    def capabilities(self, resolve=False):
+        '''Report which accelerated code paths are available and active
+
+        resolve (bool)
+            Resolve the backend selection for every hot function. This may run
+            backend benchmarks. When False only selections that have already
+            been made are reported.
+
+        Returns a dict with the following keys:
+          'version': The Ripyl version string.
+          'cython': A dict with the 'enabled', 'prebuild', 'pyximport', and 'active'
+            settings and a 'modules' dict of (status, detail) tuples for each
+            Cython module. Modules that failed to load have a status other than 'loaded'.
+          'patched': A list of the objects currently replaced by Cython classes.
+          'functions': A dict keyed by hot function name. Each value is a dict with the
+            registered 'backends', the 'disabled' backends, and the 'selected' backend
+            (None if not yet resolved).
+        '''
+        import ripyl
+        import ripyl.backend as backend
+
+        functions = {}
+        for name, hf in backend.registry.functions.items():
+            selected = backend.registry.selected(name) if resolve else (hf.pinned or hf.backend)
+            functions[name] = {
+                'backends': list(hf.order),
+                'disabled': [b for b in hf.order if b in backend.registry.disabled],
+                'selected': selected
+            }
+
+        return {
+            'version': ripyl.__version__,
+            'cython': {
+                'enabled': self.use_cython,
+                'prebuild': self.cython_prebuild,
+                'pyximport': self.cython_pyximport,
+                'active': self.cython_active,
+                'modules': dict(self.cython_module_status)
+            },
+            'patched': ['{}.{}'.format(po.py_mname, po.obj_name) for po in self.patched_objs if po.active],
+            'functions': functions
+        }
+
 
     def find_patch_obj(self, obj_path):
         '''Search for a PatchObject by name
@@ -131,7 +238,9 @@ def _parse_config():
 
     default_setup = {
         'use_cython': 'False',
-        'cython_prebuild': 'False'
+        'cython_prebuild': 'False',
+        'cython_modules': '',
+        'build_version': ''
     }
 
     config = ConfigParser.ConfigParser(default_setup)
@@ -144,15 +253,20 @@ def _parse_config():
     if 'setup' in config.sections():
         settings.use_cython = config.getboolean('setup', 'use_cython')
         settings.cython_prebuild = config.getboolean('setup', 'cython_prebuild')
+        cy_modules = [m.strip() for m in config.get('setup', 'cython_modules').split(',')]
+        settings.cython_modules = [m for m in cy_modules if m] or None
+        settings.build_version = config.get('setup', 'build_version') or None
         settings.config_source = config_path
 
 
-def write_config(cfg_path, use_cython, cython_prebuild):
+def write_config(cfg_path, use_cython, cython_prebuild, cython_modules=None):
     '''Write a file for the Ripyl build configuration'''
     config = ConfigParser.ConfigParser()
     config.add_section('setup')
     config.set('setup', 'use_cython', str(settings.use_cython))
     config.set('setup', 'cython_prebuild', str(settings.cython_prebuild))
+    if cython_modules:
+        config.set('setup', 'cython_modules', ', '.join(cython_modules))
 
     with open(cfg_path, 'wb') as fh:
         config.write(fh)
@@ -171,6 +285,13 @@ if ripyl_cython_env is not None:
 
     settings.use_cython = ripyl_cython_env
 
+# Compiling Cython modules on import is only for development. Installed copies
+# of the library use the extensions built by setup.py.
+ripyl_pyximport_env = os.getenv('RIPYL_PYXIMPORT')
+
+if ripyl_pyximport_env is not None:
+    settings.cython_pyximport = ripyl_pyximport_env.lower() in ('1', 'true', 't', 'y', 'yes')
+
 
 
 
@@ -1,11 +1,16 @@
 #!/usr/bin/python
 
-'''Cython extension package'''
+'''Cython extension package
 
-import ripyl
+The extension modules are compiled ahead of time by setup.py. They are only
+compiled at import time with pyximport when the RIPYL_PYXIMPORT environment
+variable is set. Modules that can't be loaded are recorded in
+ripyl.config.settings.cython_module_status and the pure Python code is used
+in their place.
+'''
 
-if ripyl.config.settings.cython_prebuild == False:
-    import pyximport; pyximport.install()
+import ripyl
+import ripyl.backend
 
 import inspect
 import importlib
@@ -14,6 +19,16 @@ import os
 import fnmatch
 import string
 
+# Interface version the extension modules must match. Increment this and the
+# __ripyl_abi__ value in each .pyx file whenever their interface changes.
+CYTHON_ABI = 2
+
+if ripyl.config.settings.cython_pyximport:
+    try:
+        import pyximport; pyximport.install()
+    except ImportError:
+        pass # Modules that aren't prebuilt will be reported as missing
+
 
 def find_files(pattern, path):
     '''Recursively search for files that match a specified pattern'''
@@ -48,6 +63,9 @@ def find_cy_modules():
 def monkeypatch_modules(modules, lib_base):
     '''Replace pure Python functions and classes with Cython equivalents
 
+    Functions registered with the backend registry are added to it as a 'cython'
+    backend. All other functions and classes are monkeypatched.
+
     modules (dict of modules)
         A dict of module objects keyed by their module name.
 
@@ -70,34 +88,82 @@ def monkeypatch_modules(modules, lib_base):
                 # Python implementations
                 if obj_name in sys.modules[py_mname].__dict__:
                     orig_obj = sys.modules[py_mname].__dict__[obj_name]
-                    po = ripyl.config.PatchObject(py_mname, obj_name, obj, orig_obj)
-                    po.activate()
-                    patched_objs.append(po)
+                    if orig_obj is obj: # Imported into the Cython module. Nothing to patch.
+                        continue
+
+                    # Hot functions dispatch through the backend registry. Register the
+                    # Cython function as a backend rather than patching over it.
+                    hf = getattr(orig_obj, 'hot_function', None)
+                    if hf is not None:
+                        ripyl.backend.registry.register(hf.name, 'cython', obj, priority=10)
+                        continue
+
+                    # Modules that imported the original object by name (ex: "from ripyl.decode import *")
+                    # hold their own reference to it and must be patched as well.
+                    for ref_mname in ripyl.config.find_references((orig_obj,), obj_name, lib_base):
+                        po = ripyl.config.PatchObject(ref_mname, obj_name, obj, orig_obj)
+                        po.activate()
+                        patched_objs.append(po)
 
     return patched_objs
 
 
+def load_cy_modules(module_names):
+    '''Import compiled Cython modules
 
-# Find all cython modules
-cy_module_names = find_cy_modules()
+    Modules that fail to import, were built for a different version of
+    Ripyl, or have a mismatched interface version are skipped.
 
-cy_modules = {}
-for mname in cy_module_names:
-    #print '## importing cython: "{}"'.format(mname)
-    full_mname = 'ripyl.cython.' + mname
-    try:
-        cy_modules[mname] = importlib.import_module(full_mname)
-    except ImportError, KeyError:
-        msg = 'Could not import Cython module: {}'.format(full_mname)
-        if ripyl.config.settings.python_fallback == True:
-            print 'Error:', msg
-        else:
-            #print '@@@@@@@@@@ CYTHON ABORT'
-            raise ImportError(msg)
+    module_names (sequence of string)
+        Names of the modules relative to the ripyl.cython package.
 
-#print 'cython modules:', cy_modules
+    Returns a tuple (modules, status). modules is a dict of loaded module objects keyed
+      by name. status is a dict of (status, detail) tuples keyed by name. The status
+      is one of 'loaded', 'missing', 'version_mismatch', 'abi_mismatch', or 'error'.
+    '''
+    settings = ripyl.config.settings
+    modules = {}
+    status = {}
 
-ripyl.config.settings.patched_objs = monkeypatch_modules(cy_modules, 'ripyl')
+    if settings.build_version is not None and settings.build_version != ripyl.__version__:
+        detail = 'Built for Ripyl {} not {}'.format(settings.build_version, ripyl.__version__)
+        for mname in module_names:
+            status[mname] = ('version_mismatch', detail)
+        return modules, status
 
+    for mname in module_names:
+        full_mname = 'ripyl.cython.' + mname
+        try:
+            module = importlib.import_module(full_mname)
+        except ImportError as e:
+            status[mname] = ('missing', str(e))
+            continue
+        except Exception as e: # Extensions built against an incompatible NumPy raise ValueError
+            status[mname] = ('error', '{}: {}'.format(type(e).__name__, e))
+            continue
 
+        abi = getattr(module, '__ripyl_abi__', None)
+        if abi != CYTHON_ABI:
+            status[mname] = ('abi_mismatch', 'Module ABI {} does not match {}'.format(abi, CYTHON_ABI))
+            continue
 
+        modules[mname] = module
+        status[mname] = ('loaded', getattr(module, '__file__', ''))
+
+    return modules, status
+
+
+
+# Use the manifest of prebuilt modules from the build configuration if available
+cy_module_names = ripyl.config.settings.cython_modules
+if cy_module_names is None:
+    cy_module_names = find_cy_modules()
+
+cy_modules, ripyl.config.settings.cython_module_status = load_cy_modules(cy_module_names)
+
+failed = ['ripyl.cython.{} ({}: {})'.format(m, st, detail) \
+    for m, (st, detail) in sorted(ripyl.config.settings.cython_module_status.iteritems()) if st != 'loaded']
+if len(failed) > 0 and not ripyl.config.settings.python_fallback:
+    raise ImportError('Could not import Cython modules: {}'.format(', '.join(failed)))
+
+ripyl.config.settings.patched_objs = monkeypatch_modules(cy_modules, 'ripyl')
@@ -28,6 +28,11 @@ cimport cython
 cimport numpy as np
 import numpy as np
 
+from ripyl.streaming import StreamError
+
+# Interface version checked against ripyl.cython.CYTHON_ABI when this module is loaded
+__ripyl_abi__ = 2
+
 #from libc.stdlib cimport malloc, free
 
 ctypedef struct cEdge:
@@ -84,7 +89,7 @@ cdef int ZONE_2_T  = 1 # transition
 cdef int ZONE_3_L0 = 0 # logic 0
 
 
-def find_edges(sample_chunks, logic, hysteresis=0.4):
+def find_edges(sample_chunks, logic, hysteresis=0.4, skip_idle=True):
     cdef double span = logic[1] - logic[0]
     cdef double thresh = (logic[1] + logic[0]) / 2.0
     cdef double hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
@@ -98,10 +103,14 @@ def find_edges(sample_chunks, logic, hysteresis=0.4):
 
     #print 'cy find_edges()'
 
+    if skip_idle:
+        import ripyl.decode
+        sample_chunks = ripyl.decode.skip_idle(sample_chunks, logic, hysteresis)
+
     for sc in sample_chunks:
         t = sc.start_time
         sample_period = sc.sample_period
-        chunk = sc.samples
+        chunk = np.asarray(sc.scaled_samples(), dtype=np.float64)
 
         if state == ES_START:
             initial_state = (t, 1 if chunk[0] > thresh else 0)
@@ -232,7 +241,7 @@ def find_multi_edges(samples, hyst_thresholds):
     for sc in samples:
         t = sc.start_time
         sample_period = sc.sample_period
-        chunk = sc.samples
+        chunk = np.asarray(sc.scaled_samples(), dtype=np.float64)
 
         if state == ES_START: # Set initial edge state
             center_ix = len(center_thresholds)
@@ -309,3 +318,270 @@ cdef _cy_find_multi_edges(double[:] chunk, double t, double sample_period, doubl
 
     return edges
 
+
+
+
+def find_edge_arrays(samples, logic, hysteresis=0.4):
+    cdef double span = logic[1] - logic[0]
+    cdef double thresh = (logic[1] + logic[0]) / 2.0
+    cdef double hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
+    cdef double hyst_bot = span * (0.5 - hysteresis / 2.0) + logic[0]
+
+    cdef double [:] chunk = np.ascontiguousarray(samples, dtype=np.float64)
+    cdef int state = ES_START
+    cdef int prev_stable = ZONE_3_L0
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t count
+
+    # Edges are written into fixed size buffers. The kernel returns when
+    # a buffer fills so it can be copied out and the scan resumed.
+    cdef Py_ssize_t buf_size = 4096
+    out_ix_a = np.empty(buf_size, dtype=np.int64)
+    out_state_a = np.empty(buf_size, dtype=np.int8)
+    cdef np.int64_t [:] out_ix = out_ix_a
+    cdef np.int8_t [:] out_state = out_state_a
+
+    if chunk.shape[0] == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8))
+
+    ix_parts = [np.zeros(1, dtype=np.int64)]
+    state_parts = [np.array([1 if chunk[0] > thresh else 0], dtype=np.int8)]
+
+    while i < chunk.shape[0]:
+        with nogil:
+            count = _cy_find_edge_array(chunk, &i, hyst_top, hyst_bot, &state, &prev_stable, out_ix, out_state)
+
+        if count > 0:
+            ix_parts.append(out_ix_a[:count].copy())
+            state_parts.append(out_state_a[:count].copy())
+
+    return (np.concatenate(ix_parts), np.concatenate(state_parts))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _cy_find_edge_array(double[:] chunk, Py_ssize_t *p_i, double hyst_top, double hyst_bot, \
+    int *p_state, int *p_prev_stable, np.int64_t[:] out_ix, np.int8_t[:] out_state) nogil:
+
+    cdef int zone
+    cdef bint zone_is_stable
+    cdef double sample
+    cdef Py_ssize_t i
+    cdef Py_ssize_t count = 0
+    cdef int state, prev_stable
+
+    state = p_state[0]
+    prev_stable = p_prev_stable[0]
+
+    i = p_i[0]
+    while i < chunk.shape[0] and count < out_ix.shape[0]:
+        sample = chunk[i]
+
+        if sample > hyst_top:
+            zone = ZONE_1_L1
+        elif sample > hyst_bot:
+            zone = ZONE_2_T
+        else:
+            zone = ZONE_3_L0
+        zone_is_stable = zone == ZONE_1_L1 or zone == ZONE_3_L0
+
+        if state == ES_START:
+            # Stay in start until we reach one of the stable states
+            if zone_is_stable:
+                state = zone
+
+        # last zone was a stable state
+        elif state == ZONE_1_L1 or state == ZONE_3_L0:
+            if zone_is_stable:
+                if zone != state:
+                    state = zone
+                    out_ix[count] = i
+                    out_state[count] = zone // 2
+                    count += 1
+            else:
+                prev_stable = state
+                state = zone
+
+        # last zone was a transitional state (in hysteresis band)
+        elif state == ZONE_2_T:
+            if zone_is_stable:
+                if zone != prev_stable: # This wasn't just noise
+                    out_ix[count] = i
+                    out_state[count] = zone // 2
+                    count += 1
+
+            state = zone
+
+        i += 1
+
+    p_i[0] = i
+    p_state[0] = state
+    p_prev_stable[0] = prev_stable
+
+    return count
+
+
+
+cdef class EdgeSequence:
+    '''Utility class to walk through an edge iterator in arbitrary time steps'''
+
+    cdef public object edges
+    cdef public double time_step
+    cdef public bint it_end
+    cdef public double cur_time
+    cdef public object cur_states
+    cdef readonly object next_states
+    cdef double next_time # Cached time from next_states
+
+    def __init__(self, edges, time_step, start_time=None):
+        self.edges = edges
+        self.time_step = time_step
+        self.it_end = False
+
+        try:
+            self.cur_states = next(self.edges)
+            self.next_states = next(self.edges)
+        except StopIteration:
+            self.it_end = True
+            raise StreamError('Not enough edges to initialize edge_sequence() object')
+
+        self.next_time = self.next_states[0]
+        self.cur_time = self.cur_states[0]
+
+        if start_time is not None:
+            init_step = start_time - self.cur_time
+            if init_step > 0.0:
+                self._advance(init_step)
+
+    cdef int _advance(self, double time_step) except -1:
+        self.cur_time += time_step
+        while self.cur_time > self.next_time:
+            self.cur_states = self.next_states
+            try:
+                self.next_states = next(self.edges)
+            except StopIteration:
+                self.it_end = True
+                break
+
+            self.next_time = self.next_states[0]
+
+        return 0
+
+    cdef double _advance_to_edge(self) except? -1.0:
+        cdef double time_step
+
+        if self.it_end:
+            return 0.0
+
+        start_state = self.cur_states[1]
+        while self.cur_states[1] == start_state:
+            self.cur_states = self.next_states
+
+            try:
+                self.next_states = next(self.edges)
+            except StopIteration:
+                # flag end of sequence if the state remains the same (no final edge)
+                if self.cur_states[1] == start_state:
+                    self.it_end = True
+                break
+
+            self.next_time = self.next_states[0]
+
+        time_step = self.cur_states[0] - self.cur_time
+        self.cur_time = self.cur_states[0]
+
+        return time_step
+
+    def advance(self, time_step=None):
+        if time_step is None:
+            self._advance(self.time_step)
+        else:
+            self._advance(time_step)
+
+    def advance_to_edge(self):
+        return self._advance_to_edge()
+
+    def cur_state(self):
+        return self.cur_states[1]
+
+    def at_end(self):
+        return self.it_end
+
+
+cdef class MultiEdgeSequence:
+    '''Utility class to walk through a group of edge iterators in arbitrary time steps'''
+
+    cdef public tuple channel_names
+    cdef public tuple edge_chans
+    cdef public list sequences
+    cdef public dict channel_ids
+
+    def __init__(self, edge_sets, time_step, start_time=None):
+        self.channel_names, self.edge_chans = zip(*edge_sets.items())
+        self.sequences = [EdgeSequence(e, time_step, start_time) for e in self.edge_chans]
+
+        self.channel_ids = {}
+
+        for i, cid in enumerate(self.channel_names):
+            self.channel_ids[cid] = i
+
+    def advance(self, time_step=None):
+        cdef EdgeSequence s
+
+        for s in self.sequences:
+            s._advance(s.time_step if time_step is None else time_step)
+
+    def advance_to_edge(self, channel_name=None):
+        cdef EdgeSequence s, edge_s = None
+        cdef double time_step
+        cdef Py_ssize_t i
+
+        # get the sequence for the channel
+        if channel_name is None:
+            # find the channel with the nearest edge after the current time
+            # that hasn't ended
+            for i in xrange(len(self.sequences)):
+                s = self.sequences[i]
+                if not s.it_end and (edge_s is None or s.next_time < edge_s.next_time):
+                    edge_s = s
+                    channel_name = self.channel_names[i]
+
+            if edge_s is None: # no active sequences left
+                return (0.0, '')
+        else:
+            # check for channel_name in sets
+            if channel_name in self.channel_ids:
+                edge_s = self.sequences[self.channel_ids[channel_name]]
+            else:
+                raise ValueError("Invalid channel name '{0}'".format(channel_name))
+
+        time_step = edge_s._advance_to_edge()
+
+        # advance the other channels to the same time
+        if time_step > 0.0:
+            for s in self.sequences:
+                if s is not edge_s:
+                    s._advance(time_step)
+
+        return (time_step, channel_name)
+
+    def cur_state(self, channel_name=None):
+        if channel_name is None:
+            return [s.cur_state() for s in self.sequences]
+        else:
+            if channel_name in self.channel_ids:
+                return self.sequences[self.channel_ids[channel_name]].cur_state()
+            else:
+                raise ValueError("Invalid channel name '{0}'".format(channel_name))
+
+    def cur_time(self):
+        return self.sequences[0].cur_time
+
+    def at_end(self, channel_name=None):
+        if channel_name is None:
+            return all(s.at_end() for s in self.sequences)
+        else:
+            if channel_name in self.channel_ids:
+                return self.sequences[self.channel_ids[channel_name]].at_end()
+            else:
+                raise ValueError("Invalid channel name '{0}'".format(channel_name))
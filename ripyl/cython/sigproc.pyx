@@ -30,6 +30,9 @@ import numpy as np
 
 from ripyl.streaming import SampleChunk, StreamError
 
+# Interface version checked against ripyl.cython.CYTHON_ABI when this module is loaded
+__ripyl_abi__ = 2
+
 
 def capacify(samples, capacitance, resistance=1.0, iterations=80):
     '''Simulate an RC filter on a waveform::
@@ -75,7 +78,7 @@ def capacify(samples, capacitance, resistance=1.0, iterations=80):
 
     vc_init = False
     for sc in samples:
-        chunk = sc.samples
+        chunk = np.asarray(sc.scaled_samples(), dtype=np.float64)
         if not vc_init: # Set initial conditions for capacitor voltage and charge
             vc = chunk[0] #sc.samples[0]
             q = vc * capacitance
@@ -112,7 +115,8 @@ cdef double _capacify_inner_loop(unsigned int iterations, double capacitance, do
     
 
 
-def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extension=None, chunk_size=10000):
+def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extension=None, chunk_size=10000, \
+    dtype=float):
     '''Convert an edge stream to a sample stream
 
     The output samples are scaled to the range of 0.0 to 1.0 regardless of the number of logic states.
@@ -132,6 +136,9 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
 
     chunk_size (int)
         Number of samples in each SampleChunk
+
+    dtype (numpy dtype)
+        The floating point type for the samples
     
     Yields a stream of SampleChunk objects.
     '''
@@ -171,7 +178,7 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
             
             t += c_sample_period
             if chunk_count == c_chunk_size:
-                yield SampleChunk(chunk, start_time, c_sample_period)
+                yield SampleChunk(chunk.astype(dtype, copy=False), start_time, c_sample_period)
 
                 chunk = np.empty(c_chunk_size, dtype=float)
                 chunk_d = chunk
@@ -193,7 +200,7 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
 
             t += c_sample_period
             if chunk_count == c_chunk_size:
-                yield SampleChunk(chunk, start_time, c_sample_period)
+                yield SampleChunk(chunk.astype(dtype, copy=False), start_time, c_sample_period)
 
                 chunk = np.empty(c_chunk_size, dtype=float)
                 chunk_d = chunk
@@ -201,5 +208,5 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
                 start_time = t
 
     if chunk_count > 0:
-        yield SampleChunk(chunk[:chunk_count], start_time, c_sample_period)
+        yield SampleChunk(chunk[:chunk_count].astype(dtype, copy=False), start_time, c_sample_period)
 
@@ -24,6 +24,9 @@
 cimport cython
 from libc.math cimport sqrt
 
+# Interface version checked against ripyl.cython.CYTHON_ABI when this module is loaded
+__ripyl_abi__ = 2
+
 cdef class OnlineStats:
     '''Generate statistics from a data set.
     Computes mean, variance and standard deviation in a single pass through a data set.
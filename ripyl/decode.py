@@ -24,14 +24,18 @@
 from __future__ import print_function, division
 
 import numpy as np
-import scipy as sp
 import math
 import collections
 import itertools
 
 import ripyl.util.stats as stats
-from ripyl.streaming import ChunkExtractor, StreamError, AutoLevelError
+from ripyl.streaming import ChunkExtractor, LookaheadStream, StreamError, AutoLevelError, SampleChunk, \
+    StreamType, merge_many_streams
+from ripyl.backend import hot_function
 from ripyl.util.equality import relatively_equal
+from ripyl.util.lazy import lazy_import
+
+sp_stats = lazy_import('scipy.stats')
 
 #import matplotlib.pyplot as plt
 
@@ -66,7 +70,7 @@ def gen_histogram(raw_samples, bins, use_kde=False, kde_bw=0.05):
     
         try:
             #print('#### len(raw_samples)', len(raw_samples))
-            kde = sp.stats.gaussian_kde(raw_samples, bw_method=kde_bw)
+            kde = sp_stats.gaussian_kde(raw_samples, bw_method=kde_bw)
         except np.linalg.linalg.LinAlgError:
             # If the sample data set contains constant samples, gaussian_kde()
             # will raise this exception.
@@ -526,13 +530,13 @@ def find_logic_levels(samples, max_samples=20000, buf_size=2000):
 def check_logic_levels(samples, max_samples=20000, buf_size=2000):
     '''Automatically determine the binary logic levels of a digital signal.
 
-    This is a wrapper for find_logic_levels() that handles teeing off
-    a buffered sample stream and raising AutoLevelError when detection
+    This is a wrapper for find_logic_levels() that handles looking ahead
+    into a buffered sample stream and raising AutoLevelError when detection
     fails.
 
     samples (iterable of SampleChunk objects)
         An iterable sample stream. Each element is a SampleChunk containing
-        an array of samples. This iterator is internally tee'd and becomes
+        an array of samples. This iterator is internally buffered and becomes
         invalidated for further use. The return value includes a new sample
         stream to retrieve samples from.
 
@@ -551,11 +555,10 @@ def check_logic_levels(samples, max_samples=20000, buf_size=2000):
     Raises AutoLevelError if less than two peaks are found in the sample histogram.
     '''
 
-    # tee off an iterator to determine logic thresholds
-    samp_it, thresh_it = itertools.tee(samples)
-    
-    logic_levels = find_logic_levels(thresh_it, max_samples, buf_size)
-    del thresh_it
+    # Look ahead into the samples to determine logic thresholds
+    samp_la = LookaheadStream(samples)
+    logic_levels = find_logic_levels(samp_la.lookahead(), max_samples, buf_size)
+    samp_it = samp_la.release()
 
     if logic_levels is None:
         raise AutoLevelError
@@ -563,7 +566,27 @@ def check_logic_levels(samples, max_samples=20000, buf_size=2000):
     return samp_it, logic_levels
 
 
-def find_edges(samples, logic, hysteresis=0.4):
+def _bench_samples(levels, sample_count=20000, chunk_size=5000):
+    '''Generate a noisy stepped waveform for benchmarking edge finding
+
+    Returns a list of SampleChunk objects.
+    '''
+    rs = np.random.RandomState(1234)
+    steps = np.repeat(np.asarray(levels, dtype=float), 40)
+    samples = np.resize(steps, sample_count) + rs.normal(0.0, 0.05, sample_count)
+
+    return [SampleChunk(samples[i:i+chunk_size], i * 1.0e-6, 1.0e-6) \
+        for i in xrange(0, sample_count, chunk_size)]
+
+def _bench_find_edges():
+    chunks = _bench_samples((0.0, 1.0))
+    def workload(impl):
+        for _ in impl(iter(chunks), (0.0, 1.0)):
+            pass
+    return workload
+
+@hot_function('decode.find_edges', bench=_bench_find_edges)
+def find_edges(samples, logic, hysteresis=0.4, skip_idle=True):
     '''Find the edges in a sampled digital waveform
     
     This is a generator function that can be used in a pipeline of waveform
@@ -579,6 +602,11 @@ def find_edges(samples, logic, hysteresis=0.4):
     hysteresis (float)
         A value between 0.0 and 1.0 representing the amount of hysteresis the use for
         detecting valid edge crossings.
+
+    skip_idle (bool)
+        Pass the samples through skip_idle() first so that idle stretches aren't
+        classified one sample at a time. This only adds overhead for dense data
+        with few idle periods.
         
     Yields a series of 2-tuples (time, value) representing the time and
       logic value (0 or 1) for each edge transition. The first tuple
@@ -587,6 +615,9 @@ def find_edges(samples, logic, hysteresis=0.4):
       
     Raises StreamError if the stream is empty
     '''
+    if skip_idle:
+        samples = _skip_idle(samples, logic, hysteresis)
+
     span = logic[1] - logic[0]
     thresh = (logic[1] + logic[0]) / 2.0
     hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
@@ -629,7 +660,7 @@ def find_edges(samples, logic, hysteresis=0.4):
     for sc in samples:
         t = sc.start_time
         sample_period = sc.sample_period
-        chunk = sc.samples
+        chunk = sc.scaled_samples()
 
         if state == ES_START: # set initial edge state
             initial_state = (t, 1 if chunk[0] > thresh else 0)
@@ -665,6 +696,518 @@ def find_edges(samples, logic, hysteresis=0.4):
             t += sample_period
 
 
+def stable_block_states(samples, block_size, hyst_bot, hyst_top):
+    '''Classify blocks of samples by their logic level
+
+    samples (sequence of float)
+        A numpy array of samples. A partial block at the end is classified
+        by the samples it contains.
+
+    block_size (int)
+        The number of samples in each block
+
+    hyst_bot (float)
+        The top of the logic 0 zone
+
+    hyst_top (float)
+        The bottom of the logic 1 zone
+
+    Returns a numpy int8 array with one element for each block. It is 1 when every
+      sample in the block is above hyst_top, 0 when every sample is at or below
+      hyst_bot, and -1 when the block is not at a stable logic level.
+    '''
+    samples = np.asarray(samples)
+    count = len(samples)
+    blocks = (count + block_size - 1) // block_size
+
+    full = (count // block_size) * block_size
+    b_min = np.empty(blocks, dtype=samples.dtype)
+    b_max = np.empty(blocks, dtype=samples.dtype)
+    if full > 0:
+        body = samples[:full].reshape(-1, block_size)
+        b_min[:full // block_size] = body.min(axis=1)
+        b_max[:full // block_size] = body.max(axis=1)
+    if full < count:
+        b_min[-1] = samples[full:].min()
+        b_max[-1] = samples[full:].max()
+
+    return np.where(b_min > hyst_top, 1, np.where(b_max <= hyst_bot, 0, -1)).astype(np.int8)
+
+
+def skip_idle(samples, logic, hysteresis=0.4, block_size=256):
+    '''Remove idle stretches from a sample stream before edge detection
+
+    This is a generator function that can be used in front of find_edges().
+    Each chunk is divided into blocks that are tested with their minimum and
+    maximum values. A run of blocks that stay at the same stable logic level
+    can't contain an edge so it is reduced to its first sample. The remaining
+    samples are yielded as new SampleChunk objects with start times that
+    match their position in the original stream. find_edges() produces the
+    same edges from the reduced stream without classifying every idle sample.
+    All of the find_edges() backends do this unless their skip_idle argument
+    is False.
+
+    The reduced stream has gaps in time and is only suitable for edge finding.
+
+    samples (iterable of SampleChunk objects)
+        An iterable sample stream.
+
+    logic ((float, float))
+        A 2-tuple (low, high) representing the mean logic levels in the sampled waveform
+
+    hysteresis (float)
+        The hysteresis value that will be passed to find_edges().
+
+    block_size (int)
+        The number of samples in each block. Only constant stretches that
+        cover at least one whole block are reduced.
+
+    Yields a series of SampleChunk objects.
+    '''
+    span = logic[1] - logic[0]
+    hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
+    hyst_bot = span * (0.5 - hysteresis / 2.0) + logic[0]
+
+    prev_state = -1
+    for sc in samples:
+        count = len(sc.samples)
+        if count == 0:
+            continue
+
+        chunk = sc.scaled_samples()
+
+        # Fast path for a chunk that continues an idle stretch
+        if (prev_state == 1 and chunk.min() > hyst_top) or (prev_state == 0 and chunk.max() <= hyst_bot):
+            continue
+
+        states = stable_block_states(chunk, block_size, hyst_bot, hyst_top)
+        prev_states = np.concatenate(([prev_state], states[:-1]))
+        prev_state = int(states[-1])
+
+        # Blocks that continue a stable run are dropped. The first block of
+        # a run is kept for the edge into it.
+        keep = (states < 0) | (states != prev_states)
+        kept_ix = np.nonzero(keep)[0]
+        if len(kept_ix) == 0:
+            continue
+
+        starts = kept_ix * block_size
+        ends = np.where(states[kept_ix] < 0, np.minimum(starts + block_size, count), starts + 1)
+
+        # Merge contiguous blocks
+        breaks = np.nonzero(starts[1:] != ends[:-1])[0] + 1
+        run_starts = starts[np.concatenate(([0], breaks))]
+        run_ends = ends[np.concatenate((breaks - 1, [len(ends) - 1]))]
+
+        if len(run_starts) == 1 and run_starts[0] == 0 and run_ends[0] == count:
+            yield sc
+            continue
+
+        for start, end in itertools.izip(run_starts.tolist(), run_ends.tolist()):
+            yield SampleChunk(sc.samples[start:end], sc.start_time + start * sc.sample_period, \
+                sc.sample_period, sc.scale, sc.offset)
+
+_skip_idle = skip_idle # Shadowed by the find_edges() argument
+
+
+def _bench_find_edge_arrays():
+    samples = np.concatenate([sc.samples for sc in _bench_samples((0.0, 1.0), 200000)])
+    def workload(impl):
+        impl(samples, (0.0, 1.0))
+    return workload
+
+@hot_function('decode.find_edge_arrays', bench=_bench_find_edge_arrays, backend='numpy')
+def find_edge_arrays(samples, logic, hysteresis=0.4):
+    '''Find the edges in an array of samples from a digital waveform
+
+    This applies the same hysteresis rules as find_edges() to a single
+    array of samples. The edges are returned as arrays of sample indices
+    and states rather than a stream of tuples. The Cython implementation
+    of this function releases the GIL while it scans the samples so that
+    multiple channels can be processed in parallel on threads.
+
+    samples (sequence of float)
+        A numpy array of samples
+
+    logic ((float, float))
+        A 2-tuple (low, high) representing the mean logic levels in the sampled waveform
+        
+    hysteresis (float)
+        A value between 0.0 and 1.0 representing the amount of hysteresis the use for
+        detecting valid edge crossings.
+
+    Returns a pair of numpy arrays (int64 indices, int8 states). The first
+      element of each is the initial state at index 0. All remaining elements
+      are the index of the first sample after each edge and its new logic state.
+    '''
+    samples = np.asarray(samples)
+
+    span = logic[1] - logic[0]
+    thresh = (logic[1] + logic[0]) / 2.0
+    hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
+    hyst_bot = span * (0.5 - hysteresis / 2.0) + logic[0]
+
+    if len(samples) == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8))
+
+    initial_state = 1 if samples[0] > thresh else 0
+
+    # Zones: 1 = logic 1, 0 = logic 0, -1 = transition band
+    zones = np.where(samples > hyst_top, 1, np.where(samples > hyst_bot, -1, 0)).astype(np.int8)
+
+    # Samples in the transition band never start an edge on their own. An edge
+    # happens wherever the sequence of stable zones changes value.
+    stable_ix = np.nonzero(zones >= 0)[0]
+    stable = zones[stable_ix]
+    changes = np.nonzero(stable[1:] != stable[:-1])[0] + 1
+
+    edge_ix = np.concatenate(([0], stable_ix[changes])).astype(np.int64)
+    edge_states = np.concatenate(([initial_state], stable[changes])).astype(np.int8)
+
+    return (edge_ix, edge_states)
+
+
+def find_edge_arrays_parallel(channels, logic, hysteresis=0.4, threads=None):
+    '''Find the edges in multiple sample arrays on a thread pool
+
+    This is only faster than calling find_edge_arrays() in sequence when the
+    Cython implementation is active.
+
+    channels (sequence of sample arrays)
+        The sample arrays for each channel
+
+    logic ((float, float))
+        A 2-tuple (low, high) representing the mean logic levels in the sampled waveforms
+
+    hysteresis (float)
+        A value between 0.0 and 1.0 representing the amount of hysteresis the use for
+        detecting valid edge crossings.
+
+    threads (int or None)
+        The number of threads to use. None uses one per CPU.
+
+    Returns a list of (indices, states) pairs as produced by find_edge_arrays().
+    '''
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(lambda samples: find_edge_arrays(samples, logic, hysteresis), channels)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def edge_arrays_to_edges(edge_ix, edge_states, start_time, sample_period):
+    '''Convert edge arrays into an edge stream
+
+    This is a generator function.
+
+    edge_ix (sequence of int)
+        Sample indices from find_edge_arrays()
+
+    edge_states (sequence of int)
+        Edge states from find_edge_arrays()
+
+    start_time (float)
+        The time of the sample at index 0
+
+    sample_period (float)
+        The time between samples
+
+    Yields a series of 2-tuples (time, value) representing the time and
+      logic value for each edge transition. The first tuple yielded is the
+      initial state.
+    '''
+    times = np.asarray(edge_ix) * sample_period + start_time
+    for e in itertools.izip(times.tolist(), np.asarray(edge_states).tolist()):
+        yield e
+
+
+def find_live_edges(samples, logic, hysteresis=0.4):
+    '''Find the edges in a live sampled waveform
+
+    This is a generator function. It finds the same edges as find_edges()
+    but also yields a settle marker at the end of each SampleChunk. A marker
+    is an edge tuple that repeats the current logic state at the time of the
+    last sample in the chunk. It tells a decoder that the state is known up to
+    that time even though no new edge has arrived. Decoders that use EdgeSequence
+    skip over the markers but use their time to finish a frame as soon as its
+    last bit has been received instead of waiting for the next edge.
+
+    A SampleChunk with no samples is treated as a flush. It means the signal
+    stayed at its current level up to the chunk's start_time.
+
+    samples (iterable of SampleChunk objects)
+        An iterable sample stream. Each element is a SampleChunk containing
+        an array of samples.
+
+    logic ((float, float))
+        A 2-tuple (low, high) representing the mean logic levels in the sampled waveform
+        
+    hysteresis (float)
+        A value between 0.0 and 1.0 representing the amount of hysteresis the use for
+        detecting valid edge crossings.
+
+    Yields a series of 2-tuples (time, value). The first tuple is the initial state
+      of the waveform. The rest are edges and settle markers.
+    '''
+    span = logic[1] - logic[0]
+    thresh = (logic[1] + logic[0]) / 2.0
+    hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
+    hyst_bot = span * (0.5 - hysteresis / 2.0) + logic[0]
+
+    stable = None # Last stable logic level seen by the hysteresis
+    cur_state = None # Last state yielded
+    settled_time = None
+
+    for sc in samples:
+        chunk = sc.scaled_samples()
+
+        if len(chunk) == 0: # Flush
+            if cur_state is not None and sc.start_time > settled_time:
+                settled_time = sc.start_time
+                yield (settled_time, cur_state)
+            continue
+
+        if cur_state is None:
+            cur_state = 1 if chunk[0] > thresh else 0
+            yield (sc.start_time, cur_state)
+
+        if stable is None:
+            edge_ix, edge_states = find_edge_arrays(chunk, logic, hysteresis)
+            edge_ix = edge_ix[1:]
+            edge_states = edge_states[1:]
+
+            if len(edge_states) == 0:
+                # No edges yet. Find the first stable level (if any) to continue from.
+                stable_ix = np.nonzero((chunk > hyst_top) | (chunk <= hyst_bot))[0]
+                if len(stable_ix) > 0:
+                    stable = 1 if chunk[stable_ix[0]] > thresh else 0
+        else:
+            # Prefix the chunk with a sample at the last stable level so that the
+            # hysteresis continues across the chunk boundary
+            prefixed = np.concatenate((np.array([logic[stable]], dtype=chunk.dtype), chunk))
+            edge_ix, edge_states = find_edge_arrays(prefixed, logic, hysteresis)
+            edge_ix = edge_ix[1:] - 1
+            edge_states = edge_states[1:]
+
+        if len(edge_states) > 0:
+            stable = cur_state = int(edge_states[-1])
+            for e in edge_arrays_to_edges(edge_ix, edge_states, sc.start_time, sc.sample_period):
+                yield e
+
+        last_ix = len(chunk) - 1
+        settled_time = sc.start_time + last_ix * sc.sample_period
+        if len(edge_ix) == 0 or edge_ix[-1] != last_ix:
+            yield (settled_time, cur_state)
+
+
+def remove_repeated_states(edges):
+    '''Filter out edges that don't change the logic state
+
+    This is a generator function. It removes the settle markers produced
+    by find_live_edges() so that only real transitions remain.
+
+    edges (iterable of (float, int) tuples)
+        An iterable of 2-tuples representing each edge transition.
+
+    Yields a series of 2-tuples (time, value) for each edge that changes state.
+      The first edge is always yielded.
+    '''
+    prev_state = None
+    for e in edges:
+        if e[1] != prev_state:
+            prev_state = e[1]
+            yield e
+
+
+def shared_edge_decode(stream_data, decoders, logic_levels=None, hysteresis=0.4, \
+    stream_type=StreamType.Samples, errors=None):
+    '''Run several decoders on one channel with a single edge extraction
+
+    This is a generator function. The logic levels are detected and the edges
+    are found once. The edge stream is then shared between the decoders with
+    itertools.tee() so that each of them runs on the same edges without repeating
+    this work. An edge is released once the slowest decoder has consumed it.
+
+    The decoded records are merged in chronological order with merge_many_streams().
+    This keeps the decoders progressing together so that the shared buffer only
+    holds the edges between the slowest and fastest decoder. A decoder that reads
+    far ahead before yielding a record (such as one grouping bytes into messages)
+    increases the amount buffered.
+
+      >>> records = shared_edge_decode(samples, [(uart.uart_decode, {'bits': 8}), \
+      ...     (lin.lin_decode, {}), (kline.iso_k_line_decode, {})])
+
+    stream_data (iterable of SampleChunk objects or (float, int) pairs)
+        A sample stream or edge stream.
+
+    decoders (sequence of (function, dict))
+        The decoders to run as pairs of a decoder function and a dict of keyword
+        arguments. Each function must accept an edge stream as its first argument
+        and a stream_type keyword argument.
+
+    logic_levels ((float, float) or None)
+        Optional pair that indicates (low, high) logic levels of the sample
+        stream. When present, auto level detection is disabled. This has no effect on
+        edge streams.
+
+    hysteresis (float)
+        A value between 0.0 and 1.0 representing the amount of hysteresis the use for
+        detecting valid edge crossings.
+
+    stream_type (streaming.StreamType)
+        A StreamType value indicating that the stream parameter represents either Samples
+        or Edges.
+
+    errors (dict or None)
+        When a dict is provided, a StreamError raised by a decoder is stored in
+        it keyed by the decoder's index and only that decoder is stopped. When None
+        the error is raised.
+
+    Yields a series of StreamRecord objects. The stream_id of each record is the index
+      of the decoder that produced it.
+
+    Raises AutoLevelError if stream_type = Samples and the logic levels cannot
+      be determined.
+    '''
+    if stream_type == StreamType.Samples:
+        if logic_levels is None:
+            samp_it, logic_levels = check_logic_levels(stream_data)
+        else:
+            samp_it = stream_data
+
+        edges = find_edges(samp_it, logic_levels, hysteresis)
+    else: # the stream is already a list of edges
+        edges = stream_data
+
+    edge_streams = list(itertools.tee(edges, len(decoders)))
+
+    def run_decoder(i, decoder, kwargs):
+        kwargs = dict(kwargs)
+        kwargs['stream_type'] = StreamType.Edges
+        try:
+            for r in decoder(edge_streams[i], **kwargs):
+                yield r
+        except StreamError as e:
+            if errors is None:
+                raise
+            errors[i] = e
+        finally:
+            # Drop the finished decoder's edges so they aren't held for it
+            edge_streams[i] = None
+
+    record_streams = [run_decoder(i, d, kw) for i, (d, kw) in enumerate(decoders)]
+
+    for r in merge_many_streams(record_streams):
+        yield r
+
+
+def _packed_chunk_edges(words, prev_word, masks):
+    '''Find the edge indices in a chunk of packed samples
+
+    words (numpy array of int)
+        The packed samples for a chunk
+
+    prev_word (int)
+        The last packed sample from the previous chunk
+
+    masks (sequence of (int, int))
+        A (bit, mask) pair for each channel to extract edges from
+
+    Returns a list of (indices, states) array pairs for each channel.
+    '''
+    # Bits set in the XOR of adjacent words mark a state change in that channel
+    changes = np.empty_like(words)
+    changes[0] = words[0] ^ prev_word
+    np.bitwise_xor(words[1:], words[:-1], changes[1:])
+
+    ch_edges = []
+    for bit, mask in masks:
+        ix = np.nonzero(changes & mask)[0]
+        ch_edges.append((ix, (words[ix] >> bit) & 1))
+
+    return ch_edges
+
+
+def find_packed_edges(samples, bit):
+    '''Find the edges of one channel in a packed digital sample stream
+
+    This is a generator function that can be used in a pipeline of waveform
+    procesing operations.
+
+    Unlike find_edges() no logic level detection is needed. Edges are found
+    directly from changes in the selected bit of adjacent samples.
+
+    samples (iterable of PackedSampleChunk objects)
+        An iterable packed sample stream.
+
+    bit (int)
+        The bit position of the channel in the packed samples
+
+    Yields a series of 2-tuples (time, value) representing the time and
+      logic value (0 or 1) for each edge transition. The first tuple
+      yielded is the initial state of the sampled waveform. All remaining
+      tuples are detected edges.
+    '''
+    return packed_edge_streams(samples, (bit,))[bit]
+
+
+def packed_edge_streams(samples, bits):
+    '''Find the edges of several channels in a packed digital sample stream
+
+    The sample stream is only traversed once. Edges are buffered for each channel
+    until they are consumed. Memory use is bounded when the streams are consumed
+    at a similar pace, as with MultiEdgeSequence or any of the multi-channel decoders.
+
+    samples (iterable of PackedSampleChunk objects)
+        An iterable packed sample stream.
+
+    bits (sequence of int)
+        The bit positions of the channels to extract
+
+    Returns a dict of edge streams keyed by bit position.
+    '''
+    samples = iter(samples)
+    masks = [(b, 1 << b) for b in bits]
+    queues = dict((b, collections.deque()) for b in bits)
+    prev = [None] # Last word of the previous chunk
+
+    def demux_chunk():
+        '''Distribute the edges from the next chunk to the channel queues'''
+        for sc in samples:
+            words = sc.samples
+            if len(words) == 0:
+                continue
+
+            if prev[0] is None: # Initial states
+                for b, mask in masks:
+                    queues[b].append((sc.start_time, int(words[0] >> b) & 1))
+                prev[0] = words[0]
+
+            ch_edges = _packed_chunk_edges(words, prev[0], masks)
+            prev[0] = words[-1]
+
+            for (b, _), (ix, states) in zip(masks, ch_edges):
+                times = ix * sc.sample_period + sc.start_time
+                queues[b].extend(itertools.izip(times.tolist(), states.tolist()))
+
+            return True
+
+        return False
+
+    def channel_edges(queue):
+        while True:
+            while queue:
+                yield queue.popleft()
+
+            if not demux_chunk():
+                break
+
+    return dict((b, channel_edges(queues[b])) for b in bits)
+
+
 def expand_logic_levels(logic_levels, count):
     '''Generate evenly spaced logic levels
 
@@ -727,6 +1270,15 @@ def gen_hyst_thresholds(logic_levels, expand=None, hysteresis=0.1):
     return hyst
 
 
+def _bench_find_multi_edges():
+    chunks = _bench_samples((0.0, 0.5, 1.0, 0.5))
+    hyst_thresholds = gen_hyst_thresholds((0.0, 0.5, 1.0), hysteresis=0.4)
+    def workload(impl):
+        for _ in impl(iter(chunks), hyst_thresholds):
+            pass
+    return workload
+
+@hot_function('decode.find_multi_edges', bench=_bench_find_multi_edges)
 def find_multi_edges(samples, hyst_thresholds):
     '''Find the multi-level edges in a sampled digital waveform
     
@@ -808,20 +1360,20 @@ def find_multi_edges(samples, hyst_thresholds):
     for sc in samples:
         t = sc.start_time
         #sample_period = sc.sample_period
-        #chunk = sc.samples
+        chunk = sc.scaled_samples()
 
         if state == ES_START: # Set initial edge state
             #initial_state = (t, 1 if chunk[0] > thresh_high else 0 if chunk[0] > thresh_low else -1)
             center_ix = len(center_thresholds)
             for i in xrange(center_ix):
-                if sc.samples[0] <= center_thresholds[i]:
+                if chunk[0] <= center_thresholds[i]:
                     center_ix = i
                     break
 
             initial_state = (t, center_ix - zone_offset)
             yield initial_state
 
-        for sample in sc.samples:
+        for sample in chunk:
             #zone = get_sample_zone(sample)
             #zone_is_stable = is_stable_zone(zone)
             zone = len(hyst_thresholds)
@@ -979,7 +1531,7 @@ def find_symbol_rate(edges, sample_rate=1.0, spectra=2, auto_span_limit=True, ma
         if len(spans) == 0:
             raise ValueError('Insufficient spans in edge set')
         
-        kde = sp.stats.gaussian_kde(spans, bw_method=0.8)
+        kde = sp_stats.gaussian_kde(spans, bw_method=0.8)
         asl = kde(x_hps)[:bins]
         
         # Get the width of the first peak
@@ -1000,7 +1552,7 @@ def find_symbol_rate(edges, sample_rate=1.0, spectra=2, auto_span_limit=True, ma
     x_hps = np.arange(0, mv, step)[:bins]
         
     # generate kernel density estimate of span histogram
-    kde = sp.stats.gaussian_kde(spans, bw_method=0.02)
+    kde = sp_stats.gaussian_kde(spans, bw_method=0.02)
     
     # Compute the harmonic product spectrum from the KDE
     # This should leave us with one strong peak for the span corresponding to the
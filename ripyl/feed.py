@@ -0,0 +1,806 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Push based decoding of live data sources
+
+The decoders in Ripyl are generators that pull their input from an iterable
+stream. Live captures arrive the other way around: a socket or acquisition
+callback pushes data as it becomes available. This module bridges the two
+so that an event loop can drive any number of decoders without blocking.
+
+A :class:`SampleFeed` is a bounded, thread safe stream that data is pushed
+into. A :class:`FeedDecoder` runs a decoder generator over a feed in a worker
+thread and collects its records. The event loop pushes data with
+:meth:`FeedDecoder.try_feed`, which returns False instead of blocking when the
+decoder has fallen behind, and collects records with :meth:`FeedDecoder.poll`
+or through an on_record callback.
+
+  >>> dec = FeedDecoder(uart.uart_decode, sample_period=1.0e-6, bits=8, baud_rate=9600)
+  >>> dec.try_feed_samples(raw_samples)
+  >>> for rec in dec.poll():
+  ...     print(rec.data)
+  >>> dec.close()
+
+On Python 3, an :class:`AsyncFeedDecoder` gives a FeedDecoder an asyncio
+interface. Feeding data and collecting records return awaitables so that
+one event loop can serve many channels without blocking. The decoding is not
+done on the event loop. Each channel's decoder still runs in its own worker
+thread. The decoders are plain generators that pull their input, and one
+that runs out of input can only wait for more by blocking the thread it
+runs on.
+
+  >>> dec = AsyncFeedDecoder(uart.uart_decode, sample_period=1.0e-6, bits=8, baud_rate=9600)
+  >>> dec.pump(capture_blocks) # An asynchronous iterator of sample arrays
+  >>> async for rec in dec:
+  ...     print(rec.data)
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import threading
+import collections
+import time
+import Queue
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+import numpy as np
+
+from ripyl.streaming import SampleChunk, StreamError, StreamType
+from ripyl.util.stats import OnlineStats
+
+Full = Queue.Full
+Empty = Queue.Empty
+
+_END = object() # Sentinel marking the end of the record queue
+
+
+class SampleFeed(object):
+    '''Bounded stream that data is pushed into
+
+    Iterating over a feed yields the items put into it until it is closed.
+    Iteration blocks while the feed is empty. Putting items blocks, or fails
+    with Full, while the feed holds maxsize items.
+    '''
+    def __init__(self, maxsize=16, sample_period=None, start_time=0.0):
+        '''
+        maxsize (int)
+            The maximum number of items held in the feed.
+
+        sample_period (float or None)
+            The sample period for arrays passed to :meth:`put_samples`.
+
+        start_time (float)
+            The time of the first sample passed to :meth:`put_samples`.
+        '''
+        self.maxsize = maxsize
+        self._buf = collections.deque()
+        self._cond = threading.Condition()
+        self.sample_period = sample_period
+        self.next_time = start_time
+        self.closed = False
+        self.arrivals = None # Deque of wall clock arrival times for each item when tracking latency
+        self.on_get = None # Called from the consuming thread after an item is removed
+
+    def put(self, item, block=True, timeout=None):
+        '''Add an item to the feed
+
+        item (any)
+            A SampleChunk, edge, or other stream item.
+
+        block (bool)
+            Wait for space in the feed if it is full.
+
+        timeout (float or None)
+            Maximum time to wait for space when block is True.
+
+        Raises Full if the feed is full and the item could not be added.
+        Raises StreamError if the feed is closed.
+        '''
+        with self._cond:
+            if self.closed:
+                raise StreamError('Feed is closed')
+
+            if len(self._buf) >= self.maxsize:
+                if not block:
+                    raise Full
+                deadline = None if timeout is None else time.time() + timeout
+                while len(self._buf) >= self.maxsize and not self.closed:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0.0:
+                        raise Full
+                    self._cond.wait(remaining)
+
+                if self.closed:
+                    raise StreamError('Feed is closed')
+
+            # The arrival must be recorded before the item can be consumed
+            if self.arrivals is not None:
+                self.arrivals.append(time.time())
+
+            self._buf.append(item)
+            self._cond.notify_all()
+
+    def try_put(self, item):
+        '''Add an item to the feed without blocking
+
+        Returns True if the item was added or False if the feed is full.
+        '''
+        try:
+            self.put(item, block=False)
+        except Full:
+            return False
+        return True
+
+    def _make_chunk(self, samples):
+        if self.sample_period is None:
+            raise StreamError('Feed has no sample_period for raw samples')
+        samples = np.asarray(samples)
+        return SampleChunk(samples, self.next_time, self.sample_period)
+
+    def put_samples(self, samples, block=True, timeout=None):
+        '''Add an array of samples to the feed as a SampleChunk
+
+        The start time of each chunk follows on from the previous one.
+
+        samples (sequence of numbers)
+            The samples to add.
+
+        block (bool)
+            Wait for space in the feed if it is full.
+
+        timeout (float or None)
+            Maximum time to wait for space when block is True.
+
+        Raises Full if the feed is full and the samples could not be added.
+        Raises StreamError if the feed is closed or has no sample_period.
+        '''
+        sc = self._make_chunk(samples)
+        self.put(sc, block, timeout)
+        self.next_time += len(sc.samples) * self.sample_period
+
+    def try_put_samples(self, samples):
+        '''Add an array of samples to the feed without blocking
+
+        Returns True if the samples were added or False if the feed is full.
+        '''
+        try:
+            self.put_samples(samples, block=False)
+        except Full:
+            return False
+        return True
+
+    def flush(self, flush_time=None, block=True, timeout=None):
+        '''Declare that the signal has been idle up to a time
+
+        An empty SampleChunk is added to the feed. Edge finders that support
+        flushing, such as find_live_edges(), treat it as a period with no
+        change in level. Samples added later continue from flush_time.
+
+        flush_time (float or None)
+            The time the signal is known to be idle until. The time after the
+            last sample added is used when this is None.
+
+        block (bool)
+            Wait for space in the feed if it is full.
+
+        timeout (float or None)
+            Maximum time to wait for space when block is True.
+
+        Raises Full if the feed is full and the flush could not be added.
+        Raises StreamError if the feed is closed.
+        '''
+        if flush_time is None:
+            flush_time = self.next_time
+
+        self.put(SampleChunk(np.empty(0), flush_time, self.sample_period), block, timeout)
+        self.next_time = max(self.next_time, flush_time)
+
+    def close(self):
+        '''End the feed
+
+        Iteration stops once all items put before the feed was closed are consumed.
+        This never blocks.
+        '''
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def full(self):
+        '''Returns True if the feed can't accept more items'''
+        return len(self._buf) >= self.maxsize
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __iter__(self):
+        cond = self._cond
+        buf = self._buf
+        while True:
+            with cond:
+                while not buf and not self.closed:
+                    cond.wait()
+
+                if not buf: # Closed and empty
+                    break
+
+                item = buf.popleft()
+                cond.notify_all()
+
+            if self.on_get is not None:
+                self.on_get()
+
+            yield item
+
+
+class FeedDecoder(object):
+    '''Run a decoder on a SampleFeed in a worker thread
+
+    Records produced by the decoder are held in a bounded queue until they are
+    collected with :meth:`poll`, :meth:`get`, or by iterating over the FeedDecoder.
+    If an on_record callback is given, it is called from the worker thread with
+    each record instead. When the records are not collected the decoder stops
+    and the feed fills up, so a producer using :meth:`try_feed` sees the backpressure.
+
+    An exception raised by the decoder is raised again when the records are
+    collected or more data is fed.
+
+    In live mode the edges are found with find_live_edges() and passed to
+    the decoder as an edge stream. A frame is then reported as soon as the
+    samples holding its last bit have been fed rather than when the next
+    edge arrives. :meth:`flush` and the idle_timeout let a decoder finish a
+    frame when a source stops sending data on a quiet bus. The time from
+    feeding the samples that complete each frame to its record being produced
+    is accumulated in the latency statistics.
+    '''
+    def __init__(self, decoder, source=None, sample_period=None, maxsize=16, max_records=1000, \
+        on_record=None, on_finish=None, live=False, logic_levels=None, hysteresis=0.4, idle_timeout=None, \
+        **kwargs):
+        '''
+        decoder (function)
+            A generator function such as uart.uart_decode(). It is called with
+            the feed as its first argument.
+
+        source (SampleFeed or None)
+            The feed to decode. A new SampleFeed is created when this is None.
+
+        sample_period (float or None)
+            The sample period for a new SampleFeed.
+
+        maxsize (int)
+            The maximum number of items held in a new SampleFeed.
+
+        max_records (int)
+            The maximum number of records waiting to be collected.
+
+        on_record (function or None)
+            Called from the worker thread with each record as it is decoded.
+
+        on_finish (function or None)
+            Called from the worker thread when the decoder has ended.
+
+        live (bool)
+            Decode in live mode. The decoder must accept a stream_type argument
+            and a single edge stream.
+
+        logic_levels ((float, float) or None)
+            The logic levels for finding edges in live mode. They are detected
+            automatically from the start of the feed when None.
+
+        hysteresis (float)
+            The hysteresis for finding edges in live mode.
+
+        idle_timeout (float or None)
+            In live mode, flush the feed from :meth:`poll` when no data has been
+            fed for this many seconds. The signal is assumed to be idle for the
+            time since the last feed.
+
+        kwargs (dict)
+            Additional arguments passed to the decoder.
+        '''
+        if source is None:
+            source = SampleFeed(maxsize, sample_period)
+        self.source = source
+        self.on_record = on_record
+        self.on_finish = on_finish
+        self.error = None
+
+        self.live = live
+        self.logic_levels = logic_levels
+        self.hysteresis = hysteresis
+        self.idle_timeout = idle_timeout
+        self.latency = OnlineStats()
+        self.max_latency = 0.0
+        self._last_feed = time.time()
+        self._arrival = None
+        if live:
+            source.arrivals = collections.deque()
+
+        self._records = Queue.Queue(max_records)
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, args=(decoder, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _live_edges(self):
+        from ripyl.decode import find_live_edges, check_logic_levels
+
+        samples = iter(self.source)
+        if self.logic_levels is None:
+            samples, self.logic_levels = check_logic_levels(samples)
+
+        return find_live_edges(self._track_arrivals(samples), self.logic_levels, self.hysteresis)
+
+    def _track_arrivals(self, samples):
+        # The feed records an arrival time for each chunk in the same order
+        arrivals = self.source.arrivals
+        for sc in samples:
+            if arrivals:
+                self._arrival = arrivals.popleft()
+            yield sc
+
+    def _measure_latency(self, rec):
+        # A record is produced while the edges from the chunk that completed
+        # it are being consumed
+        if self._arrival is None:
+            return
+
+        latency = time.time() - self._arrival
+        self.latency.accumulate(latency)
+        self.max_latency = max(self.max_latency, latency)
+
+    def _run(self, decoder, kwargs):
+        try:
+            if self.live:
+                stream_in = self._live_edges()
+                kwargs['stream_type'] = StreamType.Edges
+            else:
+                stream_in = iter(self.source)
+                if self.logic_levels is not None:
+                    kwargs['logic_levels'] = self.logic_levels
+
+            for rec in decoder(stream_in, **kwargs):
+                if self.live:
+                    self._measure_latency(rec)
+
+                if self.on_record is not None:
+                    self.on_record(rec)
+                else:
+                    self._records.put(rec)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._records.put(_END)
+            if self.on_finish is not None:
+                self.on_finish()
+
+        # Keep draining so that producers never block on a stopped decoder
+        for _ in self.source:
+            pass
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def feed(self, item, block=True, timeout=None):
+        '''Add an item to the source feed
+
+        Raises Full if the feed is full and the item could not be added.
+        Raises the decoder's exception if it has failed.
+        '''
+        self._raise_error()
+        self.source.put(item, block, timeout)
+
+    def try_feed(self, item):
+        '''Add an item to the source feed without blocking
+
+        Returns True if the item was added or False if the feed is full.
+
+        Raises the decoder's exception if it has failed.
+        '''
+        self._raise_error()
+        return self.source.try_put(item)
+
+    def feed_samples(self, samples, block=True, timeout=None):
+        '''Add an array of samples to the source feed
+
+        Raises Full if the feed is full and the samples could not be added.
+        Raises the decoder's exception if it has failed.
+        '''
+        self._raise_error()
+        self.source.put_samples(samples, block, timeout)
+        self._last_feed = time.time()
+
+    def try_feed_samples(self, samples):
+        '''Add an array of samples to the source feed without blocking
+
+        Returns True if the samples were added or False if the feed is full.
+
+        Raises the decoder's exception if it has failed.
+        '''
+        self._raise_error()
+        if self.source.try_put_samples(samples):
+            self._last_feed = time.time()
+            return True
+        return False
+
+    def flush(self, flush_time=None):
+        '''Declare that the signal has been idle up to a time without blocking
+
+        flush_time (float or None)
+            The time the signal is known to be idle until. When this is None the
+            signal is assumed to have been idle for as long as it has been since
+            data was last fed.
+
+        Returns True if the flush was added or False if the feed is full. A full
+          feed means the decoder has data to work on so the flush isn't needed.
+
+        Raises the decoder's exception if it has failed.
+        '''
+        self._raise_error()
+        now = time.time()
+        if flush_time is None:
+            flush_time = self.source.next_time + (now - self._last_feed)
+
+        try:
+            self.source.flush(flush_time, block=False)
+        except Full:
+            return False
+        self._last_feed = now
+        return True
+
+    @property
+    def ready(self):
+        '''True when the source feed has room for more data'''
+        return not self.source.full()
+
+    def close(self):
+        '''Close the source feed so that the decoder can finish'''
+        self.source.close()
+
+    def get(self, block=True, timeout=None):
+        '''Get the next decoded record
+
+        block (bool)
+            Wait for a record if none are available.
+
+        timeout (float or None)
+            Maximum time to wait when block is True.
+
+        Returns a StreamRecord or None if the decoder has finished.
+
+        Raises Empty if no record is available.
+        Raises the decoder's exception if it has failed.
+        '''
+        if self._finished:
+            self._raise_error()
+            return None
+
+        rec = self._records.get(block, timeout)
+        if rec is _END:
+            self._finished = True
+            self._raise_error()
+            return None
+
+        return rec
+
+    def poll(self):
+        '''Collect the records decoded so far without blocking
+
+        In live mode with an idle_timeout the feed is flushed first if no data
+        has been fed for longer than the timeout.
+
+        Returns a list of StreamRecord objects.
+
+        Raises the decoder's exception if it has failed.
+        '''
+        if self.live and self.idle_timeout is not None and not self.source.closed:
+            if time.time() - self._last_feed > self.idle_timeout:
+                self.flush()
+
+        recs = []
+        while True:
+            try:
+                rec = self.get(block=False)
+            except Empty:
+                break
+
+            if rec is None:
+                break
+            recs.append(rec)
+
+        return recs
+
+    @property
+    def finished(self):
+        '''True when the decoder has ended and all records have been collected'''
+        return self._finished
+
+    def join(self, timeout=None):
+        '''Wait for the decoder thread to end
+
+        The records must be collected or the decoder may not be able to finish.
+        '''
+        self._thread.join(timeout)
+
+    def __iter__(self):
+        while True:
+            rec = self.get()
+            if rec is None:
+                break
+            yield rec
+
+
+class _RecordHandoff(object):
+    '''Bounded queue passing records from a decoder thread to an event loop
+
+    The producer blocks while the queue is full. The consumer never blocks.
+    The wake function is called from the producer's thread only when the
+    consumer has found the queue empty and is waiting for a record.
+    '''
+    def __init__(self, maxsize, wake):
+        '''
+        maxsize (int)
+            The maximum number of records held in the queue.
+
+        wake (function)
+            Called with no arguments to notify a waiting consumer.
+        '''
+        self.maxsize = maxsize
+        self._wake = wake
+        self._records = collections.deque()
+        self._cond = threading.Condition()
+        self._done = False
+        self.waiting = False
+
+    def put(self, rec):
+        '''Add a record, waiting for space if the queue is full'''
+        with self._cond:
+            while len(self._records) >= self.maxsize:
+                self._cond.wait()
+            self._records.append(rec)
+            wake = self.waiting
+
+        if wake:
+            self._wake()
+
+    def finish(self):
+        '''Mark the end of the records'''
+        with self._cond:
+            self._done = True
+            wake = self.waiting
+
+        if wake:
+            self._wake()
+
+    def take(self):
+        '''Remove the next record without blocking
+
+        Returns the next record, _END when all records have been taken, or None
+          if no record is available. The consumer is marked as waiting when None
+          is returned.
+        '''
+        with self._cond:
+            if self._records:
+                self.waiting = False
+                rec = self._records.popleft()
+                self._cond.notify_all()
+                return rec
+
+            if self._done:
+                self.waiting = False
+                return _END
+
+            self.waiting = True
+            return None
+
+    def __len__(self):
+        return len(self._records)
+
+
+class AsyncFeedDecoder(object):
+    '''asyncio interface to a FeedDecoder
+
+    This is only available on Python 3. Feeding data waits for space in the
+    source feed without blocking the event loop and the records are collected
+    by iterating asynchronously over the AsyncFeedDecoder. Any number of them
+    can be served from the same event loop. The decoding itself is not
+    cooperative. It still takes place in a worker thread for each channel.
+
+    An exception raised by the decoder is raised again when the records are
+    collected or more data is fed.
+    '''
+    def __init__(self, decoder, source=None, loop=None, max_records=1000, **kwargs):
+        '''
+        decoder (function)
+            A generator function such as uart.uart_decode().
+
+        source (SampleFeed or None)
+            The feed to decode. A new SampleFeed is created when this is None.
+
+        loop (asyncio event loop or None)
+            The event loop that feeds and collects records. The current event
+            loop is used when this is None.
+
+        max_records (int)
+            The maximum number of records waiting to be collected.
+
+        kwargs (dict)
+            Additional arguments passed to :class:`FeedDecoder`.
+
+        Raises StreamError if asyncio is not available.
+        '''
+        if asyncio is None:
+            raise StreamError('AsyncFeedDecoder requires asyncio')
+
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.max_records = max_records
+
+        self._records = _RecordHandoff(max_records, self._wake)
+        self._rec_waiter = None # Future waiting for the next record
+        self._space_waiters = collections.deque() # Pending feeds waiting for room in the source
+
+        self.decoder = FeedDecoder(decoder, source, on_record=self._records.put, \
+            on_finish=self._records.finish, **kwargs)
+        self.decoder.source.on_get = self._on_get
+
+    @property
+    def source(self):
+        '''The SampleFeed being decoded'''
+        return self.decoder.source
+
+    # Callbacks from the worker thread. The loop is only woken when something
+    # on the loop side is waiting.
+
+    def _wake(self):
+        self.loop.call_soon_threadsafe(self._deliver)
+
+    def _on_get(self):
+        if self._space_waiters:
+            self.loop.call_soon_threadsafe(self._retry_feeds)
+
+    # Loop side
+
+    def _deliver(self):
+        fut = self._rec_waiter
+        if fut is None or fut.done(): # Nothing is waiting or it was cancelled
+            return
+
+        rec = self._records.take()
+        if rec is None:
+            return
+
+        self._rec_waiter = None
+        if rec is _END:
+            error = self.decoder.error
+            fut.set_exception(error if error is not None else StopAsyncIteration())
+        else:
+            fut.set_result(rec)
+
+    def _retry_feeds(self):
+        while self._space_waiters and self._space_waiters[0]():
+            self._space_waiters.popleft()
+
+    def _put(self, put_func, *args):
+        fut = self.loop.create_future()
+
+        def attempt():
+            if fut.done(): # Cancelled
+                return True
+            try:
+                if put_func(*args):
+                    fut.set_result(None)
+                    return True
+            except Exception as e:
+                fut.set_exception(e)
+                return True
+            return False
+
+        # Feeds are added in order. Retry after queuing in case the feed was
+        # drained before the worker could see the waiter.
+        self._space_waiters.append(attempt)
+        self._retry_feeds()
+        return fut
+
+    def feed(self, item):
+        '''Add an item to the source feed
+
+        Returns an awaitable that completes when the item has been added.
+        It raises StreamError if the feed is closed or the decoder's exception
+        if it has failed.
+        '''
+        return self._put(self.decoder.try_feed, item)
+
+    def feed_samples(self, samples):
+        '''Add an array of samples to the source feed
+
+        Returns an awaitable that completes when the samples have been added.
+        It raises StreamError if the feed is closed or the decoder's exception
+        if it has failed.
+        '''
+        return self._put(self.decoder.try_feed_samples, samples)
+
+    def pump(self, source, samples=True):
+        '''Feed the data from an asynchronous iterator
+
+        The source feed is closed when the iterator is exhausted.
+
+        source (asynchronous iterable)
+            The data to feed.
+
+        samples (bool)
+            When True, the items from source are arrays of samples passed to
+            :meth:`feed_samples`. Otherwise they are passed to :meth:`feed`.
+
+        Returns a future that completes when all of the data has been fed.
+        '''
+        it = source.__aiter__()
+        put = self.feed_samples if samples else self.feed
+        done = self.loop.create_future()
+
+        def next_item():
+            asyncio.ensure_future(it.__anext__(), loop=self.loop).add_done_callback(got_item)
+
+        def got_item(item_fut):
+            if done.done():
+                return
+            try:
+                item = item_fut.result()
+            except StopAsyncIteration:
+                self.close()
+                done.set_result(None)
+                return
+            except Exception as e:
+                done.set_exception(e)
+                return
+
+            put(item).add_done_callback(fed)
+
+        def fed(put_fut):
+            if done.done():
+                return
+            if put_fut.exception() is not None:
+                done.set_exception(put_fut.exception())
+            else:
+                next_item()
+
+        next_item()
+        return done
+
+    def close(self):
+        '''Close the source feed so that the decoder can finish
+
+        Pending feeds fail with StreamError.
+        '''
+        self.decoder.close()
+        self._retry_feeds()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        '''Returns an awaitable for the next decoded record'''
+        fut = self.loop.create_future()
+        self._rec_waiter = fut
+        self._deliver()
+        return fut
@@ -25,6 +25,8 @@ from __future__ import print_function, division
 
 import datetime
 import math
+import re
+import collections
 import ripyl
 import ripyl.util.eng as eng
 import ripyl.decode as decode
@@ -151,12 +153,24 @@ class VCDInfo(object):
 
         return '{} {}s'.format(i_mag, _vcd_si_prefixes[e_exp])
 
-    def write(self, fname, init_with_dumpvars=False):
+    def write(self, fname, init_with_dumpvars=False, buf_lines=8192):
         '''Write a VCD file
 
+        The edges of all channels are merged in time order with a heap. Edges that
+        fall within the same timescale unit are combined and only the channels whose
+        state changed are written.
+
         fname (string)
             The name of the file to write to
+
+        init_with_dumpvars (bool)
+            Place the initial channel states in a $dumpvars section
+
+        buf_lines (int)
+            The number of output lines to accumulate before each write to the file
         '''
+        import heapq
+
         with open(fname, 'w') as fh:
             # Write the header
             fh.write('$date\n  {}\n$end\n'.format(str(self.date)))
@@ -181,64 +195,388 @@ class VCDInfo(object):
             else:
                 fh.write('#0\n')
 
-            prev_states = {}
-            for i, c in enumerate(self.channels):
-                if c.bits > 1:
-                    state = 'b{:0{}b} '.format(c.states[0][1] & (2**c.bits - 1), c.bits)
-                else:
-                    state = c.states[0][1]
+            formatters = [_state_formatter(c.bits, _vcd_identifiers[i]) for i, c in enumerate(self.channels)]
 
-                ident = _vcd_identifiers[i]
-                prev_states[i] = state
-
-                fh.write('{}{}\n'.format(state, ident))
+            prev_states = []
+            for i, c in enumerate(self.channels):
+                state = c.states[0][1]
+                prev_states.append(state)
+                fh.write(formatters[i](state))
 
             if init_with_dumpvars:
                 fh.write('$end\n')
 
 
             # Dump changes
-            es_channels = {}
-            for i, c in enumerate(self.channels):
-                es_channels[i] = iter(c.states) #decode.EdgeSequence(iter(v.states), self.timescale)
+            # Each channel contributes at most one (timestamp, channel index, state) entry per
+            # timestamp so the heap never has to compare states.
+            timestamp_edges = [_timestamp_edges(c.states, i, self.timescale) for i, c in enumerate(self.channels)]
+
+            cur_states = list(prev_states)
+            group_ts = None
+            touched = []
+            out_buf = []
 
-            es = decode.MultiEdgeSequence(es_channels, self.timescale)
+            def flush_group():
+                changed = sorted(i for i in touched if cur_states[i] != prev_states[i])
+                if len(changed) > 0:
+                    out_buf.append('#{}\n'.format(group_ts))
+                    for i in changed:
+                        out_buf.append(formatters[i](cur_states[i]))
+                        prev_states[i] = cur_states[i]
 
-            while not es.at_end():
-                es.advance_to_edge()
-                es.advance()
+            for ts, i, state in heapq.merge(*timestamp_edges):
+                if ts != group_ts:
+                    if group_ts is not None:
+                        flush_group()
+                        del touched[:]
+                        if len(out_buf) >= buf_lines:
+                            fh.write(''.join(out_buf))
+                            del out_buf[:]
+                    group_ts = ts
 
-                # Determine which channels changed
-                cur_states = {}
-                for i in xrange(len(es_channels)):
-                    ident = _vcd_identifiers[i]
-                    cur_states[i] = es.cur_state(i)
+                cur_states[i] = state
+                touched.append(i)
 
-                changed = []
-                for i in cur_states.iterkeys():
-                    #ident = _vcd_identifiers[i]
-                    if cur_states[i] != prev_states[i]:
-                        changed.append(i)
+            if group_ts is not None:
+                flush_group()
 
-                if len(changed) > 0:
-                    timestamp = int((es.cur_time() + self.timescale / 1000) / self.timescale) - 1
-                    #print('## gen timestamp:', es.cur_time(), self.timescale, timestamp, int(es.cur_time() / self.timescale))
-                    fh.write('#{}\n'.format(timestamp))
-                    #print('## changed:', changed, [_vcd_identifiers[i] for i in changed])
-                    for i in changed:
-                        c = self.channels[i]
-                        ident = _vcd_identifiers[i]
+            fh.write(''.join(out_buf))
 
-                        if c.bits > 1:
-                            state = 'b{:0{}b} '.format(cur_states[i] & (2**c.bits - 1), c.bits)
-                        else:
-                            state = cur_states[i]
 
-                        fh.write('{}{}\n'.format(state, ident))
+def _state_formatter(bits, ident):
+    '''Create a function that formats a value change for a channel'''
+    if bits > 1:
+        mask = 2**bits - 1
+        return lambda state: 'b{:0{}b} {}\n'.format(state & mask, bits, ident)
+    else:
+        return lambda state: '{}{}\n'.format(state, ident)
+
+
+def _timestamp_edges(states, channel_ix, timescale):
+    '''Convert an edge sequence into integer VCD timestamps
+
+    The initial state is skipped and edges falling on the same timestamp are combined
+    so that only the final state for each timestamp is yielded.
+
+    Yields a series of (timestamp, channel_ix, state) tuples.
+    '''
+    edges = iter(states)
+    next(edges, None) # Skip the initial state
 
-                prev_states = cur_states
+    prev_ts = None
+    prev_state = None
+    for t, state in edges:
+        # A small tolerance avoids truncating times that are exact multiples of
+        # the timescale but were rounded down by floating point error
+        ts = int(t / timescale + 0.001)
+        if ts != prev_ts and prev_ts is not None:
+            yield (prev_ts, channel_ix, prev_state)
+
+        prev_ts = ts
+        prev_state = state
+
+    if prev_ts is not None:
+        yield (prev_ts, channel_ix, prev_state)
+
+
+class VCDReader(object):
+    '''Streaming VCD file reader
+
+    The header is parsed when the object is created. Value changes are parsed
+    on demand in large blocks and distributed to per-channel edge streams.
+    '''
+    def __init__(self, fname, block_size=1024*1024):
+        '''
+        fname (string)
+            The name of the file to read from
+
+        block_size (int)
+            The number of bytes read from the file for each parsing step
+
+        Raises ValueError if the VCD header is malformed.
+        '''
+        self.fname = fname
+        self.block_size = block_size
+        self.date = None
+        self.version = None
+        self.comment = None
+        self.timescale = 1.0
+        self.channels = []  # VCDChannel objects. The states attribute is not used.
+        self._idents = {}   # Identifier code for each channel name
+
+        self._parse_header()
+
+    def _parse_header(self):
+        '''Read header definitions up to $enddefinitions'''
+        end_defs = re.compile(r'\$enddefinitions\s+\$end')
+        blocks = []
+        tail = ''       # End of the previous blocks where a partial match could start
+        tail_pos = 0    # File offset of tail
+        with open(self.fname, 'rb') as fh:
+            while True:
+                block = _native_str(fh.read(self.block_size))
+                if not block:
+                    raise ValueError('Missing $enddefinitions in VCD header')
+                blocks.append(block)
+
+                text = tail + block
+                m = end_defs.search(text)
+                if m is not None:
+                    break
+
+                # A match that spans blocks starts at one of the last two '$'
+                cut = text.rfind('$')
+                if cut > 0:
+                    prev_cut = text.rfind('$', 0, cut)
+                    if prev_cut >= 0:
+                        cut = prev_cut
+                if cut < 0:
+                    cut = len(text)
+                tail = text[cut:]
+                tail_pos += cut
+
+        self._data_offset = tail_pos + m.end()
+        header = ''.join(blocks)
+        tokens = iter(header[:tail_pos + m.start()].split())
+
+        def until_end():
+            words = []
+            for tok in tokens:
+                if tok == '$end':
+                    break
+                words.append(tok)
+            return words
+
+        scopes = []
+        for tok in tokens:
+            if tok == '$date':
+                self.date = ' '.join(until_end())
+            elif tok == '$version':
+                self.version = ' '.join(until_end())
+            elif tok == '$comment':
+                self.comment = ' '.join(until_end())
+            elif tok == '$timescale':
+                self.timescale = parse_timescale(''.join(until_end()))
+            elif tok == '$scope':
+                words = until_end()
+                scopes.append(words[-1])
+            elif tok == '$upscope':
+                until_end()
+                if len(scopes) > 0:
+                    scopes.pop()
+            elif tok == '$var':
+                words = until_end()
+                if len(words) < 4:
+                    raise ValueError('Invalid $var definition: {}'.format(' '.join(words)))
+                vtype, bits, ident, name = words[:4]
+                full_name = '.'.join(scopes + [name])
+                self.channels.append(VCDChannel(full_name, None, int(bits), vtype))
+                self._idents[full_name] = ident
+            elif tok.startswith('$'):
+                until_end()
+
+    def _find_ident(self, name):
+        '''Find the identifier code for a channel
+
+        name (string)
+            A full hierarchical channel name or an unambiguous channel name without
+            its enclosing scopes.
+
+        Raises ValueError if the channel can not be found
+        '''
+        if name in self._idents:
+            return self._idents[name]
+
+        matches = [k for k in self._idents.iterkeys() if k.split('.')[-1] == name]
+        if len(matches) == 1:
+            return self._idents[matches[0]]
+        elif len(matches) > 1:
+            raise ValueError('Ambiguous channel name: "{}"'.format(name))
+        else:
+            raise ValueError('Channel not found: "{}"'.format(name))
 
+    def edge_streams(self, names=None):
+        '''Get edge streams for a set of channels
 
-            
+        All of the returned streams share a single pass over the file. Changes for
+        each channel are buffered until its stream consumes them. Memory use is
+        bounded when the streams are consumed at a similar pace, as with
+        MultiEdgeSequence or any of the multi-channel decoders. A stream that is
+        never consumed will accumulate all of its edges.
 
+        Unknown ('x' and 'z') states are ignored. Vector channels produce integer states
+        and real channels produce float states.
 
+        names (sequence of string or None)
+            The channel names to get streams for. If None, all channels are used.
+
+        Returns a dict of edge streams keyed by channel name. Each stream yields a series
+          of 2-tuples (time, value) where time has been converted to seconds. The first
+          tuple is the initial state of the channel.
+
+        Raises ValueError if a channel name is invalid
+        '''
+        if names is None:
+            names = [c.name for c in self.channels]
+
+        parser = _VCDChangeParser(self.fname, self._data_offset, self.timescale, self.block_size)
+
+        streams = {}
+        for n in names:
+            queue = parser.track(self._find_ident(n))
+            streams[n] = _buffered_edges(parser, queue)
+
+        return streams
+
+    def edges(self, name):
+        '''Get the edge stream for a single channel
+
+        name (string)
+            The name of the channel
+
+        Returns an edge stream.
+
+        Raises ValueError if the channel name is invalid
+        '''
+        return self.edge_streams([name])[name]
+
+
+def parse_timescale(ts):
+    '''Convert a VCD timescale string to a float
+
+    ts (string)
+        A timescale such as '1ns' or '100 ps'
+
+    Returns the timescale in seconds as a float.
+
+    Raises ValueError if the timescale is invalid
+    '''
+    m = re.match(r'^\s*(1|10|100)\s*([munpf]?)s\s*$', ts)
+    if m is None:
+        raise ValueError('Invalid timescale: "{}"'.format(ts))
+
+    prefix_exp = dict((v, k) for k, v in _vcd_si_prefixes.iteritems())
+    return float('{}e{}'.format(m.group(1), prefix_exp[m.group(2)]))
+
+
+def _native_str(data):
+    '''Convert bytes read from a file into a native string
+
+    Latin-1 maps each byte to one character so that string positions
+    remain valid file offsets.
+    '''
+    if isinstance(data, str):
+        return data
+    return data.decode('latin-1')
+
+
+def _buffered_edges(parser, queue):
+    '''Yield edges from a parser queue, parsing more of the file as needed'''
+    while True:
+        while queue:
+            yield queue.popleft()
+
+        if not parser.parse_block():
+            break
+
+    while queue:
+        yield queue.popleft()
+
+
+class _VCDChangeParser(object):
+    '''Incremental parser for the value change section of a VCD file'''
+    def __init__(self, fname, data_offset, timescale, block_size):
+        self.fh = open(fname, 'rb')
+        self.fh.seek(data_offset)
+        self.timescale = timescale
+        self.block_size = block_size
+
+        self.tracked = {} # [last value, [queues]] keyed by identifier code
+        self.cur_time = 0.0
+        self.tail = ''          # Partial token from the end of the previous block
+        self.pend_value = None  # Vector or real value waiting for its identifier
+        self.in_comment = False
+
+    def track(self, ident):
+        '''Add a queue that receives the changes for an identifier code'''
+        queue = collections.deque()
+        self.tracked.setdefault(ident, [None, []])[1].append(queue)
+        return queue
+
+    def parse_block(self):
+        '''Parse the next block of value changes
+
+        Returns False when the end of the file has been reached.
+        '''
+        if self.fh is None:
+            return False
+
+        block = _native_str(self.fh.read(self.block_size))
+        if not block:
+            tokens = [self.tail] if self.tail else []
+            self.tail = ''
+            self.fh.close()
+            self.fh = None
+        else:
+            tokens = (self.tail + block).split()
+            # The last token may be continued in the next block
+            if not block[-1].isspace() and len(tokens) > 0:
+                self.tail = tokens.pop()
+            else:
+                self.tail = ''
+
+        tracked = self.tracked
+        timescale = self.timescale
+        t = self.cur_time
+        pend_value = self.pend_value
+        in_comment = self.in_comment
+
+        for tok in tokens:
+            if in_comment:
+                if tok == '$end':
+                    in_comment = False
+                continue
+
+            if pend_value is not None: # This token is the identifier for a vector or real
+                entry = tracked.get(tok)
+                if entry is not None:
+                    try:
+                        if pend_value[0] in 'rR':
+                            v = float(pend_value[1:])
+                        else:
+                            v = int(pend_value[1:], 2)
+                    except ValueError: # Unknown bits
+                        v = None
+
+                    if v is not None and v != entry[0]:
+                        entry[0] = v
+                        for q in entry[1]:
+                            q.append((t, v))
+
+                pend_value = None
+                continue
+
+            c = tok[0]
+            if c == '#':
+                t = int(tok[1:]) * timescale
+            elif c == '0' or c == '1':
+                entry = tracked.get(tok[1:])
+                if entry is not None:
+                    v = 1 if c == '1' else 0
+                    if v != entry[0]:
+                        entry[0] = v
+                        for q in entry[1]:
+                            q.append((t, v))
+            elif c in 'bBrR':
+                pend_value = tok
+            elif c == '$':
+                if tok == '$comment':
+                    in_comment = True
+            # Everything else is an unknown scalar state or a $dump* keyword
+
+        self.cur_time = t
+        self.pend_value = pend_value
+        self.in_comment = in_comment
+
+        return self.fh is not None
@@ -0,0 +1,558 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Concurrent processing graphs
+
+Chaining generators runs every stage in a single thread. A :class:`Pipeline`
+instead runs each stage as a node in its own worker thread or process. The nodes
+are connected by bounded queues so that a fast producer is held back by a
+slower consumer. Stages that spend their time in NumPy, Cython, or file I/O
+release the GIL and can run in parallel as threads. Pure Python stages can be
+moved into a separate process.
+
+  >>> pipe = Pipeline()
+  >>> samples = pipe.source('synth', sigp.synth_wave(edges, 100.0e6, rise_time=1.0e-6))
+  >>> noisy = pipe.stage('noisify', sigp.noisify, (samples,), {'snr_db': 20.0})
+  >>> edges = pipe.stage('edges', decode.find_edges, (noisy, (0.0, 1.0)))
+  >>> records = pipe.stage('uart', uart.uart_decode, (edges,), {'bits': 8, \\
+  ...     'baud_rate': 115200, 'stream_type': stream.StreamType.Edges}, mode='process')
+  >>> out = pipe.sink('out', records)
+  >>> pipe.run()
+  >>> print(pipe.report())
+
+The output of a node can be consumed by any number of other nodes. Each
+consumer gets its own queue so the producer runs at the pace of the slowest one.
+Items are passed through the queues in batches to limit the per-item overhead.
+
+Each node collects a :class:`~.profiling.StageStats` object with counts of the
+items it produced. Its time is the time spent working, excluding the time
+waiting for input. Its total_time is the wall clock time that the node ran.
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import threading
+import multiprocessing
+import timeit
+import time
+import pickle
+import Queue
+
+from ripyl.streaming import StreamError
+from ripyl.util.profiling import StageStats, format_report, _item_counter, _count_samples
+
+_POLL = 0.1 # Interval for checking the abort event on process queues
+
+
+class _Aborted(BaseException):
+    '''Raised in a worker when the pipeline is stopped
+
+    This is not an Exception so that it passes through any generic
+    exception handling in a stage.
+    '''
+    pass
+
+
+class _Input(object):
+    '''Placeholder for a node input in a stage's arguments'''
+    def __init__(self, index):
+        self.index = index
+
+
+class Node(object):
+    '''A node in a Pipeline
+
+    Nodes are created with the :meth:`Pipeline.source`, :meth:`Pipeline.stage`, and
+    :meth:`Pipeline.sink` methods.
+
+    :ivar stats: A StageStats object with the counts and times for this node
+    :ivar results: A list of the items reaching a sink with no function
+    :ivar error: The exception raised by the node or None
+    '''
+    def __init__(self, name, func, args, kwargs, mode, batch, maxsize):
+        self.name = name
+        self.func = func
+        self.mode = mode
+        self.batch = batch
+        self.maxsize = max(2, maxsize) # A full queue is never blocked by an abort marker
+        self.stats = StageStats(name)
+        self.results = None
+        self.error = None
+
+        # Nodes among the arguments are replaced with placeholders for their streams
+        self.inputs = []
+        def find_inputs(a):
+            if isinstance(a, Node):
+                self.inputs.append(a)
+                return _Input(len(self.inputs) - 1)
+            return a
+
+        self.args = [find_inputs(a) for a in args]
+        self.kwargs = dict((k, find_inputs(v)) for k, v in kwargs.iteritems())
+
+    def __repr__(self):
+        return 'Node({!r}, mode={!r})'.format(self.name, self.mode)
+
+
+def _wake_queue(q):
+    '''Unblock the producer and consumer of a thread queue after an abort'''
+    with q.mutex:
+        q.queue.clear()
+        q.queue.append(None)
+        q.not_empty.notify_all()
+        q.not_full.notify_all()
+
+def _get(q, abort):
+    if isinstance(q, Queue.Queue):
+        batch = q.get()
+    else:
+        while True:
+            try:
+                batch = q.get(timeout=_POLL)
+                break
+            except Queue.Empty:
+                if abort.is_set():
+                    raise _Aborted
+
+    if abort.is_set():
+        raise _Aborted
+    return batch
+
+def _put(q, batch, abort):
+    if abort.is_set():
+        raise _Aborted
+
+    if isinstance(q, Queue.Queue):
+        q.put(batch)
+    else:
+        while True:
+            try:
+                q.put(batch, timeout=_POLL)
+                break
+            except Queue.Full:
+                if abort.is_set():
+                    raise _Aborted
+
+def _unbatch(q, abort, wait):
+    '''Yield the items from the batches in a queue
+
+    The time spent waiting for batches is accumulated in wait[0].
+    '''
+    timer = timeit.default_timer
+    while True:
+        t_start = timer()
+        batch = _get(q, abort)
+        wait[0] += timer() - t_start
+
+        if batch is None: # End of stream
+            break
+
+        for item in batch:
+            yield item
+
+
+def _consume(stream, func, results):
+    '''Generator used to implement sinks'''
+    for item in stream:
+        if func is None:
+            results.append(item)
+        else:
+            func(item)
+        yield item
+
+
+def _run_node(node, inputs, outputs, abort):
+    '''Run a node to completion
+
+    node (Node)
+        The node to run.
+
+    inputs (sequence of queues)
+        The queues for each of node.inputs.
+
+    outputs (sequence of queues)
+        The queues for each consumer of the node.
+
+    abort (Event)
+        Set when the pipeline is stopped.
+
+    Raises _Aborted if the pipeline is stopped.
+    '''
+    timer = timeit.default_timer
+    stats = node.stats
+    wait = [0.0]
+    streams = [_unbatch(q, abort, wait) for q in inputs]
+
+    def fill(a):
+        return streams[a.index] if isinstance(a, _Input) else a
+
+    args = [fill(a) for a in node.args]
+    kwargs = dict((k, fill(v)) for k, v in node.kwargs.iteritems())
+
+    t_begin = timer()
+    try:
+        it = iter(node.func(*args, **kwargs))
+
+        counter = None
+        batch_size = node.batch
+        batch = []
+        while True:
+            outer_wait = wait[0]
+            t_start = timer()
+            try:
+                item = next(it)
+                done = False
+            except StopIteration:
+                done = True
+            finally:
+                stats.time += timer() - t_start - (wait[0] - outer_wait)
+
+            if done:
+                break
+
+            stats.items += 1
+            if counter is None:
+                counter = _item_counter(item)
+                if batch_size is None:
+                    # Sample chunks are large enough to pass along individually
+                    batch_size = 1 if counter is _count_samples else 256
+            counter(stats, item)
+
+            batch.append(item)
+            if len(batch) >= batch_size:
+                for q in outputs:
+                    _put(q, batch, abort)
+                batch = []
+
+        if batch:
+            for q in outputs:
+                _put(q, batch, abort)
+        for q in outputs:
+            _put(q, None, abort)
+
+        stats.finished = True
+
+        # Let the producers finish if the stage didn't use all of its input
+        for s in streams:
+            for _ in s:
+                pass
+
+    finally:
+        stats.total_time = timer() - t_begin
+
+
+def _process_main(node, inputs, outputs, abort, status):
+    '''Entry point for nodes run in a separate process'''
+    error = None
+    try:
+        _run_node(node, inputs, outputs, abort)
+    except _Aborted:
+        pass
+    except Exception as e:
+        error = e
+        abort.set()
+
+    if abort.is_set():
+        # Don't wait for unread data to be flushed when exiting
+        for q in outputs:
+            q.cancel_join_thread()
+
+    if error is not None:
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = StreamError('{} in node {!r}: {}'.format(type(error).__name__, node.name, error))
+
+    status.put((node.name, node.stats, error))
+
+
+class Pipeline(object):
+    '''A graph of processing stages run concurrently
+
+    Nodes are added in order from the sources to the sinks so the graph can
+    never contain a cycle. A node with no consumers is run and its output is
+    discarded.
+
+    Nodes in 'process' mode are run with the multiprocessing module. The items
+    they receive and produce are pickled as they pass between processes. On
+    platforms without fork() the stage function and its arguments must also be
+    picklable.
+    '''
+    def __init__(self, maxsize=8, batch=None):
+        '''
+        maxsize (int)
+            The default maximum number of batches held in each queue.
+
+        batch (int or None)
+            The default number of items passed through a queue together. When
+            None, sample chunks are passed individually and other items in
+            batches of 256.
+        '''
+        self.maxsize = maxsize
+        self.batch = batch
+        self.nodes = []
+        self._node_map = {}
+        self._workers = []
+        self._started = False
+        self._abort = None
+        self._thread_queues = []
+        self._status = None
+        self._pending = set() # Process nodes that haven't reported their status
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def _add(self, name, func, args, kwargs, mode, batch, maxsize):
+        if self._started:
+            raise StreamError('Pipeline has already been started')
+        if name in self._node_map:
+            raise ValueError('Duplicate node name: {!r}'.format(name))
+        if mode not in ('thread', 'process'):
+            raise ValueError('Invalid node mode: {!r}'.format(mode))
+
+        node = Node(name, func, args, kwargs or {}, mode, batch or self.batch, maxsize or self.maxsize)
+        for n in node.inputs:
+            if self._node_map.get(n.name) is not n:
+                raise ValueError('Input node {!r} is not part of this pipeline'.format(n.name))
+
+        self.nodes.append(node)
+        self._node_map[name] = node
+        return node
+
+    def source(self, name, iterable, mode='thread', batch=None, maxsize=None):
+        '''Add a node that produces the items from an iterable
+
+        name (string)
+            Unique name of the node.
+
+        iterable (iterable)
+            The source data. This can be a stream from a generator function.
+
+        mode (string)
+            'thread' or 'process'
+
+        batch (int or None)
+            The number of items passed through the output queues together.
+
+        maxsize (int or None)
+            The maximum number of batches held in each output queue.
+
+        Returns a Node object.
+        '''
+        return self._add(name, iter, (iterable,), None, mode, batch, maxsize)
+
+    def stage(self, name, func, args=(), kwargs=None, mode='thread', batch=None, maxsize=None):
+        '''Add a processing node
+
+        name (string)
+            Unique name of the node.
+
+        func (function)
+            A function returning an iterable, typically a generator function
+            such as sigproc.noisify() or decode.find_edges().
+
+        args (sequence)
+            Positional arguments for func. Any Node objects are replaced with a
+            stream of the items produced by that node.
+
+        kwargs (dict or None)
+            Keyword arguments for func. Node objects are replaced as for args.
+
+        mode (string)
+            'thread' or 'process'
+
+        batch (int or None)
+            The number of items passed through the output queues together.
+
+        maxsize (int or None)
+            The maximum number of batches held in each output queue.
+
+        Returns a Node object.
+
+        Raises ValueError if an input node is not part of this pipeline.
+        '''
+        return self._add(name, func, args, kwargs, mode, batch, maxsize)
+
+    def sink(self, name, node, func=None):
+        '''Add a node that consumes the output of another node
+
+        Sinks always run in a thread of the current process.
+
+        name (string)
+            Unique name of the node.
+
+        node (Node)
+            The node to consume.
+
+        func (function or None)
+            Called with each item. When None, the items are collected in the
+            sink's results list.
+
+        Returns a Node object.
+        '''
+        results = [] if func is None else None
+        sink = self._add(name, _consume, (node, func, results), None, 'thread', None, None)
+        sink.results = results
+        return sink
+
+    def __getitem__(self, name):
+        return self._node_map[name]
+
+    def start(self):
+        '''Start running all of the nodes
+
+        Raises StreamError if the pipeline has already been started.
+        '''
+        if self._started:
+            raise StreamError('Pipeline has already been started')
+        self._started = True
+
+        use_processes = any(n.mode == 'process' for n in self.nodes)
+        self._abort = multiprocessing.Event() if use_processes else threading.Event()
+        if use_processes:
+            self._status = multiprocessing.Queue()
+
+        inputs = dict((n.name, []) for n in self.nodes)
+        outputs = dict((n.name, []) for n in self.nodes)
+        for node in self.nodes:
+            for src in node.inputs:
+                if node.mode == 'process' or src.mode == 'process':
+                    q = multiprocessing.Queue(src.maxsize)
+                else:
+                    q = Queue.Queue(src.maxsize)
+                    self._thread_queues.append(q)
+                inputs[node.name].append(q)
+                outputs[src.name].append(q)
+
+        # Fork the processes before any threads are running
+        for node in self.nodes:
+            if node.mode == 'process':
+                w = multiprocessing.Process(target=_process_main, args=(node, inputs[node.name], \
+                    outputs[node.name], self._abort, self._status))
+                w.daemon = True
+                w.start()
+                self._pending.add(node.name)
+                self._workers.append(w)
+
+        for node in self.nodes:
+            if node.mode == 'thread':
+                w = threading.Thread(target=self._thread_main, args=(node, inputs[node.name], \
+                    outputs[node.name]))
+                w.daemon = True
+                w.start()
+                self._workers.append(w)
+
+    def _thread_main(self, node, inputs, outputs):
+        try:
+            _run_node(node, inputs, outputs, self._abort)
+        except _Aborted:
+            pass
+        except Exception as e:
+            self._fail(node, e)
+
+    def _fail(self, node, error):
+        with self._lock:
+            node.error = error
+            self._errors.append(error)
+        self.abort()
+
+    def abort(self):
+        '''Stop all of the nodes'''
+        if self._abort is None or self._abort.is_set() and not self._thread_queues:
+            return
+        self._abort.set()
+        # Thread queues block without polling so they must be woken
+        queues, self._thread_queues = self._thread_queues, []
+        for q in queues:
+            _wake_queue(q)
+
+    def _collect_status(self):
+        while self._pending:
+            try:
+                name, stats, error = self._status.get_nowait()
+            except Queue.Empty:
+                break
+
+            node = self._node_map[name]
+            node.stats = stats
+            self._pending.discard(name)
+            if error is not None:
+                self._fail(node, error)
+
+    def join(self, timeout=None):
+        '''Wait for all of the nodes to finish
+
+        timeout (float or None)
+            Maximum time to wait.
+
+        Returns True if the pipeline finished or False on a timeout.
+
+        Raises the first exception raised by a node.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._status is not None:
+                self._collect_status()
+
+            if self._abort.is_set():
+                self.abort() # Wake thread queues after a failure in another process
+
+            alive = [w for w in self._workers if w.is_alive()]
+            if not alive:
+                break
+
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0.0:
+                return False
+            alive[0].join(0.05 if remaining is None else min(0.05, remaining))
+
+        if self._status is not None:
+            self._collect_status()
+            if self._pending and not self._errors:
+                self._errors.append(StreamError('Pipeline process ended without reporting: {}'.format( \
+                    ', '.join(sorted(self._pending)))))
+
+        if self._errors:
+            raise self._errors[0]
+        return True
+
+    def run(self, timeout=None):
+        '''Start the pipeline and wait for it to finish
+
+        Returns True if the pipeline finished or False on a timeout.
+
+        Raises the first exception raised by a node.
+        '''
+        self.start()
+        return self.join(timeout)
+
+    @property
+    def stats(self):
+        '''List of the StageStats for each node in the order they were added'''
+        return [n.stats for n in self.nodes]
+
+    def report(self):
+        '''Format a node-by-node report of the collected statistics
+
+        Returns a string.
+        '''
+        return format_report(self.stats)
+
+    def __str__(self):
+        return self.report()
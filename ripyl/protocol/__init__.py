@@ -2,4 +2,8 @@
 
 '''Protocol package'''
 
-import ripyl.protocol.infrared
+# Protocol modules are imported on first access as attributes of this package
+from ripyl.util.lazy import lazy_package
+
+lazy_package(__name__, ['can', 'ethernet', 'i2c', 'i2s', 'infrared', 'iso_k_line', 'j1850', 'lin', 'lm73', \
+    'obd2', 'ps2', 'sagem_ecu', 'spi', 'uart', 'usb', 'usb_transact'])
@@ -797,22 +797,20 @@ def can_decode(can, polarity=CANConfig.IdleHigh, bit_rate=None, bit_timing=None,
     if bit_rate is None:
         # Find the bit rate
         
-        # Tee off an independent iterator to determine bit rate
-        edges_it, sre_it = itertools.tee(edges)
-        
+        # Look ahead into the edge stream to determine bit rate. Any settle
+        # markers from a live edge stream are skipped.
         min_edges = 50
-        symbol_rate_edges = list(itertools.islice(sre_it, min_edges))
+        edges_la = stream.LookaheadStream(edges)
+        symbol_rate_edges = list(itertools.islice(remove_repeated_states(edges_la.lookahead()), min_edges))
         
-        # We need to ensure that we can pull out enough edges from the iterator slice
+        # We need to ensure that we can pull out enough edges from the lookahead
         if len(symbol_rate_edges) < min_edges:
             raise AutoRateError('Unable to compute automatic bit rate. Insufficient edges.')
         
         raw_symbol_rate = find_symbol_rate(iter(symbol_rate_edges), spectra=2)
 
-        # Delete the tee'd iterators so that the internal buffer will not grow
-        # as the edges_it is advanced later on
+        edges_it = edges_la.release()
         del symbol_rate_edges
-        del sre_it
         
         if coerce_rates:
             # find the standard rate closest to the raw rate
@@ -1179,6 +1177,8 @@ def _can_synth(frames, bit_rate, idle_start=0.0, idle_end=0.0):
     yield ((t, ch), (t, cl)) # final state
 
 
+_crc15_table = crc_table(0x4599, 15)
+
 def can_crc15(d):
     '''Calculate CAN CRC-15 on data
 
@@ -1187,19 +1187,6 @@ def can_crc15(d):
         
     Returns array of integers for each bit in the CRC with MSB first
     '''
-    poly = 0x4599
-    sreg = 0
-    mask = 0x7fff
-
-    crc = 0
-    for b in d:
-        leftbit = (sreg & 0x4000) >> 14
-        sreg = (sreg << 1) & mask
-        if b != leftbit:
-            sreg ^= poly
-
-    crc = sreg
-
-    return split_bits(crc, 15)
+    return split_bits(table_crc_bits(d, _crc15_table, 0x4599, 15, 0), 15)
 
 
@@ -466,21 +466,21 @@ def ethernet_decode(rxtx, tag_ethertypes=None, logic_levels=None, stream_type=st
     # Detect speed of ethernet
     buf_edges = 150
     min_edges = 100
-    # tee off an iterator to determine speed class
-    rxtx_it, speed_check_it = itertools.tee(rxtx_it)
+    # Look ahead into the edges to determine speed class
+    rxtx_la = stream.LookaheadStream(rxtx_it)
+    speed_check_it = rxtx_la.lookahead()
 
     # Remove Diff-0's #FIX: need to modify to work with 100Mb and 1Gb Enet
     speed_check_it = (edge for edge in speed_check_it if edge[1] != 0)
 
 
-    symbol_rate_edges = itertools.islice(speed_check_it, buf_edges)
+    sre_list = list(itertools.islice(speed_check_it, buf_edges))
     
-    # We need to ensure that we can pull out enough edges from the iterator slice
-    # Just consume them all for a count        
-    sre_list = list(symbol_rate_edges)
+    # We need to ensure that we can pull out enough edges from the lookahead
     if len(sre_list) < min_edges:
         raise stream.StreamError('Unable to determine Ethernet speed (not enough edge transitions)')
     del speed_check_it
+    rxtx_it = rxtx_la.release()
         
     #print('## sym. rate edges len:', len(sre_list))
     
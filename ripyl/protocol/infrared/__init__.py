@@ -3,3 +3,8 @@
 '''Infrared protocol package'''
 
 from ripyl.protocol.infrared.ir_common import *
+
+# Protocol modules are imported on first access as attributes of this package
+from ripyl.util.lazy import lazy_package
+
+lazy_package(__name__, ['nec', 'rc5', 'rc6', 'sirc'])
@@ -230,7 +230,7 @@ def lin_pid(id):
 
 
 def lin_decode(stream_data, enhanced_ids=None, baud_rate=None, logic_levels=None,\
-                stream_type=stream.StreamType.Samples, param_info=None):
+                stream_type=stream.StreamType.Samples, param_info=None, samples_per_bit=None):
     '''Decode a LIN data stream
 
     This is a generator function that can be used in a pipeline of waveform
@@ -267,6 +267,12 @@ def lin_decode(stream_data, enhanced_ids=None, baud_rate=None, logic_levels=None
     param_info (dict or None)
         An optional dictionary object that is used to monitor the results of
         automatic baud detection.
+
+    samples_per_bit (number or None)
+        Oversampled sample streams are decimated with sigproc.auto_decimate() to
+        keep at least this many samples per bit before edges are found. This is
+        done by uart_decode() after any automatic baud detection. Decimation is
+        disabled when None.
         
         
     Yields a series of LINStreamFrame objects.
@@ -282,19 +288,26 @@ def lin_decode(stream_data, enhanced_ids=None, baud_rate=None, logic_levels=None
             samp_it, logic_levels = ripyl.decode.check_logic_levels(stream_data)
         else:
             samp_it = stream_data
-        
-        edges = ripyl.decode.find_edges(samp_it, logic_levels, hysteresis=0.4)
+
+        if samples_per_bit is not None:
+            # Samples are passed on so that uart_decode() can decimate them after auto-baud
+            uart_data = samp_it
+            uart_type = stream.StreamType.Samples
+        else:
+            uart_data = ripyl.decode.find_edges(samp_it, logic_levels, hysteresis=0.4)
+            uart_type = stream.StreamType.Edges
     else: # the stream is already a list of edges
-        edges = stream_data
+        uart_data = stream_data
+        uart_type = stream.StreamType.Edges
 
     bits = 8
     parity = None
     stop_bits = 1
     polarity = uart.UARTConfig.IdleHigh
 
-    records_it = uart.uart_decode(edges, bits, parity, stop_bits, lsb_first=True, \
+    records_it = uart.uart_decode(uart_data, bits, parity, stop_bits, lsb_first=True, \
         polarity=polarity, baud_rate=baud_rate, use_std_baud=False, logic_levels=logic_levels, \
-        stream_type=stream.StreamType.Edges, param_info=param_info)
+        stream_type=uart_type, param_info=param_info, samples_per_bit=samples_per_bit)
 
     S_NEED_BREAK = 0
     S_SYNC = 1
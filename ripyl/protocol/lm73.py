@@ -23,8 +23,6 @@
 
 from __future__ import print_function, division
 
-import itertools
-
 #from ripyl.streaming import *
 import ripyl.streaming as stream
 from ripyl.util.enum import Enum
@@ -160,19 +158,15 @@ def lm73_decode(i2c_stream, addresses=LM73Addresses):
     cur_reg = LM73Register.Temperature
     
     # check type of stream
-    stream_it, check_it = itertools.tee(i2c_stream)
-    try:
-        rec0 = next(check_it)
-    except StopIteration:
-        # Stream is empty
-        rec0 = None
+    stream_la = stream.LookaheadStream(i2c_stream)
+    rec0 = stream_la.peek(1)
+    rec0 = rec0[0] if rec0 else None # None if the stream is empty
+    stream_it = stream_la.release()
 
     if rec0 is not None:
         if not isinstance(rec0, i2c.I2CTransfer):
             # Convert the stream to a set of I2C transfers
             stream_it = i2c.reconstruct_i2c_transfers(stream_it)
-            
-    del check_it
 
     
     for tfer in stream_it:
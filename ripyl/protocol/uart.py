@@ -27,6 +27,7 @@ import itertools
 
 from ripyl.decode import *
 import ripyl.streaming as stream
+import ripyl.sigproc as sigp
 from ripyl.util.enum import Enum
 
 
@@ -64,8 +65,61 @@ class UARTConfig(Enum):
     IdleHigh = 1  # Polarity settings
     IdleLow = 2
 
+# Baud rates that automatically detected rates are coerced to
+StandardBaudRates = (110, 300, 600, 1200, 2400, 4800, 9600, 14400, 19200, 28800, 38400, \
+    56000, 57600, 115200, 128000, 153600, 230400, 256000, 460800, 921600)
+
+def _find_baud_rate(edges, use_std_baud):
+    '''Determine the baud rate from the start of an edge stream
+
+    edges (iterable of (float, int) pairs)
+        The edge stream. Only the first 50 edges are consumed.
+
+    use_std_baud (bool)
+        Coerce the measured rate to the closest standard baud rate.
+
+    Returns a tuple (baud_rate, raw_symbol_rate).
+
+    Raises AutoBaudError if the baud rate cannot be determined.
+    '''
+    # Experiments on random data indicate that find_symbol_rate() will almost
+    # always converge to a close estimate of baud rate within the first 35 edges.
+    # It seems to be a guarantee after 50 edges (pathological cases not withstanding).
+    min_edges = 50
+
+    # Any settle markers from a live edge stream are skipped
+    sre_list = list(itertools.islice(remove_repeated_states(edges), min_edges))
+
+    # We need to ensure that we can pull out enough edges from the lookahead
+    if len(sre_list) < min_edges:
+        raise AutoBaudError('Unable to compute automatic baud rate. Insufficient edges.')
+    
+    raw_symbol_rate = find_symbol_rate(iter(sre_list), spectra=2)
+
+    if raw_symbol_rate == 0:
+        # Some special data sequences may lack a second harmonic which
+        # ruins the HPS used in find_symbol_rate().
+
+        # In this case we bypass the HPS and just take the symbol rate using the dominant span
+        raw_symbol_rate = find_symbol_rate(iter(sre_list), spectra=1)
+
+    if use_std_baud:
+        # find the standard baud closest to the raw rate
+        baud_rate = min(StandardBaudRates, key=lambda x: abs(x - raw_symbol_rate))
+    else:
+        baud_rate = raw_symbol_rate
+        
+    #print('@@@@@@@@@@ baud rate:', baud_rate, raw_symbol_rate)
+
+    if baud_rate == 0:
+        raise AutoBaudError('Unable to compute automatic baud rate. Got 0.')
+
+    return (baud_rate, raw_symbol_rate)
+
+
 def uart_decode(stream_data, bits=8, parity=None, stop_bits=1.0, lsb_first=True, polarity=UARTConfig.IdleHigh, \
-    baud_rate=None, use_std_baud=True, logic_levels=None, stream_type=stream.StreamType.Samples, param_info=None):
+    baud_rate=None, use_std_baud=True, logic_levels=None, stream_type=stream.StreamType.Samples, param_info=None, \
+    samples_per_bit=None):
     
     '''Decode a UART data stream
 
@@ -122,6 +176,13 @@ def uart_decode(stream_data, bits=8, parity=None, stop_bits=1.0, lsb_first=True,
         An optional dictionary object that is used to monitor the results of
         automatic baud detection.
 
+    samples_per_bit (number or None)
+        Oversampled sample streams are decimated with sigproc.auto_decimate() to
+        keep at least this many samples per bit before edges are found. Samples
+        near transitions are kept at the original rate so edge timing isn't
+        affected. With auto-baud, the rate is found from the undecimated start
+        of the stream first. Decimation is disabled when None.
+
         
     Yields a series of UARTFrame objects. Each frame contains subrecords marking the location
       of sub-elements within the frame (start, data, parity, stop). Parity errors are recorded
@@ -138,65 +199,35 @@ def uart_decode(stream_data, bits=8, parity=None, stop_bits=1.0, lsb_first=True,
     '''
 
     bits = int(bits)
+    raw_symbol_rate = 0
     
     if stream_type == stream.StreamType.Samples:
         if logic_levels is None:
             samp_it, logic_levels = check_logic_levels(stream_data)
         else:
             samp_it = stream_data
+
+        if samples_per_bit is not None:
+            if baud_rate is None:
+                # Find the baud rate from the edges at the start of the full rate stream.
+                # The samples buffered by the lookahead are decimated afterward.
+                samp_la = stream.LookaheadStream(samp_it)
+                baud_rate, raw_symbol_rate = _find_baud_rate(find_edges(samp_la.lookahead(), \
+                    logic_levels, hysteresis=0.4), use_std_baud)
+                samp_it = samp_la.release()
+
+            samp_it = sigp.auto_decimate(samp_it, baud_rate, samples_per_bit, logic=logic_levels, hysteresis=0.4)
         
         edges = find_edges(samp_it, logic_levels, hysteresis=0.4)
     else: # the stream is already a list of edges
         edges = stream_data
         
     
-    raw_symbol_rate = 0
-    
     if baud_rate is None:
-        # Find the baud rate
-        
-        # tee off an independent iterator to determine baud rate
-        edges_it, sre_it = itertools.tee(edges)
-        
-        # Experiments on random data indicate that find_symbol_rate() will almost
-        # always converge to a close estimate of baud rate within the first 35 edges.
-        # It seems to be a guarantee after 50 edges (pathological cases not withstanding).
-        min_edges = 50
-        symbol_rate_edges = itertools.islice(sre_it, min_edges)
-        
-        # We need to ensure that we can pull out enough edges from the iterator slice
-        # Just consume them all for a count        
-        sre_list = list(symbol_rate_edges)
-        if len(sre_list) < min_edges:
-            raise AutoBaudError('Unable to compute automatic baud rate. Insufficient edges.')
-        
-        raw_symbol_rate = find_symbol_rate(iter(sre_list), spectra=2)
-
-        if raw_symbol_rate == 0:
-            # Some special data sequences may lack a second harmonic which
-            # ruins the HPS used in find_symbol_rate().
-
-            # In this case we bypass the HPS and just take the symbol rate using the dominant span
-            raw_symbol_rate = find_symbol_rate(iter(sre_list), spectra=1)
-
-        # delete the tee'd iterators so that the internal buffer will not grow
-        # as the edges_it is advanced later on
-        del symbol_rate_edges
-        del sre_it
-        
-        std_bauds = (110, 300, 600, 1200, 2400, 4800, 9600, 14400, 19200, 28800, 38400, \
-                     56000, 57600, 115200, 128000, 153600, 230400, 256000, 460800, 921600)
-
-        if use_std_baud:
-            # find the standard baud closest to the raw rate
-            baud_rate = min(std_bauds, key=lambda x: abs(x - raw_symbol_rate))
-        else:
-            baud_rate = raw_symbol_rate
-            
-        #print('@@@@@@@@@@ baud rate:', baud_rate, raw_symbol_rate)
-
-        if baud_rate == 0:
-            raise AutoBaudError('Unable to compute automatic baud rate. Got 0.')
+        # Look ahead into the edge stream to determine baud rate
+        edges_la = stream.LookaheadStream(edges)
+        baud_rate, raw_symbol_rate = _find_baud_rate(edges_la.lookahead(), use_std_baud)
+        edges_it = edges_la.release()
 
     else:
         edges_it = edges
@@ -1029,13 +1029,10 @@ def usb_decode(dp, dm, logic_levels=None, stream_type=stream.StreamType.Samples)
         dp_it = dp
         dm_it = dm
 
-    # tee off an iterator to determine speed class
-    dp_it, speed_check_it = itertools.tee(dp_it)
-
-    bus_speed = _get_bus_speed(speed_check_it)
-    # delete the tee'd iterators so that the internal buffer will not grow
-    # as the edges_it is advanced later on
-    del speed_check_it
+    # Look ahead into the edges to determine speed class
+    dp_la = stream.LookaheadStream(dp_it)
+    bus_speed = _get_bus_speed(dp_la)
+    dp_it = dp_la.release()
     
     #print('### symbol rate:', USBSpeed(bus_speed), USBClockPeriod[bus_speed])
 
@@ -1106,13 +1103,10 @@ def usb_diff_decode(d_diff, logic_levels=None, stream_type=stream.StreamType.Sam
     else: # The stream is already a list of edges
         d_diff_it = d_diff
 
-    # Tee off an iterator to determine speed class
-    d_diff_it, speed_check_it = itertools.tee(d_diff_it)
-
-    bus_speed = _get_bus_speed(speed_check_it, remove_se0s = True)
-    # Delete the tee'd iterators so that the internal buffer will not grow
-    # as the d_diff_it is advanced later on
-    del speed_check_it
+    # Look ahead into the edges to determine speed class
+    d_diff_la = stream.LookaheadStream(d_diff_it)
+    bus_speed = _get_bus_speed(d_diff_la, remove_se0s = True)
+    d_diff_it = d_diff_la.release()
     
     #print('### symbol rate:', bus_speed, USBClockPeriod[bus_speed])
     
@@ -1202,8 +1196,15 @@ def usb_hsic_decode(strobe, data, logic_levels=None, stream_type=stream.StreamTy
 
         
     
-def _get_bus_speed(speed_check_it, remove_se0s=False):
-    '''Determine bus speed of USB waveforms'''
+def _get_bus_speed(edges_la, remove_se0s=False):
+    '''Determine bus speed of USB waveforms
+
+    edges_la (LookaheadStream)
+        The edge stream to examine. No edges are consumed from it.
+
+    Returns a USBSpeed value.
+    '''
+    speed_check_it = edges_la.lookahead()
 
     # An unfiltered differential edge list can contain unwanted
     # SE0 states between +1 <-> -1 transitions. These will interfere
@@ -2039,6 +2040,8 @@ def usb_crc5(d):
     return split_bits(crc, 5)
 
 
+_crc16_bit_table = crc_table(0x8005, 16)
+
 def usb_crc16(d):
     '''Calculate USB CRC-16 on data
 
@@ -2050,19 +2053,7 @@ def usb_crc16(d):
     # Note: The input is a series of bits from reflected bytes (LSB first).
     # The output is in the LSB-first order needed for serial transmission
     # so a final reflection of the result is not needed.
-
-    poly = 0x8005  # USB CRC-16 polynomial
-    sreg = 0xffff  # prime register with 1's
-    mask = 0xffff
-    
-    for b in d:
-        leftbit = (sreg & 0x8000) >> 15
-        sreg = (sreg << 1) & mask
-        if b != leftbit:
-            sreg ^= poly
-
-    crc = sreg ^ mask  # invert shift register contents
-    # Note: crc is in LSB-first order
+    crc = table_crc_bits(d, _crc16_bit_table, 0x8005, 16, 0xffff) ^ 0xffff  # invert shift register contents
     return split_bits(crc, 16)
 
     
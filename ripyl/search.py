@@ -0,0 +1,536 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Search for records in long captures
+
+Finding a few frames of interest in a long capture doesn't require decoding
+all of it. The functions in this module skip the idle parts of the sample
+streams and only decode the frames whose headers can match:
+
+  1. :func:`find_active_regions` scans the samples in blocks and uses their
+     minimum and maximum to find the regions of bus activity separated by
+     idle gaps. Idle blocks are never passed to the edge finder.
+  2. A header scanner finds the edges in each region and extracts just the
+     header fields (CAN ID, I2C address) of each frame it contains.
+  3. Only the slices of samples holding frames with matching headers are
+     passed to the full decoder.
+
+  >>> for rec in can_search(iter(samples), [0x7E8], bit_rate=500e3):
+  ...     print(rec.start_time, rec.end_time, rec.data)
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import itertools
+import functools
+import math
+
+import numpy as np
+
+import ripyl.streaming as stream
+from ripyl.decode import check_logic_levels, find_edge_arrays, stable_block_states
+from ripyl.protocol.can import can_decode, CANConfig
+from ripyl.protocol.i2c import i2c_decode, reconstruct_i2c_transfers
+
+
+class SearchRegion(object):
+    '''A span of samples taken from one or more time aligned channels
+
+    :ivar chunks: A list with one SampleChunk for each channel
+    '''
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    @property
+    def sample_period(self):
+        return self.chunks[0].sample_period
+
+    @property
+    def start_time(self):
+        return self.chunks[0].start_time
+
+    @property
+    def end_time(self):
+        return self.start_time + len(self) * self.sample_period
+
+    def __len__(self):
+        return len(self.chunks[0].samples)
+
+    def slice(self, start_time, end_time):
+        '''Get a part of the region
+
+        start_time (float)
+            The start of the new region. It is limited to the start of this region.
+
+        end_time (float)
+            The end of the new region. It is limited to the end of this region.
+
+        Returns a new SearchRegion.
+        '''
+        period = self.sample_period
+        start = max(int(math.floor((start_time - self.start_time) / period)), 0)
+        end = min(int(math.ceil((end_time - self.start_time) / period)), len(self))
+        return SearchRegion([stream.SampleChunk(sc.samples[start:end], sc.start_time + start * period, \
+            period, sc.scale, sc.offset) for sc in self.chunks])
+
+    def streams(self):
+        '''Get the region as sample streams
+
+        Returns a list of iterators over a single SampleChunk for each channel.
+        '''
+        return [iter([sc]) for sc in self.chunks]
+
+    def __repr__(self):
+        return 'SearchRegion({:.6g}, {:.6g})'.format(self.start_time, self.end_time)
+
+
+def _block_activity(samples, block_size, hyst_bot, hyst_top, prev_state):
+    '''Find the blocks of samples containing edges
+
+    Returns a tuple (active, state) with a bool array marking each active block and
+      the logic state at the end of the last block or -1 if it isn't stable.
+    '''
+    # Blocks that aren't at a stable logic level contain an edge or part of a slow edge
+    states = stable_block_states(samples, block_size, hyst_bot, hyst_top)
+    active = states < 0
+
+    # An edge can fall on the boundary between two stable blocks
+    prev_states = np.concatenate(([prev_state], states[:-1]))
+    active |= (states >= 0) & (prev_states >= 0) & (states != prev_states)
+
+    return active, int(states[-1])
+
+
+def find_active_regions(channels, logic_levels, min_gap, hysteresis=0.4, block_size=None):
+    '''Find regions of activity in sample streams
+
+    This is a generator function. The samples are divided into blocks that
+    are tested for edges with their minimum and maximum values. Runs of active
+    blocks that are separated by less than min_gap are combined into a single
+    region. Each region is padded with idle samples before and after its
+    first and last edges.
+
+    channels (sequence of iterables of SampleChunk objects)
+        The sample streams to scan. These must be time aligned with the same
+        sample period. Activity on any channel is included in a region.
+
+    logic_levels ((float, float))
+        The (low, high) logic levels of the sample streams.
+
+    min_gap (float)
+        The shortest time without edges that separates two regions. This should
+        be longer than any period without an edge inside a frame.
+
+    hysteresis (float)
+        A value between 0.0 and 1.0 representing the amount of hysteresis to use for
+        detecting valid edge crossings.
+
+    block_size (int or None)
+        The number of samples in each block. When None a quarter of min_gap is used.
+        Idle periods shorter than min_gap minus one block never end a region.
+
+    Yields a series of SearchRegion objects.
+    '''
+    span = logic_levels[1] - logic_levels[0]
+    hyst_top = span * (0.5 + hysteresis / 2.0) + logic_levels[0]
+    hyst_bot = span * (0.5 - hysteresis / 2.0) + logic_levels[0]
+
+    streams = [iter(ch) for ch in channels]
+    try:
+        first = next(streams[0])
+    except StopIteration:
+        return
+    streams[0] = itertools.chain([first], streams[0])
+    sample_period = first.sample_period
+
+    if block_size is None:
+        block_size = max(int(min_gap / sample_period / 4), 1)
+
+    # A gap of min_gap contains at least this many whole blocks
+    gap_blocks = max(int(min_gap / (block_size * sample_period)) - 1, 1)
+    batch_size = block_size * max(65536 // block_size, 1)
+
+    extractors = [stream.ChunkExtractor(s) for s in streams]
+    prev_states = [-1] * len(channels)
+
+    hist = [[] for _ in channels] # Retained sample arrays for each channel starting at block hist_block
+    hist_block = 0
+    hist_start_time = 0.0
+    hist_meta = None
+    block0 = 0 # Block index of the current batch
+
+    region_first = None # First and last active block of the open region
+    region_last = None
+
+    def make_region(first, last):
+        for pieces in hist:
+            if len(pieces) > 1:
+                pieces[:] = [np.concatenate(pieces)]
+
+        start = (max(first - 1, hist_block) - hist_block) * block_size
+        end = (last + 1 + gap_blocks - hist_block) * block_size
+        return SearchRegion([stream.SampleChunk(pieces[0][start:end], hist_start_time + start * sample_period, \
+            sample_period, scale, offset) for pieces, (scale, offset) in zip(hist, hist_meta)])
+
+    while True:
+        chunks = [ce.next_chunk(batch_size) for ce in extractors]
+        if any(sc is None for sc in chunks):
+            break
+        count = min(len(sc.samples) for sc in chunks)
+        if count == 0:
+            break
+
+        active = np.zeros(int(math.ceil(count / block_size)), dtype=bool)
+        for i, sc in enumerate(chunks):
+            ch_active, prev_states[i] = _block_activity(sc.scaled_samples()[:count], block_size, \
+                hyst_bot, hyst_top, prev_states[i])
+            active |= ch_active
+
+        if hist_meta is None:
+            hist_meta = [(sc.scale, sc.offset) for sc in chunks]
+            hist_start_time = chunks[0].start_time
+        for pieces, sc in zip(hist, chunks):
+            pieces.append(sc.samples[:count])
+
+        # Split the active blocks wherever they are separated by a long enough gap
+        active_blocks = block0 + np.nonzero(active)[0]
+        if len(active_blocks) > 0:
+            if region_last is None:
+                region_first = active_blocks[0]
+                seq = active_blocks
+            else:
+                seq = np.concatenate(([region_last], active_blocks))
+
+            for k in np.nonzero(np.diff(seq) - 1 >= gap_blocks)[0]:
+                yield make_region(region_first, seq[k])
+                region_first = seq[k+1]
+
+            region_last = seq[-1]
+
+        block0 += len(active)
+        if region_last is not None and block0 - 1 - region_last >= gap_blocks:
+            yield make_region(region_first, region_last)
+            region_first = region_last = None
+
+        # Only keep the samples needed for the open region or the padding of the next one
+        keep_block = max(region_first - 1, hist_block) if region_first is not None else block0 - 1
+        trim = (keep_block - hist_block) * block_size
+        if trim > 0:
+            for pieces in hist:
+                remaining = trim
+                while remaining > 0 and len(pieces[0]) <= remaining:
+                    remaining -= len(pieces.pop(0))
+                if remaining > 0:
+                    pieces[0] = pieces[0][remaining:]
+            hist_start_time += trim * sample_period
+            hist_block = keep_block
+
+    if region_first is not None:
+        yield make_region(region_first, region_last)
+
+
+def search(decoder, channels, match=None, scanner=None, keys=None, logic_levels=None, min_gap=1.0e-3, \
+    hysteresis=0.4, search_info=None, **kwargs):
+    '''Search sample streams for decoded records
+
+    This is a generator function. Only the regions of activity found by
+    find_active_regions() are decoded. When a scanner is provided, it
+    is used to find the headers of each frame in a region and only the
+    frames with a key in keys are decoded.
+
+    decoder (function)
+        A decoder function. It is called with one sample stream for each
+        channel, the logic_levels, and kwargs.
+
+    channels (sequence of iterables of SampleChunk objects)
+        The time aligned sample streams to search.
+
+    match (function or None)
+        A predicate that is called with each decoded record. Only records
+        for which it returns True are yielded. When None all records are yielded.
+
+    scanner (function or None)
+        A function that finds the frame headers in a region. It is called with
+        the SearchRegion and the logic levels and returns an iterable of
+        (key, start_time, end_time) tuples for each frame. A key of None
+        indicates a header that couldn't be read and is always decoded.
+
+    keys (set or None)
+        The keys of the frames to decode. When None all frames are decoded.
+
+    logic_levels ((float, float) or None)
+        Optional pair that indicates (low, high) logic levels of the sample
+        streams. When None they are found from the first channel.
+
+    min_gap (float)
+        The shortest idle time between regions. See find_active_regions().
+
+    hysteresis (float)
+        A value between 0.0 and 1.0 representing the amount of hysteresis to use for
+        detecting valid edge crossings.
+
+    search_info (dict or None)
+        An optional dict object that is updated with statistics for the search:
+        'regions' and 'headers' are the number of active regions and frame headers found,
+        'decoded' is the number of regions or frames decoded, and 'samples' and
+        'decoded_samples' are the number of samples per channel scanned and decoded.
+
+    kwargs (dict)
+        Additional arguments for the decoder.
+
+    Yields the StreamRecord objects from the decoder that satisfy the match predicate.
+
+    Raises AutoLevelError if logic_levels is None and they cannot be determined.
+    '''
+    channels = [iter(ch) for ch in channels]
+    if logic_levels is None:
+        channels[0], logic_levels = check_logic_levels(channels[0])
+
+    if search_info is None:
+        search_info = {}
+    search_info.update({'regions': 0, 'headers': 0, 'decoded': 0, 'samples': 0, 'decoded_samples': 0})
+
+    def count_samples(scs):
+        for sc in scs:
+            search_info['samples'] += len(sc.samples)
+            yield sc
+    channels[0] = count_samples(channels[0])
+
+    for region in find_active_regions(channels, logic_levels, min_gap, hysteresis):
+        search_info['regions'] += 1
+
+        if scanner is None:
+            segments = [region]
+        else:
+            segments = []
+            for key, start_time, end_time in scanner(region, logic_levels):
+                search_info['headers'] += 1
+                if keys is None or key is None or key in keys:
+                    segments.append(region.slice(start_time, end_time))
+
+        for seg in segments:
+            search_info['decoded'] += 1
+            search_info['decoded_samples'] += len(seg)
+            for rec in decoder(*seg.streams(), logic_levels=logic_levels, **kwargs):
+                if match is None or match(rec):
+                    yield rec
+
+
+def _state_at(times, states, t):
+    '''Logic states at an array of times from edge arrays'''
+    return states[np.maximum(np.searchsorted(times, t, side='right') - 1, 0)]
+
+def _region_edges(sc, logic_levels, hysteresis):
+    '''Edge times and states for a SampleChunk'''
+    edge_ix, edge_states = find_edge_arrays(sc.scaled_samples(), logic_levels, hysteresis)
+    return sc.start_time + edge_ix * sc.sample_period, edge_states
+
+
+def _can_headers(region, logic_levels, bit_rate, polarity, hysteresis=0.4):
+    '''Find the IDs of the CAN frames in a region
+
+    Returns a list of (id, start_time, end_time) tuples for each frame. The id
+      is None when the frame ended before its ID was complete.
+    '''
+    times, states = _region_edges(region.chunks[0], logic_levels, hysteresis)
+    recessive = 1 if polarity == CANConfig.IdleHigh else 0
+    bit_period = 1.0 / bit_rate
+
+    # A SOF is a dominant edge at the start of the region or after the recessive
+    # ACK delimiter and EOF of the previous frame. Stuffing limits recessive runs
+    # inside a frame to 6 bits.
+    if len(times) < 2:
+        return []
+    idle = np.concatenate(([False, True], np.diff(times)[1:] >= 7.0 * bit_period))
+    sof = np.nonzero((states != recessive) & np.roll(states == recessive, 1) & idle)[0]
+    sof_times = times[sof]
+
+    headers = []
+    for i, t in enumerate(sof_times):
+        # Sample enough bits for an extended header with the worst case stuffing
+        sample_times = t + (np.arange(40) + 0.5) * bit_period
+        bits = (_state_at(times, states, sample_times) == recessive).astype(int)
+        bits = bits[sample_times < region.end_time]
+
+        # Remove stuffed bits
+        fields = []
+        run = 0
+        prev = None
+        for b in bits:
+            if run == 5:
+                run = 1
+                prev = b
+                continue
+            run = run + 1 if b == prev else 1
+            prev = b
+            fields.append(b)
+
+        can_id = None
+        if len(fields) >= 14:
+            can_id = int(''.join(str(b) for b in fields[1:12]), 2)
+            if fields[13] == 1: # Extended IDE
+                if len(fields) >= 32:
+                    can_id = (can_id << 18) | int(''.join(str(b) for b in fields[14:32]), 2)
+                else:
+                    can_id = None
+
+        end_time = sof_times[i+1] - bit_period if i+1 < len(sof_times) else region.end_time
+        headers.append((can_id, t - bit_period, end_time))
+
+    return headers
+
+
+def can_search(can, ids, bit_rate, polarity=CANConfig.IdleHigh, logic_levels=None, match=None, search_info=None):
+    '''Find CAN frames with specific IDs
+
+    This is a generator function. Only frames with an ID in ids are decoded.
+
+    can (iterable of SampleChunk objects)
+        A sample stream representing a CAN data signal. See can_decode().
+
+    ids (sequence of int)
+        The frame IDs to find. Extended frames are matched by their 29-bit ID.
+
+    bit_rate (number)
+        The bit rate of the stream.
+
+    polarity (CANConfig)
+        Set the polarity (idle state high or low).
+
+    logic_levels ((float, float) or None)
+        Optional pair that indicates (low, high) logic levels of the sample
+        stream. When None they are found automatically.
+
+    match (function or None)
+        An additional predicate for the decoded CANStreamFrame objects.
+
+    search_info (dict or None)
+        An optional dict object that is updated with statistics for the search.
+        See search().
+
+    Yields a series of CANStreamFrame objects with an ID in ids.
+    '''
+    ids = frozenset(ids)
+
+    def match_id(rec):
+        return rec.kind == 'CAN frame' and rec.data.full_id in ids and (match is None or match(rec))
+
+    scanner = functools.partial(_can_headers, bit_rate=bit_rate, polarity=polarity)
+
+    # The 11 recessive bits between frames split regions
+    return search(can_decode, [can], match_id, scanner, ids, logic_levels, min_gap=11.0 / bit_rate, \
+        search_info=search_info, polarity=polarity, bit_rate=bit_rate)
+
+
+def _i2c_headers(region, logic_levels, hysteresis=0.4):
+    '''Find the addresses of the I2C transfers in a region
+
+    Returns a list of (address, start_time, end_time) tuples for each start and
+      restart condition. The address is None when it couldn't be read.
+    '''
+    scl_t, scl_s = _region_edges(region.chunks[0], logic_levels, hysteresis)
+    sda_t, sda_s = _region_edges(region.chunks[1], logic_levels, hysteresis)
+
+    # A start is a falling SDA edge while SCL is high
+    sda_falls = sda_t[1:][sda_s[1:] == 0]
+    starts = sda_falls[_state_at(scl_t, scl_s, sda_falls) == 1]
+    scl_rises = scl_t[1:][scl_s[1:] == 1]
+    all_edges = np.concatenate((scl_t[1:], sda_t[1:]))
+
+    # Each transfer begins between the start and the edge before it
+    # so that both lines are seen as high
+    seg_starts = []
+    for t in starts:
+        prior = all_edges[all_edges < t]
+        seg_starts.append((prior.max() + t) / 2.0 if len(prior) > 0 else region.start_time)
+
+    headers = []
+    for i, t in enumerate(starts):
+        # The address bits are sampled on the rising edges of SCL
+        rises = scl_rises[np.searchsorted(scl_rises, t, side='right'):][:18]
+        bits = _state_at(sda_t, sda_s, rises)
+
+        end_time = seg_starts[i+1] if i+1 < len(starts) else region.end_time
+
+        address = None
+        if len(bits) >= 8:
+            byte = int(''.join(str(b) for b in bits[:8]), 2)
+            if byte >> 3 == 0x1E: # 10-bit address
+                upper_bits = (byte >> 1) & 0x03
+                if byte & 0x01 == 0:
+                    if len(bits) >= 17:
+                        address = upper_bits << 8 | int(''.join(str(b) for b in bits[9:17]), 2)
+                elif len(headers) > 0 and headers[-1][0] > 0x77 and headers[-1][0] >> 8 == upper_bits:
+                    # Reads only have the upper bits. The full address comes from the
+                    # preceding write so they are decoded together.
+                    headers[-1] = (headers[-1][0], headers[-1][1], end_time)
+                    continue
+            else:
+                address = byte >> 1
+
+        headers.append((address, seg_starts[i], end_time))
+
+    return headers
+
+def _i2c_transfer_decode(scl, sda, logic_levels):
+    return reconstruct_i2c_transfers(i2c_decode(scl, sda, logic_levels))
+
+
+def i2c_search(scl, sda, addresses, logic_levels=None, min_gap=100.0e-6, match=None, search_info=None):
+    '''Find I2C transfers to specific addresses
+
+    This is a generator function. Only transfers with an address in addresses
+    are decoded. A transfer is the address and data between a start or
+    restart condition and the next one or a stop.
+
+    scl (iterable of SampleChunk objects)
+        A sample stream representing the I2C serial clock
+
+    sda (iterable of SampleChunk objects)
+        A sample stream representing the I2C serial data
+
+    addresses (sequence of int)
+        The 7-bit or 10-bit addresses to find.
+
+    logic_levels ((float, float) or None)
+        Optional pair that indicates (low, high) logic levels of the sample
+        streams. When None they are found from scl.
+
+    min_gap (float)
+        The shortest idle time between regions. This must be longer than the
+        slowest clock period including any clock stretching or pause before a
+        restart.
+
+    match (function or None)
+        An additional predicate for the I2CTransfer objects.
+
+    search_info (dict or None)
+        An optional dict object that is updated with statistics for the search.
+        See search().
+
+    Yields a series of I2CTransfer objects with an address in addresses.
+    '''
+    addresses = frozenset(addresses)
+
+    def match_address(rec):
+        return rec.address in addresses and (match is None or match(rec))
+
+    return search(_i2c_transfer_decode, [scl, sda], match_address, _i2c_headers, addresses, logic_levels, \
+        min_gap, search_info=search_info)
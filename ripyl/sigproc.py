@@ -23,10 +23,17 @@
 
 from __future__ import print_function
 
-from ripyl.streaming import SampleChunk, StreamError, ChunkExtractor
+from ripyl.streaming import SampleChunk, StreamError, ChunkExtractor, processing_dtype
+from ripyl.decode import stable_block_states
+
+import itertools
 
 import numpy as np
-import scipy.signal as signal
+
+from ripyl.util.lazy import lazy_import
+signal = lazy_import('scipy.signal')
+
+from ripyl.backend import hot_function, backend_impl
 
 
 
@@ -65,7 +72,9 @@ def remove_excess_edges(edges):
 
 
 
-def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extension=None, chunk_size=10000):
+@hot_function('sigproc.edges_to_sample_stream')
+def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extension=None, chunk_size=10000, \
+    dtype=float):
     '''Convert an edge stream to a sample stream
 
     The output samples are scaled to the range of 0.0 to 1.0 regardless of the number of logic states.
@@ -85,6 +94,9 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
 
     chunk_size (int)
         Number of samples in each SampleChunk
+
+    dtype (numpy dtype)
+        The floating point type for the samples
     
     Yields a stream of SampleChunk objects.
     '''
@@ -97,7 +109,7 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
         raise StreamError('Not enough edges to generate samples')
     
     t = cur_states[0]
-    chunk = np.empty(chunk_size, dtype=float)
+    chunk = np.empty(chunk_size, dtype=dtype)
     chunk_count = 0
     start_time = cur_states[0]
 
@@ -113,7 +125,7 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
             if chunk_count == chunk_size:
                 yield SampleChunk(chunk, start_time, sample_period)
 
-                chunk = np.empty(chunk_size, dtype=float)
+                chunk = np.empty(chunk_size, dtype=dtype)
                 chunk_count = 0
                 start_time = t
         
@@ -133,7 +145,7 @@ def edges_to_sample_stream(edges, sample_period, logic_states=(0,1), end_extensi
             if chunk_count == chunk_size:
                 yield SampleChunk(chunk, start_time, sample_period)
 
-                chunk = np.empty(chunk_size, dtype=float)
+                chunk = np.empty(chunk_size, dtype=dtype)
                 chunk_count = 0
                 start_time = t
 
@@ -169,6 +181,42 @@ def approximate_bandwidth(rise_time):
     
    
 
+def _bench_fir_filter():
+    rs = np.random.RandomState(1234)
+    taps = signal.firwin(101, 0.1)
+    samples = rs.normal(0.0, 1.0, 10100)
+    def workload(impl):
+        for _ in xrange(5):
+            impl(taps, samples)
+    return workload
+
+@hot_function('sigproc.fir_filter', bench=_bench_fir_filter, backend='lfilter')
+def fir_filter(taps, samples):
+    '''Apply an FIR filter to an array of samples
+
+    The filter starts with zero initial conditions. The output is the same length as the input.
+
+    taps (sequence of float)
+        The filter coefficients.
+
+    samples (sequence of float)
+        Numpy array of samples to filter.
+
+    Returns a numpy array of filtered samples.
+    '''
+    return signal.lfilter(taps, 1.0, samples)
+
+@backend_impl('sigproc.fir_filter', 'numpy')
+def _np_fir_filter(taps, samples):
+    '''Direct convolution implementation of fir_filter()'''
+    return np.convolve(samples, taps)[:len(samples)]
+
+@backend_impl('sigproc.fir_filter', 'fft')
+def _fft_fir_filter(taps, samples):
+    '''FFT convolution implementation of fir_filter()'''
+    return signal.fftconvolve(samples, taps)[:len(samples)]
+
+
 def filter_waveform(samples, sample_rate, rise_time, ripple_db=60.0, chunk_size=10000):
     '''Apply a bandwidth limiting low-pass filter to a sample stream
     
@@ -218,13 +266,15 @@ def filter_waveform(samples, sample_rate, rise_time, ripple_db=60.0, chunk_size=
 
     samp_ce = ChunkExtractor(samples)
 
-    # Get a pool of samples
-    spool = np.zeros((chunk_size + N-1,), dtype = np.float)
-    
     # Prime the initial portion of the pool with data that will be filtered out
     prime_size = N - N//2
     sc = samp_ce.next_chunk(prime_size)
     if sc is not None:
+        # Get a pool of samples
+        # The filter is linear with unity DC gain so any scale and offset on the chunks
+        # still apply to the filtered raw samples.
+        spool = np.zeros((chunk_size + N-1,), dtype=processing_dtype(sc.samples.dtype))
+
         spool[0:N//2-1] += sc.samples[0] # Pad the first part of the pool with a copy of the first sample
         spool[N//2 - 1:N - 1] = sc.samples
 
@@ -237,17 +287,19 @@ def filter_waveform(samples, sample_rate, rise_time, ripple_db=60.0, chunk_size=
             spool[N-1:len(sc.samples) + N-1] = sc.samples
             valid_samples = len(sc.samples) + N - 1
                     
-            filt = signal.lfilter(taps, 1.0, spool[:valid_samples]) #NOTE: there may be an off-by-one error in the slice
+            filt = fir_filter(taps, spool[:valid_samples]) #NOTE: there may be an off-by-one error in the slice
+            filt = filt.astype(spool.dtype, copy=False)
             
             # copy end samples to start of pool
             spool[0:N-1] = spool[chunk_size:chunk_size + N-1]
             
             #print('$$$ ce chunk', N, valid_samples, sc.start_time, sample_period)
 
-            yield SampleChunk(filt[N-1:valid_samples], sc.start_time, sample_period)
+            yield SampleChunk(filt[N-1:valid_samples], sc.start_time, sample_period, sc.scale, sc.offset)
 
 
-def synth_wave(edges, sample_rate, rise_time, tau_factor=0.0, logic_states=(0,1), ripple_db=60.0, chunk_size=10000):
+def synth_wave(edges, sample_rate, rise_time, tau_factor=0.0, logic_states=(0,1), ripple_db=60.0, chunk_size=10000, \
+    dtype=float):
     '''Convert an edge stream to a sampled waveform with band limited rise/fall times
     
     This is a convenience function combining edges_to_sample_stream(),
@@ -277,12 +329,15 @@ def synth_wave(edges, sample_rate, rise_time, tau_factor=0.0, logic_states=(0,1)
 
     chunk_size (int)
         Number of samples in each SampleChunk
+
+    dtype (numpy dtype)
+        The floating point type for the samples
     
     Returns an iterator for the synthesized sample stream
     '''
     sample_period = 1.0 / sample_rate
 
-    samples = edges_to_sample_stream(edges, sample_period, logic_states, chunk_size=chunk_size)
+    samples = edges_to_sample_stream(edges, sample_period, logic_states, chunk_size=chunk_size, dtype=dtype)
 
     if tau_factor >= 0.01: # Using capacify
         tau = rise_time * tau_factor
@@ -292,6 +347,236 @@ def synth_wave(edges, sample_rate, rise_time, tau_factor=0.0, logic_states=(0,1)
 
     return filter_waveform(samples, sample_rate, rise_time, ripple_db, chunk_size)
 
+
+def decimation_factor(sample_period, symbol_rate, samples_per_symbol=20):
+    '''Compute the decimation factor that keeps a minimum number of samples per symbol
+
+    sample_period (float)
+        The sample period of the stream to be decimated
+
+    symbol_rate (float)
+        The symbol rate (baud rate) of the signal in the stream
+
+    samples_per_symbol (float)
+        The minimum number of samples to keep for each symbol
+
+    Returns an int for the decimation factor. This is 1 when no decimation is possible.
+    '''
+    raw_per_symbol = 1.0 / (symbol_rate * sample_period)
+    return max(int(raw_per_symbol / samples_per_symbol), 1)
+
+
+def decimate(samples, factor, method='minmax', ripple_db=60.0, chunk_size=10000, logic=None, \
+    hysteresis=0.4):
+    '''Reduce the sample rate of a sample stream
+
+    Two decimation methods are available:
+
+    'minmax'
+        Each block of factor samples is replaced by its minimum and maximum
+        in the order they occurred. No transitions of a digital signal are lost
+        and the sample values are unchanged. The output has two samples per block.
+        When logic levels are given, only blocks that stay at one stable logic
+        level are reduced. Blocks containing a transition are passed through at
+        the original sample rate so the edges found in the output have the
+        original timing. The output is then a series of chunks that alternate
+        between the two sample rates.
+
+    'fir'
+        A polyphase anti-aliasing FIR filter is applied and every factor-th
+        sample is kept. The filter group delay is removed from the output time.
+        This is appropriate for analog signals.
+
+    This is a generator function.
+
+    samples (iterable of SampleChunk objects)
+        An iterable sample stream to decimate.
+
+    factor (int)
+        The decimation factor. Values less than 2 pass the stream through unchanged.
+
+    method (string)
+        The decimation method. One of 'minmax' or 'fir'.
+
+    ripple_db (float)
+        Stop band attenuation in dB for the 'fir' filter.
+
+    chunk_size (int)
+        Number of input samples processed at once. This is rounded up to a
+        multiple of factor.
+
+    logic ((float, float) or None)
+        The (low, high) logic levels of a digital signal for the 'minmax' method.
+
+    hysteresis (float)
+        The hysteresis that will be used to find edges in the output.
+
+    Yields a stream of SampleChunk objects.
+
+    Raises ValueError if the method is invalid.
+    '''
+    if method not in ('minmax', 'fir'):
+        raise ValueError('Invalid decimation method: {0}'.format(method))
+
+    factor = int(factor)
+    if factor < 2:
+        for sc in samples:
+            yield sc
+        return
+
+    block_size = max((chunk_size + factor - 1) // factor, 1) * factor
+    samp_ce = ChunkExtractor(samples)
+
+    if method == 'minmax':
+        if logic is not None:
+            span = logic[1] - logic[0]
+            hyst_top = span * (0.5 + hysteresis / 2.0) + logic[0]
+            hyst_bot = span * (0.5 - hysteresis / 2.0) + logic[0]
+
+        while True:
+            sc = samp_ce.next_chunk(block_size)
+            if sc is None:
+                break
+
+            if logic is None:
+                yield SampleChunk(_minmax_blocks(sc.samples, factor), sc.start_time, \
+                    sc.sample_period * factor / 2.0, sc.scale, sc.offset)
+            else:
+                for dsc in _minmax_stable_blocks(sc, factor, hyst_bot, hyst_top):
+                    yield dsc
+
+    else: # FIR
+        nyquist = 1.0 / factor # Normalized to the input Nyquist rate
+        N, beta = signal.kaiserord(ripple_db, 0.2 * nyquist)
+        N |= 1 # Odd length has an integer group delay
+        taps = signal.firwin(N, 0.8 * nyquist, window=('kaiser', beta))
+        delay = (N - 1) // 2
+
+        # History is a multiple of factor so that every output lands on an input block boundary
+        hist_size = (N - 1 + factor - 1) // factor * factor
+        hist = None
+
+        while True:
+            sc = samp_ce.next_chunk(block_size)
+            if sc is None:
+                break
+
+            if hist is None: # Pad the history with the first sample
+                dtype = processing_dtype(sc.samples.dtype)
+                taps = taps.astype(dtype)
+                hist = np.empty(hist_size, dtype=dtype)
+                hist[:] = sc.samples[0]
+
+                # Skip the outputs that would precede the start of the stream
+                skip_count = (delay + factor - 1) // factor
+
+            x = np.concatenate((hist, sc.samples))
+            out_count = (len(sc.samples) + factor - 1) // factor
+            skip = min(skip_count, out_count)
+            skip_count -= skip
+            filt = signal.upfirdn(taps, x, 1, factor)[hist_size // factor + skip:hist_size // factor + out_count]
+            hist = x[-hist_size:]
+
+            if len(filt) > 0:
+                start_time = sc.start_time + (skip * factor - delay) * sc.sample_period
+                yield SampleChunk(filt.astype(dtype, copy=False), start_time, \
+                    sc.sample_period * factor, sc.scale, sc.offset)
+
+
+def _minmax_blocks(samples, factor):
+    '''Reduce each block of samples to its ordered min and max values'''
+    full = len(samples) // factor * factor
+    blocks = samples[:full].reshape(-1, factor)
+    if full < len(samples): # Pad the final partial block with its last sample
+        tail = np.empty((1, factor), dtype=samples.dtype)
+        tail[0, :] = samples[-1]
+        tail[0, :len(samples) - full] = samples[full:]
+        blocks = np.vstack((blocks, tail))
+
+    rows = np.arange(len(blocks))
+    min_ix = np.argmin(blocks, axis=1)
+    max_ix = np.argmax(blocks, axis=1)
+    mins = blocks[rows, min_ix]
+    maxs = blocks[rows, max_ix]
+
+    min_first = min_ix <= max_ix
+    out = np.empty((len(blocks), 2), dtype=samples.dtype)
+    out[:, 0] = np.where(min_first, mins, maxs)
+    out[:, 1] = np.where(min_first, maxs, mins)
+
+    return out.ravel()
+
+
+def _minmax_stable_blocks(sc, factor, hyst_bot, hyst_top):
+    '''Reduce the blocks of a chunk that are at a stable logic level
+
+    Runs of stable blocks are reduced with _minmax_blocks(). The first output
+    sample of each block falls on the block's start time so an edge between
+    two stable blocks keeps its time. Runs of blocks with a transition keep
+    their original samples.
+
+    Yields a series of SampleChunk objects.
+    '''
+    stable = stable_block_states(sc.scaled_samples(), factor, hyst_bot, hyst_top) >= 0
+
+    breaks = np.nonzero(stable[1:] != stable[:-1])[0] + 1
+    run_starts = np.concatenate(([0], breaks)).tolist()
+    run_ends = np.concatenate((breaks, [len(stable)])).tolist()
+
+    for b_start, b_end in itertools.izip(run_starts, run_ends):
+        start = b_start * factor
+        end = min(b_end * factor, len(sc.samples))
+        start_time = sc.start_time + start * sc.sample_period
+
+        if stable[b_start]:
+            yield SampleChunk(_minmax_blocks(sc.samples[start:end], factor), start_time, \
+                sc.sample_period * factor / 2.0, sc.scale, sc.offset)
+        else:
+            yield SampleChunk(sc.samples[start:end], start_time, sc.sample_period, sc.scale, sc.offset)
+
+
+def auto_decimate(samples, symbol_rate, samples_per_symbol=20, method='minmax', logic=None, hysteresis=0.4):
+    '''Decimate a sample stream to the minimum rate needed for a known symbol rate
+
+    The decimation factor is determined from the sample period of the first
+    chunk in the stream. The stream passes through unchanged if it is already
+    at or below the requested rate.
+
+    This is a generator function.
+
+    samples (iterable of SampleChunk objects)
+        An iterable sample stream to decimate.
+
+    symbol_rate (float)
+        The symbol rate (baud rate) of the signal in the stream
+
+    samples_per_symbol (float)
+        The minimum number of samples to keep for each symbol
+
+    method (string)
+        The decimation method passed to decimate().
+
+    logic ((float, float) or None)
+        The logic levels passed to decimate() to keep the original edge timing.
+
+    hysteresis (float)
+        The hysteresis passed to decimate().
+
+    Yields a stream of SampleChunk objects.
+    '''
+    samples = iter(samples)
+    try:
+        first = next(samples)
+    except StopIteration:
+        return
+
+    if method == 'minmax': # Two output samples per block
+        samples_per_symbol = samples_per_symbol / 2.0
+
+    factor = decimation_factor(first.sample_period, symbol_rate, samples_per_symbol)
+    for sc in decimate(itertools.chain([first], samples), factor, method, logic=logic, hysteresis=hysteresis):
+        yield sc
+
     
 def noisify(samples, snr_db=30.0):
     '''Add noise to a sample stream
@@ -320,7 +605,8 @@ def noisify(samples, snr_db=30.0):
         noise_sd = 0.5 / (10.0 ** (snr_db / 20.0))
 
         for sc in samples:
-            filt = sc.samples + np.random.normal(0.0, noise_sd, len(sc.samples))
+            filt = sc.scaled_samples()
+            filt = filt + np.random.normal(0.0, noise_sd, len(filt)).astype(filt.dtype)
             yield SampleChunk(filt, sc.start_time, sc.sample_period)
 
 
@@ -346,7 +632,7 @@ def quantize(samples, full_scale, bits=8):
     ulp = float(full_scale) / 2**bits
 
     for sc in samples:
-        filt = np.floor(sc.samples / ulp) * ulp
+        filt = np.floor(sc.scaled_samples() / ulp) * ulp
         yield SampleChunk(filt, sc.start_time, sc.sample_period)
 
 
@@ -354,6 +640,8 @@ def amplify(samples, gain=1.0, offset=0.0):
     '''Apply gain and offset to a sample stream
     
     This modifies samples such that output = input * gain + offset.
+    Chunks of raw integer codes are not modified. Instead, the gain and offset
+    are folded into the chunk scale and offset.
     
     This is a generator function.
     
@@ -370,8 +658,12 @@ def amplify(samples, gain=1.0, offset=0.0):
     '''
 
     for sc in samples:
-        filt = (sc.samples * gain) + offset
-        yield SampleChunk(filt, sc.start_time, sc.sample_period)
+        if sc.samples.dtype.kind != 'f':
+            yield SampleChunk(sc.samples, sc.start_time, sc.sample_period, \
+                sc.scale * gain, sc.offset * gain + offset)
+        else:
+            filt = (sc.scaled_samples() * gain) + offset
+            yield SampleChunk(filt, sc.start_time, sc.sample_period)
 
        
 def dropout(samples, start_time, end_time, val=0.0):
@@ -413,7 +705,7 @@ def dropout(samples, start_time, end_time, val=0.0):
         else:
             end_ix = len(sc.samples)
 
-        filt = np.copy(sc.samples)
+        filt = np.array(sc.scaled_samples())
         filt[start_ix:end_ix] = val
         yield SampleChunk(filt, sc.start_time, sc.sample_period)
 
@@ -430,10 +722,14 @@ def invert(stream):
     '''
 
     for sc in stream:
-        filt = sc.samples * -1.0
-        yield SampleChunk(filt, sc.start_time, sc.sample_period)
+        if sc.samples.dtype.kind != 'f':
+            yield SampleChunk(sc.samples, sc.start_time, sc.sample_period, -sc.scale, -sc.offset)
+        else:
+            filt = sc.scaled_samples() * -1.0
+            yield SampleChunk(filt, sc.start_time, sc.sample_period)
 
 
+@hot_function('sigproc.capacify')
 def capacify(samples, capacitance, resistance=1.0, iterations=80):
     '''Simulate an RC filter on a waveform::
 
@@ -468,15 +764,16 @@ def capacify(samples, capacitance, resistance=1.0, iterations=80):
     '''
     vc = None
     for sc in samples:
+        sc_samples = sc.scaled_samples()
         if vc is None: # Set initial conditions for capacitor voltage and charge
-            vc = sc.samples[0]
+            vc = float(sc_samples[0])
             q = vc * capacitance
 
         dt = sc.sample_period / iterations
         #print('# vc', vc, capacitance, q, vc * capacitance, dt)
-        filt = np.zeros((len(sc.samples),), dtype = np.float)
-        for j in xrange(len(sc.samples)):
-            sample_v = sc.samples[j]
+        filt = np.zeros((len(sc_samples),), dtype = sc_samples.dtype)
+        for j in xrange(len(sc_samples)):
+            sample_v = float(sc_samples[j])
             for _ in xrange(iterations):
                 i = (sample_v - vc) / resistance # Capacitor current
 
@@ -514,11 +811,13 @@ def sum_streams(stream1, stream2):
         if c1 is None or c2 is None:
             break
 
-        if len(c1.samples) != len(c2.samples):
-            size = min(len(c1.samples), len(c2.samples))
-            filt = c1.samples[:size] + c2.samples[:size]
+        s1 = c1.scaled_samples()
+        s2 = c2.scaled_samples()
+        if len(s1) != len(s2):
+            size = min(len(s1), len(s2))
+            filt = s1[:size] + s2[:size]
         else:
-            filt = c1.samples + c2.samples
+            filt = s1 + s2
 
         yield SampleChunk(filt, c1.start_time, c1.sample_period)
 
@@ -544,7 +843,8 @@ def chain(stream_gap_time, *streams):
     for stream in streams:
         for sc in stream:
             sc_end_time = sc.start_time + offset + len(sc.samples) * sc.sample_period
-            yield SampleChunk(np.copy(sc.samples), sc.start_time + offset, sc.sample_period)
+            yield SampleChunk(np.copy(sc.samples), sc.start_time + offset, sc.sample_period, \
+                sc.scale, sc.offset)
 
         offset = sc_end_time + stream_gap_time
 
@@ -21,12 +21,15 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
 
-from __future__ import print_function, division
+from __future__ import print_function, division, absolute_import
 
 from ripyl.util.enum import Enum
 from ripyl.util.eng import eng_si
 import string
 import math
+import itertools
+import collections
+import numpy as np
 
 
 class StreamType(Enum):
@@ -41,6 +44,70 @@ class SampleChunk(object):
     This represents a "chunk" of samples contained in a numpy array
     stored in the samples attribute.
 
+    The samples can be of any numeric dtype. Raw digitizer codes can be kept
+    in a compact integer array with the scale and offset attributes converting
+    them to physical values: value = samples * scale + offset.
+
+    '''
+    def __init__(self, samples, start_time, sample_period, scale=1.0, offset=0.0):
+        self.samples = samples
+        self.start_time = start_time
+        self.sample_period = sample_period
+        self.scale = scale
+        self.offset = offset
+
+    @property
+    def is_scaled(self):
+        '''True when the samples need conversion to physical values'''
+        return self.scale != 1.0 or self.offset != 0.0 or self.samples.dtype.kind != 'f'
+
+    def scaled_samples(self):
+        '''Get the samples as physical values
+
+        Returns a numpy array of float. The samples array is returned unchanged
+          if it is already floating point with no scale or offset.
+        '''
+        if not self.is_scaled:
+            return self.samples
+
+        dtype = processing_dtype(self.samples.dtype)
+        scaled = self.samples.astype(dtype)
+        if self.scale != 1.0:
+            scaled *= self.scale
+        if self.offset != 0.0:
+            scaled += self.offset
+
+        return scaled
+
+
+def processing_dtype(dtype):
+    '''Select the floating point type used to process samples
+
+    Samples that can be represented exactly in single precision (float32 and
+    integer codes of 16-bits or less) are processed as float32. Everything
+    else is processed as float64.
+
+    dtype (numpy dtype)
+        The dtype of a sample array
+
+    Returns a numpy dtype.
+    '''
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.dtype(np.float32) if dtype.itemsize <= 4 else dtype
+    elif dtype.kind in 'uib' and dtype.itemsize <= 2:
+        return np.dtype(np.float32)
+    else:
+        return np.dtype(np.float64)
+
+
+class PackedSampleChunk(object):
+    '''Packed digital sample stream object
+
+    This represents a "chunk" of digital samples from multiple channels.
+    The samples attribute is a numpy array of unsigned integer words with one
+    bit for each channel.
+
     '''
     def __init__(self, samples, start_time, sample_period):
         self.samples = samples
@@ -381,9 +448,11 @@ def load_stream(fh):
         File to load records from. If a file handle is passed it should have been opened
         in 'rb' mode. If a string is passed it is the name of a file to read from.
         
-    Returns a list of StreamRecord objects
+    Returns a list of StreamRecord objects. Files written by save_indexed_stream()
+      are also accepted. Handles that can't seek are read to their end.
     '''
     import pickle
+    import io
     opened_file = False
     try:
         if len(fh) > 0:
@@ -394,18 +463,260 @@ def load_stream(fh):
         pass
 
     try:
-        records = pickle.load(fh)
+        try:
+            start_pos = fh.tell()
+        except (IOError, OSError, AttributeError): # Pipes and sockets
+            fh = io.BytesIO(fh.read())
+            start_pos = 0
+
+        # Check for an indexed stream file
+        is_indexed = fh.read(len(_INDEXED_STREAM_MAGIC)) == _INDEXED_STREAM_MAGIC
+        fh.seek(start_pos)
+        if is_indexed:
+            records = list(IndexedStream(fh))
+        else:
+            records = pickle.load(fh)
     finally:
         if opened_file:
             fh.close()
-        
+
     return records
-    
+
+
+_INDEXED_STREAM_MAGIC = b'RIPYLIDX'
+_INDEXED_STREAM_VERSION = 1
+
+def _record_bounds(rec):
+    '''Get the time span of a StreamRecord
+
+    Returns a (start, end) tuple or None if the record has no time marker.
+    '''
+    try:
+        return (rec.start_time, rec.end_time) # StreamSegment
+    except AttributeError:
+        try:
+            return (rec.time, rec.time) # StreamEvent
+        except AttributeError: # No time marker
+            return None
+
+
+def save_indexed_stream(records, fh, block_size=256):
+    '''Save a stream of StreamRecord objects to a file with a time index
+
+    The records are pickled in independent blocks of block_size records. A sparse
+    index of the time span covered by each block is appended after the last block
+    and its location is written into the header. An IndexedStream object can use
+    this index to retrieve the records from a time range without deserializing the
+    entire file. All offsets are relative to the start of the stream so it can be
+    embedded in a larger file.
+
+    records (iterable of StreamRecord)
+        The StreamRecord objects to save. Unlike save_stream() this can be an iterator.
+        Queries are most efficient when the records are in chronological order.
+
+    fh (file-like object or a string)
+        File to save records to. If a file handle is passed it should have been
+        opened in 'wb' mode and must be seekable. If a string is passed it is the
+        name of a file to write to.
+
+    block_size (int)
+        The number of records in each indexed block. Smaller blocks reduce the number
+        of extraneous records deserialized by a query at the expense of a larger index.
+
+    Raises ValueError if block_size is less than 1.
+    Raises StreamError if a record has no time marker. Such records couldn't
+      be found by a time range query.
+    '''
+    import pickle
+    import struct
+
+    if block_size < 1:
+        raise ValueError('block_size must be at least 1')
+
+    opened_file = False
+    try:
+        if len(fh) > 0:
+            fh = open(fh, 'wb')
+            opened_file = True
+    except TypeError:
+        # fh isn't a string. Assume to be an already open handle
+        pass
+
+    def write_block(bounds, block):
+        offset = fh.tell() - start_pos
+        pickle.dump((bounds, block), fh, -1)
+        min_start = min(b[0] for b in bounds)
+        max_end = max(b[1] for b in bounds)
+        return (offset, len(block), min_start, max_end)
+
+    try:
+        start_pos = fh.tell()
+        fh.write(_INDEXED_STREAM_MAGIC)
+        fh.write(struct.pack('<Q', 0)) # Placeholder for the index offset
+
+        index = []
+        bounds = []
+        block = []
+        for r in records:
+            rb = _record_bounds(r)
+            if rb is None:
+                raise StreamError('Record has no time marker: {}'.format(repr(r)))
+
+            bounds.append(rb)
+            block.append(r)
+            if len(block) >= block_size:
+                index.append(write_block(bounds, block))
+                bounds = []
+                block = []
+
+        if len(block) > 0:
+            index.append(write_block(bounds, block))
+
+        index_offset = fh.tell() - start_pos
+        pickle.dump({'version': _INDEXED_STREAM_VERSION, 'blocks': index}, fh, -1)
+        end_pos = fh.tell()
+
+        fh.seek(start_pos + len(_INDEXED_STREAM_MAGIC))
+        fh.write(struct.pack('<Q', index_offset))
+        fh.seek(end_pos)
+
+    finally:
+        if opened_file:
+            fh.close()
+
+
+class IndexedStream(object):
+    '''Random access to a file written by save_indexed_stream()
+
+    The block index is loaded when the object is created. Records are only
+    deserialized for the blocks that overlap a query.
+    '''
+    def __init__(self, fh):
+        '''
+        fh (file-like object or a string)
+            File to load records from. If a file handle is passed it should have been opened
+            in 'rb' mode and must be seekable. If a string is passed it is the name of a file to read from.
+
+        Raises StreamError if the file is not an indexed stream.
+        '''
+        import pickle
+        import struct
+
+        self._opened_file = False
+        try:
+            if len(fh) > 0:
+                fh = open(fh, 'rb')
+                self._opened_file = True
+        except TypeError:
+            # fh isn't a string assume to be an already open handle
+            pass
+
+        self.fh = fh
+        self._base_pos = fh.tell()
+
+        if fh.read(len(_INDEXED_STREAM_MAGIC)) != _INDEXED_STREAM_MAGIC:
+            self.close()
+            raise StreamError('Not an indexed stream file')
+
+        index_offset = struct.unpack('<Q', fh.read(8))[0]
+        fh.seek(self._base_pos + index_offset)
+        index = pickle.load(fh)
+
+        if index['version'] != _INDEXED_STREAM_VERSION:
+            self.close()
+            raise StreamError('Unsupported indexed stream version: {}'.format(index['version']))
+
+        self.blocks = index['blocks']
+
+        # Construct monotonic envelopes of the block time spans so that they can
+        # be searched with a bisection. These are exact for records in chronological order.
+        # The "hi" envelope is the running max of block end times from the start of the file.
+        # The "lo" envelope is the running min of block start times from the end of the file.
+        self._hi_env = []
+        hi = float('-inf')
+        for b in self.blocks:
+            hi = max(hi, b[3])
+            self._hi_env.append(hi)
+
+        self._lo_env = [0.0] * len(self.blocks)
+        lo = float('inf')
+        for i in xrange(len(self.blocks)-1, -1, -1):
+            lo = min(lo, self.blocks[i][2])
+            self._lo_env[i] = lo
+
+    def __len__(self):
+        return sum(b[1] for b in self.blocks)
+
+    def __iter__(self):
+        for i in xrange(len(self.blocks)):
+            for r in self._read_block(i)[1]:
+                yield r
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Close the file if it was opened by this object'''
+        if self._opened_file:
+            self.fh.close()
+            self._opened_file = False
+
+    def _read_block(self, block_ix):
+        '''Deserialize a block of records'''
+        import pickle
+
+        self.fh.seek(self._base_pos + self.blocks[block_ix][0])
+        return pickle.load(self.fh)
+
+    def time_span(self):
+        '''Returns a (start, end) tuple for the time covered by the records
+          or None if there are no records.'''
+        if len(self.blocks) == 0:
+            return None
+
+        return (self._lo_env[0], self._hi_env[-1])
+
+    def query(self, t0, t1):
+        '''Retrieve all records that overlap a time range
+
+        t0 (float)
+            Start of the time range
+
+        t1 (float)
+            End of the time range
+
+        Returns a list of StreamRecord objects with a time span that intersects
+          the closed interval [t0, t1]. Records are returned in their saved order.
+        '''
+        import bisect
+
+        # The first block that could end on or after t0
+        first_ix = bisect.bisect_left(self._hi_env, t0)
+        # One past the last block that could start on or before t1
+        last_ix = bisect.bisect_right(self._lo_env, t1)
+
+        matches = []
+        for i in xrange(first_ix, last_ix):
+            b = self.blocks[i]
+            if b[3] < t0 or b[2] > t1: # No overlap with this block
+                continue
+
+            bounds, records = self._read_block(i)
+            matches.extend(r for rb, r in zip(bounds, records) if rb[1] >= t0 and rb[0] <= t1)
+
+        return matches
+
+
     
 def merge_streams(records_a, records_b, id_a=0, id_b=1):
     ''' Combine two streams of StreamRecord objects.
     Records with time signatures from each input stream are kept in chronological order.
-        
+
+    This is a special case of merge_many_streams().
+
     records_a (StreamRecord)
         Source records from stream a
         
@@ -420,78 +731,175 @@ def merge_streams(records_a, records_b, id_a=0, id_b=1):
         
     Yields a stream of StreamRecord objects.
     '''
-            
-    cur_ra = None
-    cur_rb = None
-    
-    while True:
-        if cur_ra is None: # Get next record a
-            try:
-                cur_ra = next(records_a)
-            except StopIteration:
-                # Nothing left to merge
-                if cur_rb is not None:
-                    cur_rb.stream_id = id_b
-                    yield cur_rb
-                    
-                for r in records_b:
-                    r.stream_id = id_b
-                    yield r
-                break
+    return merge_many_streams((records_a, records_b), (id_a, id_b))
+
+
+def merge_many_streams(record_streams, stream_ids=None):
+    '''Combine any number of StreamRecord streams.
+    Records with time signatures from each input stream are kept in chronological order.
+
+    This is a generator function. The streams are merged lazily with a heap holding
+    the next pending record from each input so memory use is bounded by the number
+    of streams. Records without a time marker are passed through as soon as they
+    are pulled from their stream. Records with identical times are ordered by their
+    position in record_streams.
+
+    record_streams (sequence of iterables containing StreamRecord objects)
+        The streams to merge. Each stream must be in chronological order.
+
+    stream_ids (sequence of int or None)
+        The stream_id assigned to records from each stream. If None, the ids are
+        the index of each stream in record_streams.
+
+    Yields a stream of StreamRecord objects.
+
+    Raises ValueError if stream_ids is not the same length as record_streams.
+    '''
+    import heapq
+
+    streams = [iter(rs) for rs in record_streams]
+
+    if stream_ids is None:
+        stream_ids = range(len(streams))
+    elif len(stream_ids) != len(streams):
+        raise ValueError('stream_ids must have the same length as record_streams')
+
+    # Heap entries are (time, stream index, record). The stream index is unique
+    # among the entries so the records themselves are never compared.
+    pending = []
+    for i, s in enumerate(streams):
+        for r in s:
+            r.stream_id = stream_ids[i]
+            rb = _record_bounds(r)
+            if rb is None: # No time marker
+                yield r
+                continue
+
+            pending.append((rb[0], i, r))
+            break
+
+    heapq.heapify(pending)
+
+    while pending:
+        _, i, r = pending[0]
+        yield r
+
+        # Replace the yielded record with the next one from the same stream
+        for nr in streams[i]:
+            nr.stream_id = stream_ids[i]
+            rb = _record_bounds(nr)
+            if rb is None: # No time marker
+                yield nr
+                continue
+
+            heapq.heapreplace(pending, (rb[0], i, nr))
+            break
+        else: # Stream is exhausted
+            heapq.heappop(pending)
+
+
+class LookaheadStream(object):
+    '''Peekable stream with a bounded lookahead buffer
+
+    This supports the common pattern of examining the first items of a stream
+    (to detect a symbol rate, logic levels, etc.) before processing the whole
+    stream. It replaces the use of itertools.tee() for this purpose. Memory use
+    is capped at max_lookahead buffered items no matter how the stream is used.
+
+    Once the lookahead is complete, :meth:`release` returns an iterator over the
+    buffered items followed by the rest of the stream. That iterator has no
+    Python level overhead per item.
+
+      >>> la = LookaheadStream(edges)
+      >>> rate = find_symbol_rate(iter(la.peek(50)))
+      >>> edges = la.release()
+
+    The object is also an iterator itself that consumes items from the buffer
+    before pulling new ones from the stream.
+    '''
+    def __init__(self, stream, max_lookahead=10000):
+        '''
+        stream (iterable)
+            The stream to look ahead into.
+
+        max_lookahead (int)
+            The maximum number of items that will be buffered.
+        '''
+        self._it = iter(stream)
+        self._buf = collections.deque()
+        self.max_lookahead = max_lookahead
+        self._released = False
+
+    def _check_released(self):
+        if self._released:
+            raise StreamError('LookaheadStream has been released')
+
+    def lookahead(self):
+        '''Iterate over upcoming items without consuming them
+
+        This is a generator function. Buffered items are yielded first and then new
+        items are pulled from the stream into the buffer. The generator stops when the
+        stream ends or the buffer holds max_lookahead items.
 
-        if cur_rb is None: # Get next record b
+        Yields items from the stream.
+        '''
+        self._check_released()
+
+        for item in list(self._buf):
+            yield item
+
+        buf = self._buf
+        while len(buf) < self.max_lookahead:
+            self._check_released()
             try:
-                cur_rb = next(records_b)
+                item = next(self._it)
             except StopIteration:
-                # Nothing left to merge
-                if cur_ra is not None:
-                    cur_ra.stream_id = id_a
-                    yield cur_ra
-
-                for r in records_a:
-                    r.stream_id = id_a
-                    yield r
                 break
+            buf.append(item)
+            yield item
 
-        # Find the time markers
-        try:
-            ra_time = cur_ra.start_time # StreamSegment
-        except AttributeError:
-            try:
-                ra_time = cur_ra.time # StreamEvent
-            except AttributeError: # No time marker
-                cur_ra.stream_id = id_a
-                yield cur_ra
-                cur_ra = None
-                continue
+    def peek(self, n=1):
+        '''Get upcoming items without consuming them
 
-        try:
-            rb_time = cur_rb.start_time # StreamSegment
-        except AttributeError:
-            try:
-                rb_time = cur_rb.time # StreamEvent
-            except AttributeError: # No time marker
-                cur_rb.stream_id = id_b
-                yield cur_rb
-                cur_rb = None
-                continue
+        n (int)
+            Number of items to look ahead.
 
-        # Determine record chronological order
-        if ra_time <= rb_time:
-            cur_ra.stream_id = id_a
-            yield cur_ra
-            cur_ra = None
-            
-        else:
-            cur_rb.stream_id = id_b
-            yield cur_rb
-            cur_rb = None
+        Returns a list of up to n items. Fewer are returned if the stream ends
+          or if n exceeds max_lookahead.
+        '''
+        return list(itertools.islice(self.lookahead(), n))
 
+    def release(self):
+        '''End the lookahead and get the remaining stream
+
+        The LookaheadStream can no longer be used after this is called.
+
+        Returns an iterator over the buffered items followed by the rest of the stream.
+        '''
+        self._check_released()
+        self._released = True
+        buf = list(self._buf)
+        self._buf.clear()
+        return itertools.chain(buf, self._it) if buf else self._it
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        self._check_released()
+        if self._buf:
+            return self._buf.popleft()
+        return next(self._it)
+
+    __next__ = next
 
-import numpy as np
 
 class ChunkExtractor(object):
-    '''Utility class that pulls arbitrarily sized chunks from a sample stream'''
+    '''Utility class that pulls arbitrarily sized chunks from a sample stream
+
+    The sample dtype, scale, and offset are taken from the first SampleChunk
+    in the stream. They are expected to remain constant for the entire stream.
+    '''
     def __init__(self, stream):
         self.stream = stream
         self.sample_buf = []
@@ -499,6 +907,9 @@ class ChunkExtractor(object):
         self.stream_ended = False
         self.buf_start_time = 0.0
         self.sample_period = 0.0
+        self.dtype = None
+        self.scale = 1.0
+        self.offset = 0.0
 
     def next_chunk(self, chunk_size=10000):
         '''Get a new chunk of samples from the stream
@@ -521,6 +932,10 @@ class ChunkExtractor(object):
                     if len(self.sample_buf) == 0:
                         self.buf_start_time = sc.start_time
                         self.sample_period = sc.sample_period
+                    if self.dtype is None:
+                        self.dtype = sc.samples.dtype
+                        self.scale = sc.scale
+                        self.offset = sc.offset
                     self.sample_buf.append(sc.samples)
                     self.buf_count += len(sc.samples)
 
@@ -535,7 +950,7 @@ class ChunkExtractor(object):
 
             if self.buf_count >= chunk_size:
                 # We have enough buffered samples to return a new chunk
-                out_samp = np.empty(chunk_size, dtype=float)
+                out_samp = np.empty(chunk_size, dtype=self.dtype)
                 out_count = 0
                 for b in self.sample_buf:
                     if out_count + len(b) <= chunk_size:
@@ -558,7 +973,7 @@ class ChunkExtractor(object):
                     self.sample_buf = []
                     self.buf_count = 0
 
-                return SampleChunk(out_samp, out_time, self.sample_period)
+                return SampleChunk(out_samp, out_time, self.sample_period, self.scale, self.offset)
 
             if self.stream_ended:
                 break
@@ -571,15 +986,16 @@ class ChunkExtractor(object):
         sample_count (int)
             The number of samples for the array.
 
-        Returns a numpy array of float. If the stream had fewer than sample_count samples
-          remaining then the array is sized to hold only those samples.
+        Returns a numpy array of float with the chunk scale and offset applied. If the stream
+          had fewer than sample_count samples remaining then the array is sized to hold only
+          those samples.
 
         Returns None if the stream has ended.
         '''
 
         sc = self.next_chunk(sample_count)
         if sc is not None:
-            return sc.samples
+            return sc.scaled_samples()
         else:
             return None
 
@@ -652,16 +1068,17 @@ def extract_all_samples(samples):
         The sample stream to extract samples from.
 
     Returns a tuple containing a numpy sample array of float, the start time,
-      and the sample period.
+      and the sample period. The chunk scale and offset are applied to the samples.
     '''
 
     chunk_buf = [s for s in samples]
     total_samples = sum(len(s.samples) for s in chunk_buf)
 
-    all_samples = np.empty(total_samples, dtype=float)
+    dtype = np.result_type(*[processing_dtype(s.samples.dtype) for s in chunk_buf])
+    all_samples = np.empty(total_samples, dtype=dtype)
     offset = 0
     for s in chunk_buf:
-        all_samples[offset:offset+len(s.samples)] = s.samples
+        all_samples[offset:offset+len(s.samples)] = s.scaled_samples()
         offset += len(s.samples)
 
     return all_samples, chunk_buf[0].start_time, chunk_buf[0].sample_period
@@ -680,7 +1097,8 @@ def sample_stream_to_samples(samples):
     
     
 
-def samples_to_sample_stream(raw_samples, sample_period, start_time=0.0, chunk_size=10000):
+def samples_to_sample_stream(raw_samples, sample_period, start_time=0.0, chunk_size=10000, \
+    dtype=float, scale=1.0, offset=0.0):
     '''Convert raw samples to a chunked sample stream
 
     This is a generator function that can be used in a pipeline of waveform
@@ -698,15 +1116,60 @@ def samples_to_sample_stream(raw_samples, sample_period, start_time=0.0, chunk_s
     chunk_size (int)
         The maximum number of samples for each chunk
 
+    dtype (numpy dtype or None)
+        The dtype for the chunk sample arrays. Use None to keep the dtype of raw_samples.
+        Smaller types such as float32 or int16 reduce memory use for large captures.
+
+    scale (float)
+        Scale factor converting raw_samples to physical values
+
+    offset (float)
+        Offset added to the scaled raw_samples to produce physical values
+
     Yields a series of SampleChunk objects representing the time and
       sample value for each input sample. This can be fed to functions
       that expect a chunked sample stream as input.
     '''
     t = start_time
     for i in xrange(0, len(raw_samples), chunk_size):
-        chunk = np.asarray(raw_samples[i:i + chunk_size], dtype=float)
-        sc = SampleChunk(chunk, t, sample_period)
+        chunk = np.asarray(raw_samples[i:i + chunk_size], dtype=dtype)
+        sc = SampleChunk(chunk, t, sample_period, scale, offset)
 
         yield sc
         t += sample_period * len(chunk)
 
+
+def packed_samples_to_stream(raw_words, sample_period, start_time=0.0, chunk_size=10000, dtype=np.uint8):
+    '''Convert raw packed digital samples to a chunked packed sample stream
+
+    This is a generator function that can be used in a pipeline of waveform
+    procesing operations. The output is suitable for decode.find_packed_edges()
+    and decode.packed_edge_streams().
+
+    raw_words (sequence of int)
+        The packed samples to convert. Each bit of a word is the logic state of one
+        channel at the sample time.
+
+    sample_period (float)
+        The time interval between samples
+
+    start_time (float)
+        The time for the first sample
+
+    chunk_size (int)
+        The maximum number of samples for each chunk
+
+    dtype (numpy dtype)
+        The unsigned integer type used for the packed words. This is ignored if
+        raw_words is already a numpy array of integers.
+
+    Yields a series of PackedSampleChunk objects.
+    '''
+    if isinstance(raw_words, np.ndarray) and raw_words.dtype.kind in 'ui':
+        dtype = raw_words.dtype
+
+    t = start_time
+    for i in xrange(0, len(raw_words), chunk_size):
+        chunk = np.asarray(raw_words[i:i + chunk_size], dtype=dtype)
+        yield PackedSampleChunk(chunk, t, sample_period)
+        t += sample_period * len(chunk)
@@ -6,3 +6,7 @@ import ripyl.util.enum
 import ripyl.util.bitops
 import ripyl.util.stats
 
+# Modules with heavy dependencies are imported on first access
+from ripyl.util.lazy import lazy_package
+
+lazy_package(__name__, ['color', 'eng', 'equality', 'plot', 'profiling'])
@@ -53,3 +53,73 @@ def join_bits(bits):
         word = (word << 1) | b
         
     return word
+
+
+def crc_table(poly, width):
+    '''Generate a byte-wise lookup table for an MSB-first CRC
+
+    poly (int)
+        The CRC polynomial without the implicit leading term.
+
+    width (int)
+        The number of bits in the CRC. Must be at least 8.
+
+    Returns a list of 256 ints.
+    '''
+    mask = (1 << width) - 1
+    top = 1 << (width - 1)
+
+    tbl = [0] * 256
+    for i in xrange(256):
+        sreg = i << (width - 8)
+        for _ in xrange(8):
+            if sreg & top:
+                sreg = ((sreg << 1) ^ poly) & mask
+            else:
+                sreg = (sreg << 1) & mask
+        tbl[i] = sreg
+
+    return tbl
+
+
+def table_crc_bits(d, tbl, poly, width, sreg):
+    '''Update an MSB-first CRC register with a sequence of bits
+
+    Whole bytes are processed with a lookup table from crc_table() and any
+    remaining bits are shifted in individually. The result is identical to
+    shifting each bit into the register.
+
+    d (sequence of int)
+        Array of integers representing 0 or 1 bits in transmission order
+
+    tbl (list of int)
+        Lookup table generated by crc_table().
+
+    poly (int)
+        The CRC polynomial used to generate tbl.
+
+    width (int)
+        The number of bits in the CRC.
+
+    sreg (int)
+        Initial register contents.
+
+    Returns the updated register as an int.
+    '''
+    mask = (1 << width) - 1
+    top_shift = width - 8
+
+    byte_bits = len(d) - len(d) % 8
+    for i in xrange(0, byte_bits, 8):
+        byte = (d[i] << 7) | (d[i+1] << 6) | (d[i+2] << 5) | (d[i+3] << 4) | \
+            (d[i+4] << 3) | (d[i+5] << 2) | (d[i+6] << 1) | d[i+7]
+        sreg = ((sreg << 8) & mask) ^ tbl[((sreg >> top_shift) ^ byte) & 0xFF]
+
+    top_shift = width - 1
+    for i in xrange(byte_bits, len(d)):
+        leftbit = (sreg >> top_shift) & 0x01
+        sreg = (sreg << 1) & mask
+        if d[i] != leftbit:
+            sreg ^= poly
+
+    return sreg
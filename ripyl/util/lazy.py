@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Deferred module imports
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    '''Stand-in for a module that is imported on first attribute access
+
+    This defers the cost of importing large dependencies like scipy.signal
+    until they are actually used.
+    '''
+    def __init__(self, name):
+        '''
+        name (string)
+            Full name of the module in dotted notation.
+        '''
+        types.ModuleType.__init__(self, name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        # Cache the attribute so later lookups don't go through the proxy
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return '<lazy module {!r} ({})>'.format(self.__name__, state)
+
+
+def lazy_import(name):
+    '''Import a module on first use
+
+    name (string)
+        Full name of the module in dotted notation.
+
+    Returns the module if it has already been imported or a LazyModule.
+    '''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    return LazyModule(name)
+
+
+class LazyPackage(types.ModuleType):
+    '''Package that imports its submodules on first attribute access'''
+    def __init__(self, package, submodules):
+        '''
+        package (module)
+            The package module to wrap.
+
+        submodules (sequence of string)
+            Names of the submodules that are loaded on demand.
+        '''
+        types.ModuleType.__init__(self, package.__name__, package.__doc__)
+        self.__dict__.update(package.__dict__)
+        # Python 2 clears the globals of a module when it is garbage collected.
+        # Keep a reference to the original so that its functions keep working.
+        self.__dict__['_lazy_package'] = package
+        self.__dict__['_lazy_submodules'] = frozenset(submodules)
+
+    def __getattr__(self, attr):
+        if attr in self.__dict__['_lazy_submodules']:
+            return importlib.import_module('.'.join((self.__name__, attr)))
+
+        raise AttributeError("'module' object has no attribute '{}'".format(attr))
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.iterkeys()) | self.__dict__['_lazy_submodules'])
+
+
+def lazy_package(name, submodules):
+    '''Replace a package with a LazyPackage
+
+    This is called from the __init__.py of the package.
+
+    name (string)
+        Name of the package (use __name__).
+
+    submodules (sequence of string)
+        Names of the submodules that are loaded on demand.
+    '''
+    package = sys.modules[name]
+    if not isinstance(package, LazyPackage):
+        sys.modules[name] = LazyPackage(package, submodules)
@@ -27,8 +27,12 @@ import numpy as np
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import string
 import re
+import bisect
+import multiprocessing
 
 import ripyl.streaming as stream
 
@@ -51,7 +55,8 @@ annotation_styles = {
     'check_bad': AnnotationStyle('red', 0.3),
     'ack_good': AnnotationStyle('#008F00', 0.3), # dark green
     'ack_bad': AnnotationStyle('red', 0.3),
-    'misc': AnnotationStyle('0.4', 0.3)
+    'misc': AnnotationStyle('0.4', 0.3),
+    'aggregate': AnnotationStyle('0.5', 0.2)
 }
 
 class LabelStyle(object):
@@ -75,12 +80,226 @@ label_styles = {
 # Color sequence for waveform traces (bottom to top)
 plot_colors = ('blue', 'red', 'green')
 
+
+class EnvelopePyramid(object):
+    '''Multi-resolution min/max envelope of a sample stream
+
+    The sample stream is consumed in a single pass. Each block of base_factor
+    samples is reduced to its minimum and maximum values. Successive levels
+    combine ratio blocks of the level below them. Plotting a time window
+    then only needs the envelope values from the level closest to the
+    display resolution rather than the full set of samples.
+
+    Short captures also keep their raw samples so that zoomed in windows
+    are drawn at full resolution.
+    '''
+    def __init__(self, samples, base_factor=16, ratio=4, raw_limit=1000000):
+        '''
+        samples (iterable of SampleChunk objects)
+            The sample stream to build the envelope from
+
+        base_factor (int)
+            The number of samples in each block of the finest level
+
+        ratio (int)
+            The number of blocks combined for each successive level
+
+        raw_limit (int)
+            The maximum number of raw samples to retain
+        '''
+        self.base_factor = base_factor
+        self.ratio = ratio
+        self.start_time = None
+        self.sample_period = None
+        self.sample_count = 0
+
+        mins = []
+        maxs = []
+        raw = []
+        leftover = None
+        for sc in samples:
+            chunk = sc.scaled_samples()
+            if self.start_time is None:
+                self.start_time = sc.start_time
+                self.sample_period = sc.sample_period
+
+            self.sample_count += len(chunk)
+            if raw is not None:
+                raw.append(np.array(chunk))
+                if self.sample_count > raw_limit: # Too large to keep
+                    raw = None
+            if leftover is not None and len(leftover) > 0:
+                chunk = np.concatenate((leftover, chunk))
+
+            full = len(chunk) // base_factor * base_factor
+            blocks = chunk[:full].reshape(-1, base_factor)
+            mins.append(blocks.min(axis=1))
+            maxs.append(blocks.max(axis=1))
+            leftover = np.array(chunk[full:])
+
+        if leftover is not None and len(leftover) > 0:
+            mins.append(np.array([leftover.min()]))
+            maxs.append(np.array([leftover.max()]))
+
+        if self.start_time is None:
+            raise stream.StreamError('Sample stream is empty')
+
+        self.raw = np.concatenate(raw) if raw is not None else None
+
+        # levels[0] is the finest resolution
+        self.levels = [(np.concatenate(mins), np.concatenate(maxs))]
+        while len(self.levels[-1][0]) > ratio:
+            l_mins, l_maxs = self.levels[-1]
+            ix = np.arange(0, len(l_mins), ratio)
+            self.levels.append((np.minimum.reduceat(l_mins, ix), np.maximum.reduceat(l_maxs, ix)))
+
+    @property
+    def end_time(self):
+        '''Time following the last sample'''
+        return self.start_time + self.sample_count * self.sample_period
+
+    def block_size(self, level):
+        '''The number of samples represented by each envelope value in a level'''
+        return self.base_factor * self.ratio ** level
+
+    def bounds(self):
+        '''Get the minimum and maximum sample values
+
+        Returns a pair of float.
+        '''
+        l_mins, l_maxs = self.levels[-1]
+        return (l_mins.min(), l_maxs.max())
+
+    def envelope(self, t0, t1, width):
+        '''Get the envelope for a time window
+
+        t0 (float)
+            Start time of the window
+
+        t1 (float)
+            End time of the window
+
+        width (int)
+            The maximum number of envelope points to return. This is
+            typically the width of the plot in pixels.
+
+        Returns a tuple of (time, minimums, maximums) numpy arrays. Each
+          time marks the start of the span covered by the corresponding
+          minimum and maximum.
+        '''
+        t0 = max(t0, self.start_time)
+        t1 = min(t1, self.end_time)
+        width = max(int(width), 1)
+        window_samples = max((t1 - t0) / self.sample_period, 0.0)
+
+        # Pick the coarsest level that still resolves the requested width
+        level = 0
+        while level + 1 < len(self.levels) and window_samples / self.block_size(level + 1) >= width:
+            level += 1
+
+        if level == 0 and self.raw is not None and window_samples / self.base_factor < width:
+            # Use the raw samples
+            block = 1
+            l_mins = l_maxs = self.raw
+        else:
+            block = self.block_size(level)
+            l_mins, l_maxs = self.levels[level]
+
+        block_period = block * self.sample_period
+        ix0 = max(int((t0 - self.start_time) / block_period), 0)
+        ix1 = min(int(np.ceil((t1 - self.start_time) / block_period)), len(l_mins))
+        ix1 = max(ix1, ix0 + 1)
+
+        mins = l_mins[ix0:ix1]
+        maxs = l_maxs[ix0:ix1]
+
+        group = 1
+        if len(mins) > width: # Merge blocks to fit the width
+            group = (len(mins) + width - 1) // width
+            ix = np.arange(0, len(mins), group)
+            mins = np.minimum.reduceat(mins, ix)
+            maxs = np.maximum.reduceat(maxs, ix)
+
+        t = self.start_time + (ix0 + np.arange(len(mins)) * group) * block_period
+
+        return (t, mins, maxs)
+
+
+class _RecordIndex(object):
+    '''Sorted index of annotation records for time range culling'''
+    def __init__(self, records):
+        self.records = sorted((a for a in records if isinstance(a, stream.StreamRecord) and \
+            hasattr(a, 'start_time')), key=lambda a: a.start_time)
+        self.starts = [a.start_time for a in self.records]
+
+        # Running maximum of the end times. This is monotonic even when records overlap.
+        self.max_ends = []
+        max_end = None
+        for a in self.records:
+            max_end = a.end_time if max_end is None else max(max_end, a.end_time)
+            self.max_ends.append(max_end)
+
+    def query(self, t0, t1):
+        '''Get the records that overlap the time range t0 to t1'''
+        lo = bisect.bisect_right(self.max_ends, t0)
+        hi = bisect.bisect_left(self.starts, t1)
+        return [a for a in self.records[lo:hi] if a.end_time > t0]
+
+
+def _group_dense_records(records, min_span):
+    '''Collapse runs of records narrower than min_span
+
+    Returns a list containing StreamRecord objects and (start, end, count)
+      tuples for each collapsed run.
+    '''
+    groups = []
+    run = None
+    for a in records:
+        if a.end_time - a.start_time < min_span:
+            if run is not None and a.start_time - run[1] <= min_span:
+                run[1] = max(run[1], a.end_time)
+                run[2] += 1
+                continue
+
+            if run is not None:
+                groups.append(run[3] if run[2] == 1 else tuple(run[:3]))
+            run = [a.start_time, a.end_time, 1, a]
+
+        else:
+            if run is not None:
+                groups.append(run[3] if run[2] == 1 else tuple(run[:3]))
+                run = None
+            groups.append(a)
+
+    if run is not None:
+        groups.append(run[3] if run[2] == 1 else tuple(run[:3]))
+
+    return groups
+
+
 class Plotter(object):
     '''Manage annotated waveform plotting'''
-    def __init__(self):
+
+    # Annotations narrower than this many pixels are collapsed or culled
+    min_annotation_px = 3
+
+    def __init__(self, headless=False):
+        '''
+        headless (bool)
+            Render with a private Agg canvas instead of a pyplot figure. Headless
+            plotters do not touch the pyplot global state and can be used from
+            worker threads and processes. They can only be saved to a file.
+        '''
+        self.headless = headless
         self.fig = None
         self.axes = None
         self.data_ix = 0
+        self.envelopes = {}
+        self.traces = {}
+        self.ann_index = None
+        self.ann_layout = None
+        self.ann_artists = []
+        self.max_artists = 2000
 
     def waveform_bounds(self, raw_samples):
         '''Retrieve the y-axis boundaries for annotation elements'''
@@ -102,10 +321,14 @@ class Plotter(object):
         return bounds
 
     def plot(self, channels, annotations=None, title='', label_format=stream.AnnotationFormat.Int, show_names=False, \
-            ylim=None, xlim=None):
+            ylim=None, xlim=None, max_artists=2000):
         '''Plot annotated waveform data
 
-        channels (dict of string:sample stream)
+        Only the annotations within the visible time window are drawn. Runs of
+        records that are too narrow to display are collapsed into a single box
+        labeled with the number of records it contains.
+
+        channels (dict of string:sample stream or EnvelopePyramid)
             A dict of waveform sample data keyed by the string label
             used for each channel's vertical axis.
 
@@ -128,16 +351,25 @@ class Plotter(object):
         xlim (pair of float or None)
             Set lower and upper bound for the x-axis
 
+        max_artists (int)
+            The maximum number of annotation patches and labels to draw
         '''
 
-        # Get raw samples and time vectors from channel streams
-        vectors = {}
+        # Reduce each channel stream to a min/max envelope pyramid.
+        # Only the envelope for the visible window is handed to matplotlib.
+        self.envelopes = {}
         for k in channels.keys():
-            wf, start_time, sample_period = stream.extract_all_samples(channels[k])
-            t = np.arange(start_time, start_time + len(wf) * sample_period - (sample_period / 2), sample_period)
-            vectors[k] = (wf, t)
+            if isinstance(channels[k], EnvelopePyramid):
+                self.envelopes[k] = channels[k]
+            else:
+                self.envelopes[k] = EnvelopePyramid(channels[k])
 
-        self.fig, self.axes = plt.subplots(len(channels), 1, sharex=True, sharey=True)
+        if self.headless:
+            self.fig = Figure()
+            FigureCanvasAgg(self.fig)
+            self.axes = self.fig.subplots(len(channels), 1, sharex=True, sharey=True)
+        else:
+            self.fig, self.axes = plt.subplots(len(channels), 1, sharex=True, sharey=True)
 
         if not hasattr(self.axes, '__len__'):
             self.axes = (self.axes,)
@@ -145,11 +377,11 @@ class Plotter(object):
         #print('$$$ axes:', self.axes)
 
         # Plot waveforms
+        self.traces = {}
         for i, (ax, k) in enumerate(zip(self.axes, channels.keys())):
             color_ix = (i - len(self.axes) + 1) % len(plot_colors)
             color = plot_colors[color_ix]
-            #print('### plotting:', color, len(vectors[k][1]), len(vectors[k][0]))
-            ax.plot(vectors[k][1], vectors[k][0], color=color)
+            self.traces[k], = ax.plot([], [], color=color)
             ax.set_ylabel(k)
 
         self.axes[0].set_title(title)
@@ -160,7 +392,7 @@ class Plotter(object):
         ann_chan = channels.keys()[-1]
         ann_ax = self.axes[-1]
 
-        ann_b = self.waveform_bounds(vectors[ann_chan][0])
+        ann_b = self.waveform_bounds(self.envelopes[ann_chan].bounds())
         text_ypos = (ann_b['max'] + ann_b['ovl_top']) / 2.0 #FIX: this needs to be more adaptable
 
         if show_names:
@@ -174,22 +406,23 @@ class Plotter(object):
             self.axes[-1].set_ylim(ylim[0], ylim[1])
 
         if xlim is None:
-            self.axes[-1].set_xlim(vectors[ann_chan][1][0], vectors[ann_chan][1][-1])
+            ann_env = self.envelopes[ann_chan]
+            self.axes[-1].set_xlim(ann_env.start_time, ann_env.end_time - ann_env.sample_period)
         else:
             self.axes[-1].set_xlim(xlim[0], xlim[1])
 
+        if annotations is None or isinstance(annotations, _RecordIndex):
+            self.ann_index = annotations
+        else:
+            self.ann_index = _RecordIndex(annotations)
+        self.ann_layout = (ann_b, ann_ax, text_ypos, label_format, name_ypos)
+        self.ann_artists = []
+        self.max_artists = max_artists
 
-
-        if annotations is not None:
-            for a in annotations:
-                if not isinstance(a, stream.StreamRecord):
-                    continue
-
-                self.data_ix = 0
-                self._plot_patches(a, ann_b, ann_ax)
-
-                # Draw annotation text
-                self._draw_text(a, text_ypos, ann_ax, label_format, name_ypos)
+        self._update_view()
+        # Recompute the envelopes and annotations when zooming or panning. The x-axis
+        # is shared so only the reference axis needs the callback.
+        self.axes[-1].callbacks.connect('xlim_changed', self._update_view)
 
         self.fig.tight_layout()
         self.fig.subplots_adjust(bottom=0.12)
@@ -198,7 +431,7 @@ class Plotter(object):
 
     def show(self):
         '''Show the result of plot() in an interactive window'''
-        if self.fig is not None:
+        if self.fig is not None and not self.headless:
             plt.show()
 
     def save_plot(self, fname, figsize=None):
@@ -213,15 +446,84 @@ class Plotter(object):
         if self.fig is not None:
             if figsize is not None:
                 self.fig.set_size_inches(figsize)
+                self._update_view()
             self.fig.savefig(fname)
 
+    def _update_view(self, _ax=None):
+        '''Redraw traces and annotations for the current x-axis window'''
+        if self.fig is None:
+            return
+
+        self._update_traces()
+        self._update_annotations()
+
+    def _update_traces(self):
+        '''Set the waveform traces to the envelopes for the current x-axis window'''
+
+        t0, t1 = self.axes[-1].get_xlim()
+        width = int(self.fig.get_size_inches()[0] * self.fig.dpi)
+
+        for k, trace in self.traces.iteritems():
+            t, mins, maxs = self.envelopes[k].envelope(t0, t1, width)
+
+            # Each envelope point is drawn as a vertical span from min to max
+            trace.set_data(np.repeat(t, 2), np.column_stack((mins, maxs)).ravel())
 
-    def _plot_patches(self, a, ann_b, ann_ax):
+    def _update_annotations(self):
+        '''Draw the annotations visible in the current x-axis window'''
+        for artist in self.ann_artists:
+            artist.remove()
+        self.ann_artists = []
+
+        if self.ann_index is None:
+            return
+
+        ann_b, ann_ax, text_ypos, label_format, name_ypos = self.ann_layout
+
+        t0, t1 = self.axes[-1].get_xlim()
+        width = int(self.fig.get_size_inches()[0] * self.fig.dpi)
+        min_span = self.min_annotation_px * (t1 - t0) / width
+
+        for a in _group_dense_records(self.ann_index.query(t0, t1), min_span):
+            if len(self.ann_artists) >= self.max_artists:
+                break
+
+            if isinstance(a, tuple):
+                self._draw_aggregate(a, ann_b, ann_ax, text_ypos, min_span)
+                continue
+
+            self.data_ix = 0
+            self._plot_patches(a, ann_b, ann_ax, min_span)
+
+            # Draw annotation text
+            self._draw_text(a, text_ypos, ann_ax, label_format, name_ypos, min_span)
+
+    def _draw_aggregate(self, group, ann_b, ann_ax, text_ypos, min_span):
+        '''Draw a box representing a collapsed run of annotations'''
+        start, end, count = group
+        bot = ann_b['ovl_bot']
+        style = annotation_styles['aggregate']
+        p_rect = patches.Rectangle((start, bot), end - start, ann_b['ovl_top'] - bot, \
+            facecolor=style.color, alpha=style.alpha)
+        ann_ax.add_patch(p_rect)
+        self.ann_artists.append(p_rect)
+
+        label = '{} frames'.format(count)
+        if end - start >= min_span * len(label): # Room for the label
+            ls = label_styles['small']
+            self.ann_artists.append(ann_ax.text((start + end) / 2.0, text_ypos, label, \
+                size=ls.size, ha='center', color=ls.color))
+
+
+    def _plot_patches(self, a, ann_b, ann_ax, min_span=0.0):
         '''Recursively generate colored rectangles for annotations'''
 
         if not hasattr(a, 'start_time'): # Not a stream segment
             return
 
+        if len(self.ann_artists) >= self.max_artists:
+            return
+
         if a.data_format != stream.AnnotationFormat.Invisible:
             p_start = a.start_time
             p_end = a.end_time
@@ -250,6 +552,7 @@ class Plotter(object):
 
             p_rect = patches.Rectangle((p_start, bot), width, height, facecolor=color, alpha=alpha)
             ann_ax.add_patch(p_rect)
+            self.ann_artists.append(p_rect)
 
         inset_b = ann_b.copy()
         span = inset_b['max'] - inset_b['min']
@@ -259,11 +562,19 @@ class Plotter(object):
         #print('$$$$ overlay:', ann_b['ovl_top'], inset_b['ovl_top'], ann_b['i_ovl_top'])
 
         for sr in a.subrecords:
-            self._plot_patches(sr, inset_b, ann_ax)
+            if hasattr(sr, 'start_time') and sr.end_time - sr.start_time < min_span:
+                continue # Too small to see
+            self._plot_patches(sr, inset_b, ann_ax, min_span)
 
 
-    def _draw_text(self, a, text_ypos, ann_ax, label_format, name_ypos=None):
+    def _draw_text(self, a, text_ypos, ann_ax, label_format, name_ypos=None, min_span=0.0):
         '''Recursively generate text labels'''
+        if not hasattr(a, 'start_time') or a.end_time - a.start_time < min_span:
+            return
+
+        if len(self.ann_artists) >= self.max_artists:
+            return
+
         if 'value' in a.fields:
             label = a.fields['value']
         else:
@@ -307,9 +618,9 @@ class Plotter(object):
 
             weight = 'bold' if ls.bold else 'normal'
             style = 'italic' if ls.italic else 'normal'
-            ann_ax.text((a.start_time + a.end_time) / 2.0, text_ypos, label, \
+            self.ann_artists.append(ann_ax.text((a.start_time + a.end_time) / 2.0, text_ypos, label, \
                 size=ls.size, ha='center', color=ls.color, rotation=ls.angle, \
-                weight=weight, style=style)
+                weight=weight, style=style))
 
             if name_ypos:
                 try:
@@ -318,14 +629,94 @@ class Plotter(object):
                     name = a.kind
 
                 if len(name) > 0:
-                    ann_ax.text((a.start_time + a.end_time) / 2.0, name_ypos, name, \
-                        size='small', ha='center', color='0.4')
+                    self.ann_artists.append(ann_ax.text((a.start_time + a.end_time) / 2.0, name_ypos, name, \
+                        size='small', ha='center', color='0.4'))
         
 
         for sr in a.subrecords:
-            self._draw_text(sr, text_ypos, ann_ax, label_format, name_ypos)
+            self._draw_text(sr, text_ypos, ann_ax, label_format, name_ypos, min_span)
 
 based_literal = re.compile('^(\d{1,2})#([^#]+)#$')
 
 
 
+def render_windows(channels, windows, fnames, annotations=None, processes=None, figsize=(8.0, 4.0), **plot_args):
+    '''Render time windows of a capture to image files in parallel
+
+    The channel streams are consumed once to build an EnvelopePyramid for
+    each channel. The windows are then rendered with headless Plotter objects
+    on a pool of worker processes.
+
+    channels (dict of string:sample stream)
+        A dict of waveform sample data keyed by the string label
+        used for each channel's vertical axis. Use an OrderedDict to
+        control the order of the channels.
+
+    windows (sequence of (float, float))
+        The (t0, t1) time windows to render
+
+    fnames (sequence of string)
+        The image file name for each window. The image format is taken
+        from the file extension.
+
+    annotations (sequence of StreamRecord or None)
+        The annotation data produced by a protocol decoder
+
+    processes (int or None)
+        The number of worker processes. None uses one per CPU. With 1 the
+        windows are rendered in the calling process.
+
+    figsize ((number,number))
+        The (x,y) dimensions of each image in inches
+
+    plot_args (keyword arguments)
+        Additional arguments passed to Plotter.plot()
+
+    Returns a list of the file names that were written.
+    '''
+    if len(windows) != len(fnames):
+        raise ValueError('Mismatched number of windows and file names')
+
+    envelopes = channels.__class__()
+    for k in channels.keys():
+        envelopes[k] = EnvelopePyramid(channels[k])
+
+    ann_index = _RecordIndex(annotations) if annotations is not None else None
+
+    jobs = [(w, f, figsize, plot_args) for w, f in zip(windows, fnames)]
+
+    if processes == 1:
+        _init_render_worker(envelopes, ann_index)
+        rendered = [_render_window(j) for j in jobs]
+
+    else:
+        # Workers inherit the envelopes from the initializer rather than
+        # receiving them with every job.
+        pool = multiprocessing.Pool(processes, _init_render_worker, (envelopes, ann_index))
+        try:
+            rendered = pool.map(_render_window, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    _init_render_worker(None, None)
+    return rendered
+
+
+# Capture data shared by the rendering workers
+_render_data = {}
+
+def _init_render_worker(envelopes, ann_index):
+    '''Set the capture data used by _render_window()'''
+    _render_data['envelopes'] = envelopes
+    _render_data['ann_index'] = ann_index
+
+def _render_window(job):
+    '''Render one window of the shared capture data to a file'''
+    window, fname, figsize, plot_args = job
+
+    plotter = Plotter(headless=True)
+    plotter.plot(_render_data['envelopes'], _render_data['ann_index'], xlim=window, **plot_args)
+    plotter.save_plot(fname, figsize)
+
+    return fname
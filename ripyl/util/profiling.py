@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Per-stage profiling of generator pipelines
+
+Ripyl processing is built from chains of generators where each stage pulls
+from the previous one. A :class:`PipelineProfiler` wraps each stage so that the
+amount of data passing through it and the time spent inside it are recorded:
+
+  >>> prof = PipelineProfiler()
+  >>> samples = prof.stage('synth', sigp.synth_wave(edges, 100.0e6, rise_time=1.0e-6))
+  >>> noisy = prof.stage('noisify', sigp.noisify(samples, snr_db=20.0))
+  >>> records = prof.stage('uart', uart.uart_decode(noisy, bits=8, baud_rate=115200))
+  >>> records = list(records)
+  >>> print(prof.report())
+
+The time for a stage is exclusive of the time spent in the wrapped stages
+upstream of it. A disabled profiler returns each stage unchanged so it can be
+left in place with no overhead.
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import timeit
+
+from ripyl.streaming import SampleChunk, PackedSampleChunk, StreamRecord
+
+
+class StageStats(object):
+    '''Statistics collected for one pipeline stage'''
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.samples = 0
+        self.edges = 0
+        self.records = 0
+        self.time = 0.0 # Exclusive time in seconds
+        self.total_time = 0.0 # Inclusive of upstream stages
+        self.finished = False
+
+    def rate(self, unit='items'):
+        '''Throughput of this stage
+
+        unit (string)
+            The attribute to compute the rate for ('items', 'samples', 'edges', or 'records').
+
+        Returns the number of units per second of exclusive time.
+        '''
+        return getattr(self, unit) / self.time if self.time > 0.0 else 0.0
+
+    def __repr__(self):
+        return 'StageStats({!r}, items={}, samples={}, edges={}, records={}, time={:g})'.format( \
+            self.name, self.items, self.samples, self.edges, self.records, self.time)
+
+
+def _count_samples(stats, item):
+    stats.samples += len(item.samples)
+
+def _count_edge(stats, item):
+    stats.edges += 1
+
+def _count_record(stats, item):
+    stats.records += 1
+
+def _count_nothing(stats, item):
+    pass
+
+def _item_counter(item):
+    '''Select the function that counts units for the items in a stream'''
+    if isinstance(item, (SampleChunk, PackedSampleChunk)):
+        return _count_samples
+    elif isinstance(item, StreamRecord):
+        return _count_record
+    elif isinstance(item, tuple) and len(item) == 2:
+        return _count_edge # Edge or multi-edge
+    else:
+        return _count_nothing
+
+
+def format_report(stages):
+    '''Format a table of stage statistics
+
+    stages (sequence of StageStats)
+        The statistics to report in the order they are listed.
+
+    Returns a string.
+    '''
+    total = sum(s.time for s in stages)
+    lines = ['{:<20} {:>9} {:>11} {:>9} {:>9} {:>11} {:>6}'.format('Stage', 'Items', 'Samples', \
+        'Edges', 'Records', 'Time (ms)', '%')]
+
+    for s in stages:
+        pct = 100.0 * s.time / total if total > 0.0 else 0.0
+        lines.append('{:<20} {:>9} {:>11} {:>9} {:>9} {:>11.3f} {:>6.1f}'.format(s.name[:20], s.items, \
+            s.samples, s.edges, s.records, s.time * 1.0e3, pct))
+
+    lines.append('{:<20} {:>53.3f}'.format('Total', total * 1.0e3))
+    return '\n'.join(lines)
+
+
+class PipelineProfiler(object):
+    '''Collect per-stage statistics for a chain of generators
+
+    The stages of a pipeline are wrapped with :meth:`stage` in the order that
+    they are constructed. Profiling is not thread safe. All of the wrapped stages
+    must be consumed from the same thread.
+    '''
+    def __init__(self, enabled=True, timer=None):
+        '''
+        enabled (bool)
+            When False the profiler does nothing and :meth:`stage` returns
+            its stream argument unchanged.
+
+        timer (function or None)
+            Function returning the current time in seconds. When None,
+            timeit.default_timer is used.
+        '''
+        self.enabled = enabled
+        self.timer = timer if timer is not None else timeit.default_timer
+        self.stages = []
+        self._stage_map = {}
+        self._upstream_time = 0.0
+
+    def stage(self, name, stream):
+        '''Wrap a pipeline stage for profiling
+
+        name (string)
+            Name of the stage. Wrapping more than one stream with the same
+            name combines their statistics.
+
+        stream (iterable)
+            The output of the stage.
+
+        Returns an iterator yielding the same items as stream. If the profiler
+          is disabled the stream is returned as is.
+        '''
+        if not self.enabled:
+            return stream
+
+        if name not in self._stage_map:
+            stats = StageStats(name)
+            self._stage_map[name] = stats
+            self.stages.append(stats)
+
+        return self._profile(self._stage_map[name], iter(stream))
+
+    def _profile(self, stats, it):
+        timer = self.timer
+        counter = None
+
+        while True:
+            # Time spent in wrapped upstream stages is accumulated in _upstream_time
+            # while this stage runs so that it can be excluded
+            outer_upstream = self._upstream_time
+            self._upstream_time = 0.0
+            t_start = timer()
+            try:
+                item = next(it)
+                done = False
+            except StopIteration:
+                done = True
+            finally:
+                elapsed = timer() - t_start
+                stats.time += elapsed - self._upstream_time
+                stats.total_time += elapsed
+                self._upstream_time = outer_upstream + elapsed
+
+            if done:
+                stats.finished = True
+                break
+
+            stats.items += 1
+            if counter is None:
+                counter = _item_counter(item)
+            counter(stats, item)
+
+            yield item
+
+    def reset(self):
+        '''Remove all collected statistics'''
+        self.stages = []
+        self._stage_map = {}
+        self._upstream_time = 0.0
+
+    def __getitem__(self, name):
+        return self._stage_map[name]
+
+    def report(self):
+        '''Format a stage-by-stage report of the collected statistics
+
+        Returns a string.
+        '''
+        return format_report(self.stages)
+
+    def __str__(self):
+        return self.report()
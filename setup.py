@@ -80,6 +80,7 @@ def find_cy_modules():
 
 
 features = {}
+cy_module_names = []
 
 if cython_exists:
     # Find all cython modules
@@ -123,7 +124,7 @@ class build_py(_build_py):
         #print('$$$$ mkpath:', os.path.dirname(cfg_path))
         self.mkpath(os.path.dirname(cfg_path))
         print('Writing Ripyl configuration file: {}'.format(cfg_path))
-        self.write_config(cfg_path, use_cython, cython_prebuild)
+        self.write_config(cfg_path, use_cython, cython_prebuild, cy_module_names if cython_prebuild else [])
 
         # Read back the config file for verification
         with open(cfg_path, 'r') as f:
@@ -140,7 +141,7 @@ class build_py(_build_py):
         #print('$$$$ get outfile:', build_dir, package, module)
         #return _build_py.get_module_outfile(self, build_dir, package, module)
 
-    def write_config(self, cfg_path, use_cython, cython_prebuild):
+    def write_config(self, cfg_path, use_cython, cython_prebuild, cython_modules):
         if sys.hexversion < 0x3000000:
             import ConfigParser as cp
         else:
@@ -150,6 +151,9 @@ class build_py(_build_py):
         config.add_section('setup')
         config.set('setup', 'use_cython', str(use_cython))
         config.set('setup', 'cython_prebuild', str(cython_prebuild))
+        # Manifest of compiled modules so the library doesn't need to search for them at import
+        config.set('setup', 'cython_modules', ', '.join(cython_modules))
+        config.set('setup', 'build_version', version)
 
         with open(cfg_path, 'w') as fh:
             config.write(fh)
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep backend benchmark results out of the user's home directory
+os.environ['RIPYL_BACKEND_CACHE'] = os.path.join(tempfile.gettempdir(), 'ripyl_test_backends.json')
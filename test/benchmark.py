@@ -0,0 +1,924 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   benchmark suite
+
+   Each benchmark case prepares its input data once and then times a workload
+   function that processes it. The workload is run several times and the best
+   time is kept. Results are reported as rates for each unit of work (samples,
+   edges, frames, etc.) along with the peak memory growth while the case ran.
+
+   Run the suite with:
+
+     > python -m test.benchmark -o results.json --baseline test/test-output/benchmark_baseline.json
+
+   Timings are only comparable on the machine that produced them so no
+   baseline is distributed. The first run with a baseline file that doesn't
+   exist saves its results to it. A case regresses if its time exceeds the
+   baseline time by more than the threshold fraction. The exit status is
+   non-zero when any case regresses.
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import sys
+import os
+import io
+import gc
+import json
+import time
+import timeit
+import random
+import platform
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import ripyl
+import ripyl.decode as decode
+import ripyl.sigproc as sigp
+import ripyl.streaming as stream
+import ripyl.manchester as manchester
+import ripyl.wave_synth as wave_synth
+import ripyl.protocol.uart as uart
+import ripyl.protocol.spi as spi
+import ripyl.protocol.i2c as i2c
+import ripyl.protocol.i2s as i2s
+import ripyl.protocol.can as can
+import ripyl.protocol.lin as lin
+import ripyl.protocol.ps2 as ps2
+import ripyl.protocol.iso_k_line as kline
+import ripyl.protocol.j1850 as j1850
+import ripyl.protocol.usb as usb
+import ripyl.protocol.usb_transact as usbtr
+import ripyl.protocol.ethernet as ether
+import ripyl.protocol.lm73 as lm73
+import ripyl.protocol.infrared.nec as nec
+import ripyl.protocol.infrared.rc5 as rc5
+import ripyl.protocol.infrared.rc6 as rc6
+import ripyl.protocol.infrared.sirc as sirc
+
+try:
+    import resource
+except ImportError:
+    resource = None # Not available on Windows
+
+
+DEFAULT_SCALES = (1, 4, 16)
+DEFAULT_THRESHOLD = 0.25
+
+Edges = stream.StreamType.Edges
+
+
+class BenchCase(object):
+    '''A single benchmark case'''
+    def __init__(self, name, group, setup):
+        '''
+        name (string)
+            Name of the case.
+
+        group (string)
+            Category of the case (ex: 'decode', 'synth', 'sigproc').
+
+        setup (function)
+            Called with the scale factor for the data size. Returns a workload
+            function with no arguments. The workload returns a dict of the amount
+            of each unit of work it completed.
+        '''
+        self.name = name
+        self.group = group
+        self.setup = setup
+
+    def __repr__(self):
+        return 'BenchCase({!r}, {!r})'.format(self.name, self.group)
+
+
+cases = []
+
+def bench_case(name, group):
+    '''Decorator that adds a setup function to the suite'''
+    def decorator(setup):
+        cases.append(BenchCase(name, group, setup))
+        return setup
+    return decorator
+
+
+def _count(scale, base):
+    return max(1, int(round(base * scale)))
+
+def _edge_count(*edge_lists):
+    return sum(len(e) for e in edge_lists)
+
+def _sample_count(chunks):
+    return sum(len(sc.samples) for sc in chunks)
+
+
+###########################################
+# Protocol synthesizers and decoders
+
+def _uart_edges(scale):
+    data = [random.randint(0, 255) for _ in xrange(_count(scale, 400))]
+    return data, list(uart.uart_synth(data, bits=8, baud=115200))
+
+@bench_case('uart_synth', 'synth')
+def _bench_uart_synth(scale):
+    data, _ = _uart_edges(scale)
+    def run():
+        return {'edges': len(list(uart.uart_synth(data, bits=8, baud=115200)))}
+    return run
+
+@bench_case('uart_decode', 'decode')
+def _bench_uart_decode(scale):
+    _, edges = _uart_edges(scale)
+    def run():
+        records = list(uart.uart_decode(iter(edges), bits=8, baud_rate=115200, stream_type=Edges))
+        return {'edges': len(edges), 'frames': len(records)}
+    return run
+
+
+def _spi_synth(data):
+    return [list(e) for e in spi.spi_synth(data, 8, 1.0e6, idle_start=4.0e-6)]
+
+@bench_case('spi_synth', 'synth')
+def _bench_spi_synth(scale):
+    data = [random.randint(0, 255) for _ in xrange(_count(scale, 200))]
+    def run():
+        return {'edges': _edge_count(*_spi_synth(data))}
+    return run
+
+@bench_case('spi_decode', 'decode')
+def _bench_spi_decode(scale):
+    clk, mosi, cs = _spi_synth([random.randint(0, 255) for _ in xrange(_count(scale, 200))])
+    def run():
+        records = list(spi.spi_decode(iter(clk), iter(mosi), iter(cs), stream_type=Edges))
+        return {'edges': _edge_count(clk, mosi, cs), 'frames': len(records)}
+    return run
+
+
+def _i2c_transfers(scale):
+    return [i2c.I2CTransfer(i2c.I2C.Write, 0x23, [random.randint(0, 255) for _ in xrange(10)]) \
+        for _ in xrange(_count(scale, 20))]
+
+def _i2c_synth(transfers):
+    return [list(e) for e in i2c.i2c_synth(transfers, 100.0e3, idle_start=3.0e-5, idle_end=3.0e-5)]
+
+@bench_case('i2c_synth', 'synth')
+def _bench_i2c_synth(scale):
+    transfers = _i2c_transfers(scale)
+    def run():
+        return {'edges': _edge_count(*_i2c_synth(transfers))}
+    return run
+
+@bench_case('i2c_decode', 'decode')
+def _bench_i2c_decode(scale):
+    scl, sda = _i2c_synth(_i2c_transfers(scale))
+    def run():
+        records = list(i2c.i2c_decode(iter(scl), iter(sda), stream_type=Edges))
+        return {'edges': _edge_count(scl, sda), 'frames': len(records)}
+    return run
+
+
+def _lm73_transfers(scale):
+    transfers = []
+    for _ in xrange(_count(scale, 100)):
+        transfers.append(i2c.I2CTransfer(i2c.I2C.Write, 0x48, [lm73.LM73Register.Temperature]))
+        transfers.append(i2c.I2CTransfer(i2c.I2C.Read, 0x48, [random.randint(0, 255), random.randint(0, 255)]))
+    return transfers
+
+@bench_case('lm73_decode', 'decode')
+def _bench_lm73_decode(scale):
+    scl, sda = _i2c_synth(_lm73_transfers(scale))
+    records = list(i2c.i2c_decode(iter(scl), iter(sda), stream_type=Edges))
+    def run():
+        return {'records': len(records), 'frames': len(list(lm73.lm73_decode(iter(records))))}
+    return run
+
+
+I2S_PARAMS = {'word_size': 16, 'frame_size': 32, 'sample_rate': 48000}
+
+def _i2s_synth(data):
+    return [list(e) for e in i2s.i2s_synth(data, I2S_PARAMS['word_size'], I2S_PARAMS['frame_size'], \
+        I2S_PARAMS['sample_rate'], idle_start=1.0e-5, idle_end=1.0e-5)]
+
+def _i2s_data(scale):
+    return list(i2s.mono_to_stereo([random.randint(0, 2**16-1) for _ in xrange(_count(scale, 100))]))
+
+@bench_case('i2s_synth', 'synth')
+def _bench_i2s_synth(scale):
+    data = _i2s_data(scale)
+    def run():
+        return {'edges': _edge_count(*_i2s_synth(data))}
+    return run
+
+# i2s_decode() is not finished. It doesn't yield records yet so it has no benchmark.
+
+
+def _can_frames(scale):
+    return [can.CANStandardFrame(random.randint(0, 0x7FF), [random.randint(0, 255) for _ in xrange(8)]) \
+        for _ in xrange(_count(scale, 20))]
+
+@bench_case('can_synth', 'synth')
+def _bench_can_synth(scale):
+    frames = _can_frames(scale)
+    def run():
+        ch, cl = can.can_synth(frames, 500.0e3, idle_start=1.0e-5)
+        return {'edges': _edge_count(list(ch), list(cl))}
+    return run
+
+@bench_case('can_decode', 'decode')
+def _bench_can_decode(scale):
+    cl = list(can.can_synth(_can_frames(scale), 500.0e3, idle_start=1.0e-5)[1])
+    def run():
+        records = list(can.can_decode(iter(cl), bit_rate=500.0e3, stream_type=Edges))
+        return {'edges': len(cl), 'frames': len(records)}
+    return run
+
+
+def _lin_frames(scale):
+    return [lin.LINFrame(random.randint(0, 50), [random.randint(0, 255) for _ in xrange(8)]) \
+        for _ in xrange(_count(scale, 20))]
+
+def _lin_synth(frames):
+    return list(lin.lin_synth(frames, 19200, frame_interval=10.0 / 19200, byte_interval=1.0 / 19200))
+
+@bench_case('lin_synth', 'synth')
+def _bench_lin_synth(scale):
+    frames = _lin_frames(scale)
+    def run():
+        return {'edges': len(_lin_synth(frames))}
+    return run
+
+@bench_case('lin_decode', 'decode')
+def _bench_lin_decode(scale):
+    edges = _lin_synth(_lin_frames(scale))
+    def run():
+        records = list(lin.lin_decode(iter(edges), baud_rate=19200, stream_type=Edges))
+        return {'edges': len(edges), 'frames': len(records)}
+    return run
+
+
+def _ps2_synth(frames):
+    clock_freq = 12.0e3
+    return [list(e) for e in ps2.ps2_synth(frames, clock_freq, 4.0 / clock_freq, 5.0 / clock_freq)]
+
+def _ps2_frames(scale):
+    return [ps2.PS2Frame(random.randint(0, 255), random.choice((ps2.PS2Dir.DeviceToHost, ps2.PS2Dir.HostToDevice))) \
+        for _ in xrange(_count(scale, 50))]
+
+@bench_case('ps2_synth', 'synth')
+def _bench_ps2_synth(scale):
+    frames = _ps2_frames(scale)
+    def run():
+        return {'edges': _edge_count(*_ps2_synth(frames))}
+    return run
+
+@bench_case('ps2_decode', 'decode')
+def _bench_ps2_decode(scale):
+    clk, data = _ps2_synth(_ps2_frames(scale))
+    def run():
+        records = list(ps2.ps2_decode(iter(clk), iter(data), stream_type=Edges))
+        return {'edges': _edge_count(clk, data), 'frames': len(records)}
+    return run
+
+
+def _kline_messages(scale):
+    messages = []
+    for _ in xrange(_count(scale, 10)):
+        for header in ([0x68, 0x6A, 0xF1], [0x48, 0x6B, 0xD1]):
+            msg = header + [random.randint(0, 0x3F)] + [random.randint(0, 255) for _ in xrange(4)]
+            msg.append(sum(msg) % 256)
+            messages.append(msg)
+    return messages
+
+def _kline_synth(messages):
+    return list(kline.iso_k_line_synth(messages, idle_start=8.0 / 10400, idle_end=8.0 / 10400))
+
+@bench_case('iso_k_line_synth', 'synth')
+def _bench_kline_synth(scale):
+    messages = _kline_messages(scale)
+    def run():
+        return {'edges': len(_kline_synth(messages))}
+    return run
+
+@bench_case('iso_k_line_decode', 'decode')
+def _bench_kline_decode(scale):
+    edges = _kline_synth(_kline_messages(scale))
+    def run():
+        records = list(kline.iso_k_line_decode(iter(edges), stream_type=Edges))
+        return {'edges': len(edges), 'frames': len(records)}
+    return run
+
+
+def _j1850_frames(scale):
+    return [j1850.J1850Frame(3, 8, [random.randint(0, 255) for _ in xrange(6)], 0x6A, 0xF1) \
+        for _ in xrange(_count(scale, 10))]
+
+@bench_case('j1850_vpw_synth', 'synth')
+def _bench_j1850_vpw_synth(scale):
+    frames = _j1850_frames(scale)
+    def run():
+        return {'edges': len(list(j1850.j1850_vpw_synth(frames)))}
+    return run
+
+@bench_case('j1850_vpw_decode', 'decode')
+def _bench_j1850_vpw_decode(scale):
+    edges = list(j1850.j1850_vpw_synth(_j1850_frames(scale)))
+    def run():
+        records = list(j1850.j1850_vpw_decode(iter(edges), stream_type=Edges))
+        return {'edges': len(edges), 'frames': len(records)}
+    return run
+
+@bench_case('j1850_pwm_synth', 'synth')
+def _bench_j1850_pwm_synth(scale):
+    frames = _j1850_frames(scale)
+    def run():
+        return {'edges': _edge_count(*[list(e) for e in j1850.j1850_pwm_synth(frames)])}
+    return run
+
+@bench_case('j1850_pwm_decode', 'decode')
+def _bench_j1850_pwm_decode(scale):
+    pwm_p = list(j1850.j1850_pwm_synth(_j1850_frames(scale))[0])
+    def run():
+        records = list(j1850.j1850_pwm_decode(iter(pwm_p), stream_type=Edges))
+        return {'edges': len(pwm_p), 'frames': len(records)}
+    return run
+
+
+def _usb_packets(scale, speed=usb.USBSpeed.FullSpeed):
+    packets = []
+    for _ in xrange(_count(scale, 10)):
+        packets.append(usb.USBTokenPacket(usb.USBPID.TokenOut, random.randint(0, 0x7F), 1, speed=speed))
+        packets.append(usb.USBDataPacket(usb.USBPID.Data0, [random.randint(0, 255) for _ in xrange(16)], \
+            speed=speed))
+        packets.append(usb.USBHandshakePacket(usb.USBPID.ACK, speed=speed))
+    return packets
+
+@bench_case('usb_synth', 'synth')
+def _bench_usb_synth(scale):
+    packets = _usb_packets(scale)
+    def run():
+        return {'edges': _edge_count(*[list(e) for e in usb.usb_synth(packets, 1.0e-7, 3.0e-7)])}
+    return run
+
+@bench_case('usb_decode', 'decode')
+def _bench_usb_decode(scale):
+    dp, dm = [list(e) for e in usb.usb_synth(_usb_packets(scale), 1.0e-7, 3.0e-7)]
+    def run():
+        records = list(usb.usb_decode(iter(dp), iter(dm), stream_type=Edges))
+        return {'edges': _edge_count(dp, dm), 'frames': len(records)}
+    return run
+
+@bench_case('usb_diff_synth', 'synth')
+def _bench_usb_diff_synth(scale):
+    packets = _usb_packets(scale)
+    def run():
+        return {'edges': len(list(usb.usb_diff_synth(packets, 1.0e-7, 3.0e-7)))}
+    return run
+
+@bench_case('usb_diff_decode', 'decode')
+def _bench_usb_diff_decode(scale):
+    d_diff = list(usb.usb_diff_synth(_usb_packets(scale), 1.0e-7, 3.0e-7))
+    def run():
+        records = list(usb.usb_diff_decode(iter(d_diff), stream_type=Edges))
+        return {'edges': len(d_diff), 'frames': len(records)}
+    return run
+
+@bench_case('usb_hsic_synth', 'synth')
+def _bench_usb_hsic_synth(scale):
+    packets = _usb_packets(scale, usb.USBSpeed.HighSpeed)
+    def run():
+        return {'edges': _edge_count(*[list(e) for e in usb.usb_hsic_synth(packets, 1.0e-7, 3.0e-7)])}
+    return run
+
+@bench_case('usb_hsic_decode', 'decode')
+def _bench_usb_hsic_decode(scale):
+    strobe, data = [list(e) for e in usb.usb_hsic_synth(_usb_packets(scale, usb.USBSpeed.HighSpeed), \
+        1.0e-7, 3.0e-7)]
+    def run():
+        records = list(usb.usb_hsic_decode(iter(strobe), iter(data), stream_type=Edges))
+        return {'edges': _edge_count(strobe, data), 'frames': len(records)}
+    return run
+
+@bench_case('usb_transactions_decode', 'decode')
+def _bench_usb_transactions_decode(scale):
+    dp, dm = usb.usb_synth(_usb_packets(scale), 1.0e-7, 3.0e-7)
+    records = list(usb.usb_decode(dp, dm, stream_type=Edges))
+    def run():
+        transactions = list(usbtr.usb_transactions_decode(iter(records)))
+        return {'records': len(records), 'frames': len(transactions)}
+    return run
+
+
+def _ether_synth(frames):
+    return list(ether.ethernet_synth(frames, overshoot=None, idle_start=2.0e-6, frame_interval=2.0e-6, \
+        idle_end=2.0e-6))
+
+def _ether_frames(scale):
+    return [ether.EthernetFrame([random.randint(0, 255) for _ in xrange(6)], \
+        [random.randint(0, 255) for _ in xrange(6)], [random.randint(0, 255) for _ in xrange(100)]) \
+        for _ in xrange(_count(scale, 4))]
+
+@bench_case('ethernet_synth', 'synth')
+def _bench_ethernet_synth(scale):
+    frames = _ether_frames(scale)
+    def run():
+        return {'edges': len(_ether_synth(frames))}
+    return run
+
+@bench_case('ethernet_decode', 'decode')
+def _bench_ethernet_decode(scale):
+    edges = _ether_synth(_ether_frames(scale))
+    def run():
+        records = list(ether.ethernet_decode(iter(edges), stream_type=Edges))
+        return {'edges': len(edges), 'frames': len(records)}
+    return run
+
+@bench_case('manchester_decode', 'decode')
+def _bench_manchester_decode(scale):
+    edges = _ether_synth(_ether_frames(scale))
+    def run():
+        states = list(manchester.manchester_decode(iter(edges), 100.0e-9))
+        return {'edges': len(edges), 'symbols': len(states)}
+    return run
+
+
+def _ir_messages(scale):
+    count = _count(scale, 10)
+    return {
+        'nec': [nec.NECMessage(cmd=random.randint(0, 255), addr_low=random.randint(0, 255)) for _ in xrange(count)],
+        'rc5': [rc5.RC5Message(cmd=random.randint(0, 127), addr=random.randint(0, 31), toggle=random.randint(0, 1)) \
+            for _ in xrange(count)],
+        'rc6': [rc6.RC6Message(addr=random.randint(0, 255), cmd=random.randint(0, 255), toggle=random.randint(0, 1), \
+            mode=0) for _ in xrange(count)],
+        'sirc': [sirc.SIRCMessage(cmd=random.randint(0, 127), device=random.randint(0, 31)) for _ in xrange(count)]
+    }
+
+IR_PROTOCOLS = {
+    'nec': (lambda m: nec.nec_synth(m), nec.nec_decode),
+    'rc5': (lambda m: rc5.rc5_synth(m, message_interval=5.0e-3), rc5.rc5_decode),
+    'rc6': (lambda m: rc6.rc6_synth(m, message_interval=5.0e-3), rc6.rc6_decode),
+    'sirc': (lambda m: sirc.sirc_synth(m), sirc.sirc_decode)
+}
+
+def _add_ir_cases(proto):
+    synth, decoder = IR_PROTOCOLS[proto]
+
+    def setup_synth(scale):
+        msgs = _ir_messages(scale)[proto]
+        def run():
+            return {'edges': len(list(synth(msgs)))}
+        return run
+
+    def setup_decode(scale):
+        edges = list(synth(_ir_messages(scale)[proto]))
+        def run():
+            records = list(decoder(iter(edges), stream_type=Edges))
+            return {'edges': len(edges), 'frames': len(records)}
+        return run
+
+    bench_case('{}_synth'.format(proto), 'synth')(setup_synth)
+    bench_case('{}_decode'.format(proto), 'decode')(setup_decode)
+
+for proto in sorted(IR_PROTOCOLS.iterkeys()):
+    _add_ir_cases(proto)
+
+
+###########################################
+# Test waveform generators
+
+def _add_wave_case(name, synth):
+    def setup(scale):
+        count = _count(scale, 100000)
+        def run():
+            for _ in synth(frequency=1.0e6, sample_period=50.0e-9, samples=count):
+                pass
+            return {'samples': count}
+        return run
+
+    bench_case(name, 'synth')(setup)
+
+_add_wave_case('sine_synth', wave_synth.sine_synth)
+_add_wave_case('square_synth', wave_synth.square_synth)
+
+
+###########################################
+# Signal processing
+
+SAMPLE_RATE = 115200 * 20
+
+def _sample_edges(scale):
+    # UART edges sized to produce about 100k samples per unit of scale
+    data = [random.randint(0, 255) for _ in xrange(_count(scale, 500))]
+    return list(uart.uart_synth(data, bits=8, baud=115200))
+
+def _clean_samples(scale):
+    return list(sigp.synth_wave(iter(_sample_edges(scale)), SAMPLE_RATE, sigp.min_rise_time(SAMPLE_RATE) * 6.0))
+
+def _noisy_samples(scale):
+    return list(sigp.amplify(sigp.noisify(iter(_clean_samples(scale)), snr_db=30.0), gain=3.3))
+
+def _add_stage_case(name, stage, samples_func=_clean_samples):
+    def setup(scale):
+        samples = samples_func(scale)
+        def run():
+            for _ in stage(iter(samples)):
+                pass
+            return {'samples': _sample_count(samples)}
+        return run
+
+    bench_case(name, 'sigproc')(setup)
+
+@bench_case('edges_to_sample_stream', 'sigproc')
+def _bench_edges_to_sample_stream(scale):
+    edges = _sample_edges(scale)
+    def run():
+        return {'samples': _sample_count(list(sigp.edges_to_sample_stream(iter(edges), 1.0 / SAMPLE_RATE)))}
+    return run
+
+@bench_case('synth_wave', 'sigproc')
+def _bench_synth_wave(scale):
+    edges = _sample_edges(scale)
+    rise_time = sigp.min_rise_time(SAMPLE_RATE) * 6.0
+    def run():
+        return {'samples': _sample_count(list(sigp.synth_wave(iter(edges), SAMPLE_RATE, rise_time)))}
+    return run
+
+_add_stage_case('filter_waveform', lambda s: sigp.filter_waveform(s, SAMPLE_RATE, \
+    sigp.min_rise_time(SAMPLE_RATE) * 6.0))
+_add_stage_case('noisify', lambda s: sigp.noisify(s, snr_db=30.0))
+_add_stage_case('quantize', lambda s: sigp.quantize(s, 5.0, bits=8))
+_add_stage_case('amplify', lambda s: sigp.amplify(s, gain=3.3, offset=0.1))
+_add_stage_case('invert', sigp.invert)
+_add_stage_case('dropout', lambda s: sigp.dropout(s, 1.0e-4, 2.0e-4))
+_add_stage_case('capacify', lambda s: sigp.capacify(s, 1.0e-9, 50.0, iterations=5))
+_add_stage_case('decimate_minmax', lambda s: sigp.decimate(s, 4, method='minmax'))
+_add_stage_case('decimate_fir', lambda s: sigp.decimate(s, 4, method='fir'))
+_add_stage_case('find_edges', lambda s: decode.find_edges(s, (0.0, 3.3)), _noisy_samples)
+_add_stage_case('find_multi_edges', lambda s: decode.find_multi_edges(s, \
+    decode.gen_hyst_thresholds((0.0, 3.3), expand=3, hysteresis=0.4)), _noisy_samples)
+
+@bench_case('sum_streams', 'sigproc')
+def _bench_sum_streams(scale):
+    samples = _clean_samples(scale)
+    def run():
+        for _ in sigp.sum_streams(iter(samples), iter(samples)):
+            pass
+        return {'samples': _sample_count(samples)}
+    return run
+
+@bench_case('find_edge_arrays', 'sigproc')
+def _bench_find_edge_arrays(scale):
+    samples = np.concatenate([sc.samples for sc in _noisy_samples(scale)])
+    def run():
+        decode.find_edge_arrays(samples, (0.0, 3.3))
+        return {'samples': len(samples)}
+    return run
+
+@bench_case('find_logic_levels', 'sigproc')
+def _bench_find_logic_levels(scale):
+    samples = _noisy_samples(scale)
+    def run():
+        decode.find_logic_levels(iter(samples))
+        return {'samples': min(_sample_count(samples), 20000)}
+    return run
+
+@bench_case('find_symbol_rate', 'sigproc')
+def _bench_find_symbol_rate(scale):
+    edges = _sample_edges(scale)
+    def run():
+        decode.find_symbol_rate(iter(edges), SAMPLE_RATE)
+        return {'edges': len(edges)}
+    return run
+
+
+###########################################
+# CRCs
+
+def _add_crc_case(name, crc, unit, base_size):
+    def setup(scale):
+        if unit == 'bits':
+            blocks = [[random.randint(0, 1) for _ in xrange(base_size)] for _ in xrange(_count(scale, 100))]
+        else:
+            blocks = [[random.randint(0, 255) for _ in xrange(base_size)] for _ in xrange(_count(scale, 100))]
+        def run():
+            for b in blocks:
+                crc(b)
+            return {unit: base_size * len(blocks)}
+        return run
+
+    bench_case(name, 'crc')(setup)
+
+_add_crc_case('can_crc15', can.can_crc15, 'bits', 100)
+_add_crc_case('usb_crc5', usb.usb_crc5, 'bits', 11)
+_add_crc_case('usb_crc16', usb.usb_crc16, 'bits', 256)
+_add_crc_case('table_usb_crc16', usb.table_usb_crc16, 'bytes', 32)
+_add_crc_case('table_ethernet_crc32', ether.table_ethernet_crc32, 'bytes', 100)
+_add_crc_case('table_j1850_crc8', j1850.table_j1850_crc8, 'bytes', 8)
+
+
+###########################################
+# Record persistence
+
+def _stream_records(scale):
+    _, edges = _uart_edges(_count(scale, 5))
+    return list(uart.uart_decode(iter(edges), bits=8, baud_rate=115200, stream_type=Edges))
+
+@bench_case('save_stream', 'persist')
+def _bench_save_stream(scale):
+    records = _stream_records(scale)
+    def run():
+        stream.save_stream(records, io.BytesIO())
+        return {'records': len(records)}
+    return run
+
+@bench_case('load_stream', 'persist')
+def _bench_load_stream(scale):
+    records = _stream_records(scale)
+    fh = io.BytesIO()
+    stream.save_stream(records, fh)
+    data = fh.getvalue()
+    def run():
+        return {'records': len(stream.load_stream(io.BytesIO(data)))}
+    return run
+
+@bench_case('save_indexed_stream', 'persist')
+def _bench_save_indexed_stream(scale):
+    records = _stream_records(scale)
+    def run():
+        stream.save_indexed_stream(records, io.BytesIO())
+        return {'records': len(records)}
+    return run
+
+@bench_case('indexed_stream_query', 'persist')
+def _bench_indexed_stream_query(scale):
+    records = _stream_records(scale)
+    fh = io.BytesIO()
+    stream.save_indexed_stream(records, fh, block_size=64)
+    data = fh.getvalue()
+    t_end = records[-1].end_time
+    windows = [(t, t + t_end / 50.0) for t in np.linspace(0.0, t_end, 20)]
+    def run():
+        ix_stream = stream.IndexedStream(io.BytesIO(data))
+        found = 0
+        for t0, t1 in windows:
+            found += len(list(ix_stream.query(t0, t1)))
+        return {'queries': len(windows), 'records': found}
+    return run
+
+
+###########################################
+# Suite runner
+
+def environment():
+    '''Describe the environment the benchmarks run in
+
+    Returns a dict.
+    '''
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'ripyl': ripyl.__version__,
+        'cython_active': ripyl.config.settings.cython_active,
+        'numpy': np.__version__,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def _max_rss():
+    '''Peak resident memory of this process in bytes'''
+    if resource is None:
+        return 0
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024 # Linux reports kB
+
+
+def find_case(name):
+    '''Look up a benchmark case by name'''
+    for c in cases:
+        if c.name == name:
+            return c
+    raise KeyError('Unknown benchmark case: {}'.format(name))
+
+
+def run_case(name, scale, repeat=3, seed=1):
+    '''Run a single benchmark case
+
+    name (string)
+        Name of the case.
+
+    scale (float)
+        Scale factor for the data size.
+
+    repeat (int)
+        Number of times to run the workload. The best time is kept.
+
+    seed (int)
+        Seed for the random data generated by the case.
+
+    Returns a dict with the case 'name', 'group', 'scale', best 'time' in seconds,
+      the 'counts' of each unit of work, a 'rates' dict of units per second, and the
+      'peak_mem' growth in bytes.
+    '''
+    case = find_case(name)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # Warm up on a small data set first so that lazy imports and pages inherited
+    # from the parent process don't count toward the memory used by the case
+    case.setup(min(scale, 0.01))()
+
+    gc.collect()
+    rss_start = _max_rss()
+    run = case.setup(scale)
+
+    best = None
+    counts = None
+    for _ in xrange(repeat):
+        t_start = timeit.default_timer()
+        counts = run()
+        elapsed = timeit.default_timer() - t_start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    best = max(best, 1.0e-9)
+    return {
+        'name': case.name,
+        'group': case.group,
+        'scale': scale,
+        'time': best,
+        'counts': counts,
+        'rates': dict(('{}/s'.format(unit), n / best) for unit, n in counts.iteritems()),
+        'peak_mem': max(0, _max_rss() - rss_start)
+    }
+
+
+def _run_case_args(args):
+    return run_case(*args)
+
+
+def result_key(result):
+    '''Key identifying a case and scale in a results dict'''
+    return '{}@{:g}'.format(result['name'], result['scale'])
+
+
+def run_suite(names=None, groups=None, scales=DEFAULT_SCALES, repeat=3, isolate=True, progress=None):
+    '''Run the benchmark suite
+
+    names (sequence of string or None)
+        Names of the cases to run. All cases are run when None.
+
+    groups (sequence of string or None)
+        Only run the cases in these groups. All groups are run when None.
+
+    scales (sequence of float)
+        Data size scale factors to run each case at.
+
+    repeat (int)
+        Number of times to run each workload.
+
+    isolate (bool)
+        Run each case in a separate worker process. This keeps the peak memory
+        measurement of each case independent of the others.
+
+    progress (function or None)
+        Called with each result as it completes.
+
+    Returns a dict with the 'environment' and a 'results' dict keyed by result_key().
+    '''
+    selected = [c for c in cases if (names is None or c.name in names) and (groups is None or c.group in groups)]
+    jobs = [(c.name, s, repeat) for c in selected for s in scales]
+
+    results = {}
+    def collect(result):
+        results[result_key(result)] = result
+        if progress is not None:
+            progress(result)
+
+    if isolate:
+        # A fresh process for every case so ru_maxrss starts from the same point
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            for result in pool.imap(_run_case_args, jobs):
+                collect(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            collect(_run_case_args(job))
+
+    return {'environment': environment(), 'results': results}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''Compare benchmark results against a baseline
+
+    results (dict)
+        Results from run_suite().
+
+    baseline (dict)
+        Baseline results from an earlier run_suite().
+
+    threshold (float)
+        Fractional increase in time that counts as a regression.
+
+    Returns a list of (key, ratio, regressed) tuples for each result that is in the
+      baseline. ratio is the new time divided by the baseline time.
+    '''
+    comparison = []
+    base_results = baseline.get('results', {})
+    for key in sorted(results['results'].iterkeys()):
+        if key not in base_results:
+            continue
+        ratio = results['results'][key]['time'] / max(base_results[key]['time'], 1.0e-9)
+        comparison.append((key, ratio, ratio > 1.0 + threshold))
+
+    return comparison
+
+
+def format_result(result):
+    rates = ', '.join('{:.4g} {}'.format(r, unit) for unit, r in sorted(result['rates'].iteritems()))
+    return '  {:<28} {:>9.3f} ms  {:>8.1f} MB  {}'.format(result_key(result), result['time'] * 1.0e3, \
+        result['peak_mem'] / 2.0**20, rates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ripyl benchmark suite')
+    parser.add_argument('-o', '--output', help='Write results to a JSON file')
+    parser.add_argument('-b', '--baseline', help='Compare against a baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline file')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD, \
+        help='Fractional slowdown that counts as a regression (default: {})'.format(DEFAULT_THRESHOLD))
+    parser.add_argument('-s', '--scales', default=','.join(str(s) for s in DEFAULT_SCALES), \
+        help='Comma separated data size scale factors')
+    parser.add_argument('-g', '--groups', help='Comma separated case groups to run')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs of each workload')
+    parser.add_argument('-l', '--list', action='store_true', help='List the benchmark cases')
+    parser.add_argument('--no-isolate', dest='isolate', action='store_false', \
+        help='Run all cases in this process')
+    parser.add_argument('names', nargs='*', help='Names of cases to run')
+    args = parser.parse_args()
+
+    if args.list:
+        for c in cases:
+            print('  {:<10} {}'.format(c.group, c.name))
+        return 0
+
+    scales = [float(s) for s in args.scales.split(',')]
+    groups = args.groups.split(',') if args.groups else None
+
+    print('Running benchmarks (Cython is {})'.format('active' if ripyl.config.settings.cython_active else 'inactive'))
+    results = run_suite(args.names or None, groups, scales, args.repeat, args.isolate, \
+        progress=lambda r: print(format_result(r)))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=1, sort_keys=True)
+
+    status = 0
+    if args.baseline:
+        if args.save_baseline or not os.path.exists(args.baseline):
+            base_dir = os.path.dirname(args.baseline)
+            if base_dir and not os.path.exists(base_dir):
+                os.makedirs(base_dir)
+            with open(args.baseline, 'w') as fh:
+                json.dump(results, fh, indent=1, sort_keys=True)
+            print('Saved baseline:', args.baseline)
+        else:
+            with open(args.baseline) as fh:
+                baseline = json.load(fh)
+
+            regressions = [c for c in compare(results, baseline, args.threshold) if c[2]]
+            print('\n{} regressions against {} (threshold {:.0%})'.format(len(regressions), args.baseline, \
+                args.threshold))
+            for key, ratio, _ in regressions:
+                print('  {:<28} {:.2f}x slower'.format(key, ratio))
+            if len(regressions) > 0:
+                status = 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
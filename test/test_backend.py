@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   backend.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+import os
+import json
+import threading
+
+import numpy as np
+
+import ripyl.backend as backend
+import ripyl.protocol.can as can
+import ripyl.protocol.usb as usb
+import ripyl.sigproc as sigp
+from ripyl.util import bitops
+import test.test_support as tsup
+
+
+class TestBackendRegistry(unittest.TestCase):
+    def setUp(self):
+        if not os.path.exists('test/test-output'):
+            os.mkdir('test/test-output')
+
+        self.cache_path = os.path.join('test', 'test-output', 'backend_cache.json')
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+        self.runs = []
+
+    def _make_registry(self):
+        reg = backend.BackendRegistry(self.cache_path)
+        reg.add_function('test.fn', bench=self._bench)
+        reg.register('test.fn', 'slow', lambda x: ('slow', x))
+        reg.register('test.fn', 'fast', lambda x: ('fast', x))
+        reg.register('test.fn', 'broken', self._broken, priority=10)
+        return reg
+
+    def _broken(self, x):
+        raise ValueError('Broken backend')
+
+    def _bench(self):
+        def workload(impl):
+            self.runs.append(impl)
+            result = impl(1)
+            if result[0] == 'slow':
+                for _ in xrange(20000):
+                    pass
+        return workload
+
+    def test_selection(self):
+        reg = self._make_registry()
+
+        # Benchmark picks the fastest working backend and caches the times on disk
+        self.assertEqual(reg.selected('test.fn'), 'fast')
+        self.assertEqual(reg.implementation('test.fn')(2), ('fast', 2))
+        times = reg.benchmark_times('test.fn')
+        self.assertIsNone(times['broken'])
+        self.assertTrue(times['fast'] < times['slow'])
+
+        with open(self.cache_path) as fh:
+            cache = json.load(fh)
+        self.assertEqual(set(cache['functions']['test.fn'].keys()), set(['slow', 'fast', 'broken']))
+
+        # A new registry reuses the cached results without benchmarking
+        run_count = len(self.runs)
+        reg = self._make_registry()
+        self.assertEqual(reg.selected('test.fn'), 'fast')
+        self.assertEqual(len(self.runs), run_count)
+
+        # Without benchmarks the highest priority wins
+        reg = self._make_registry()
+        reg.autotune_enabled = False
+        self.assertEqual(reg.selected('test.fn'), 'broken')
+
+        # Global selection and disabled backends
+        reg = self._make_registry()
+        reg.select('test.fn', 'slow')
+        self.assertEqual(reg.selected('test.fn'), 'slow')
+        reg.enable_backend('slow', False)
+        self.assertEqual(reg.selected('test.fn'), 'fast')
+        reg.enable_backend('slow', True)
+        reg.select('test.fn', None)
+        self.assertEqual(reg.selected('test.fn'), 'fast')
+
+        self.assertRaises(backend.BackendError, reg.select, 'test.fn', 'missing')
+        self.assertRaises(backend.BackendError, reg.implementation, 'test.missing')
+
+        # Explicit autotuning works when automatic benchmarks are disabled
+        reg = self._make_registry()
+        reg.autotune_enabled = False
+        self.assertEqual(reg.autotune(['test.fn']), {'test.fn': 'fast'})
+
+    def test_defaults(self):
+        # Benchmarks and the disk cache are opt-in
+        saved = dict((k, os.environ.pop(k, None)) for k in ('RIPYL_AUTOTUNE', 'RIPYL_BACKEND_CACHE'))
+        try:
+            self.assertFalse(backend._autotune_setting())
+            self.assertIsNone(backend._default_cache_path())
+
+            os.environ['RIPYL_AUTOTUNE'] = '1'
+            os.environ['RIPYL_BACKEND_CACHE'] = self.cache_path
+            self.assertTrue(backend._autotune_setting())
+            self.assertEqual(backend._default_cache_path(), self.cache_path)
+        finally:
+            for k, v in saved.iteritems():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+    def test_overrides(self):
+        # Per-call and per-thread overrides on a registered hot function
+        taps = np.random.uniform(-1.0, 1.0, 20)
+        samples = np.random.uniform(-1.0, 1.0, 200)
+        expected = sigp.fir_filter(taps, samples, backend='numpy')
+        self.assertTrue(np.allclose(sigp.fir_filter(taps, samples, backend='fft'), expected))
+
+        name = 'sigproc.fir_filter'
+        default = backend.registry.selected(name)
+
+        with backend.registry.use_backend('fft', name):
+            self.assertEqual(backend.registry.selected(name), 'fft')
+
+            # Overrides are local to the thread that set them
+            other = []
+            th = threading.Thread(target=lambda: other.append(backend.registry.selected(name)))
+            th.start()
+            th.join()
+            self.assertEqual(other, [default])
+
+            with backend.registry.use_backend('numpy'):
+                self.assertEqual(backend.registry.selected(name), 'numpy')
+                self.assertTrue(np.allclose(sigp.fir_filter(taps, samples), expected))
+
+            self.assertEqual(backend.registry.selected(name), 'fft')
+
+        # Functions without the backend are unaffected
+        edges_default = backend.registry.selected('decode.find_edges')
+        with backend.registry.use_backend('fft'):
+            self.assertEqual(backend.registry.selected(name), 'fft')
+            self.assertEqual(backend.registry.selected('decode.find_edges'), edges_default)
+
+        self.assertEqual(backend.registry.selected(name), default)
+        self.assertRaises(backend.BackendError, sigp.fir_filter, taps, samples, backend='missing')
+
+
+def _bitwise_crc(d, poly, width, sreg):
+    '''Reference CRC that shifts in one bit at a time'''
+    mask = (1 << width) - 1
+    for b in d:
+        leftbit = (sreg >> (width - 1)) & 0x01
+        sreg = (sreg << 1) & mask
+        if b != leftbit:
+            sreg ^= poly
+    return sreg
+
+
+class TestBackendImplementations(tsup.RandomSeededTestCase):
+    def test_backends_match(self):
+        self.test_name = 'backend implementation test'
+        self.trial_count = 100
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # Table driven CRCs match a bit at a time calculation
+            bits = [random.randint(0, 1) for _ in xrange(random.randint(0, 200))]
+            self.assertEqual(can.can_crc15(bits), bitops.split_bits(_bitwise_crc(bits, 0x4599, 15, 0), 15))
+            self.assertEqual(usb.usb_crc16(bits), \
+                bitops.split_bits(_bitwise_crc(bits, 0x8005, 16, 0xffff) ^ 0xffff, 16))
+
+            taps = np.random.uniform(-1.0, 1.0, random.randint(1, 50))
+            samples = np.random.uniform(-1.0, 1.0, random.randint(1, 500))
+            results = [sigp.fir_filter(taps, samples, backend=b) for b in sigp.fir_filter.hot_function.order]
+            for r in results[1:]:
+                self.assertEqual(len(r), len(samples))
+                self.assertTrue(np.allclose(r, results[0]), 'fir_filter() mismatch')
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   classify.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+
+import ripyl.classify as classify
+import ripyl.sigproc as sigp
+import ripyl.streaming as stream
+import ripyl.protocol.uart as uart
+import ripyl.protocol.lin as lin
+import ripyl.protocol.can as can
+import ripyl.protocol.j1850 as j1850
+import ripyl.protocol.infrared.ir_common as ir
+import ripyl.protocol.infrared.nec as nec
+import ripyl.protocol.infrared.rc5 as rc5
+import ripyl.protocol.infrared.sirc as sirc
+import test.test_support as tsup
+
+
+def _rand_bytes(count):
+    return [random.randint(0, 255) for _ in xrange(count)]
+
+def _gen_uart():
+    baud = random.choice((9600, 19200, 57600, 115200))
+    data = _rand_bytes(random.randint(30, 60))
+    return uart.uart_synth(data, 8, baud, idle_start=1.0e-3, idle_end=1.0e-3), 20 * baud
+
+def _gen_lin():
+    baud = random.choice((9600, 19200))
+    frames = [lin.LINFrame(random.randint(0, 0x3B), _rand_bytes(random.randint(2, 8))) for _ in xrange(5)]
+    return lin.lin_synth(frames, baud, idle_start=1.0e-3, idle_end=1.0e-3), 20 * baud
+
+def _gen_can():
+    bit_rate = random.choice((125.0e3, 250.0e3, 500.0e3))
+    frames = [can.CANStandardFrame(random.randint(0, 0x7FF), _rand_bytes(8)) for _ in xrange(6)]
+    ch, _ = can.can_synth(frames, bit_rate, idle_start=1.0e-5, idle_end=1.0e-5)
+    return ch, 20 * bit_rate
+
+def _gen_j1850_vpw():
+    frames = [j1850.J1850Frame(random.randint(0, 7), 12, _rand_bytes(4), 0x6A, 0xF1) for _ in xrange(4)]
+    return j1850.j1850_vpw_synth(frames, idle_start=1.0e-4, frame_interval=1.0e-3), 200.0e3
+
+def _gen_nec():
+    msgs = [nec.NECMessage(cmd=random.randint(0, 255), addr_low=random.randint(0, 255)) for _ in xrange(3)]
+    edges = nec.nec_synth(msgs, idle_start=1.0e-3)
+    if random.choice((True, False)):
+        return ir.modulate(edges, 38.0e3), 40 * 38.0e3
+    return edges, 100.0e3
+
+def _gen_rc5():
+    msgs = [rc5.RC5Message(cmd=random.randint(0, 63), addr=random.randint(0, 31), toggle=0) for _ in xrange(3)]
+    return rc5.rc5_synth(msgs, idle_start=1.0e-3), 100.0e3
+
+def _gen_sirc():
+    msgs = [sirc.SIRCMessage(cmd=random.randint(0, 127), device=random.randint(0, 31)) for _ in xrange(3)]
+    return sirc.sirc_synth(msgs, idle_start=1.0e-3), 100.0e3
+
+
+class TestClassify(tsup.RandomSeededTestCase):
+    def test_classify_channel(self):
+        self.test_name = 'Protocol classifier'
+        self.trial_count = 40
+
+        generators = {'uart': _gen_uart, 'lin': _gen_lin, 'can': _gen_can, 'j1850_vpw': _gen_j1850_vpw, \
+            'nec': _gen_nec, 'rc5': _gen_rc5, 'sirc': _gen_sirc}
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            proto = random.choice(sorted(generators.keys()))
+            edges, sample_rate = generators[proto]()
+            samples = list(sigp.noisify(sigp.synth_wave(edges, sample_rate, \
+                rise_time=sigp.min_rise_time(sample_rate) * 2), snr_db=25.0))
+            samples = list(stream.rechunkify(iter(samples), random.randint(500, 10000)))
+
+            candidates = classify.classify_channel(iter(samples))
+            self.assertTrue(len(candidates) > 0, 'No candidates for {}'.format(proto))
+            self.assertEqual(candidates[0].protocol, proto, \
+                'Wrong classification for {}: {}'.format(proto, candidates))
+
+            # The suggested parameters can decode the channel
+            records = list(candidates[0].decode(iter(samples)))
+            self.assertTrue(len(records) > 0)
+            self.assertTrue(all(r.nested_status() < stream.StreamStatus.Error for r in records), \
+                'Decode errors for {}'.format(proto))
+
+
+    def test_idle_channel(self):
+        self.test_name = 'Protocol classifier idle'
+        self.trial_count = 1
+        self.update_progress(1)
+
+        edges = [(0.0, 1), (1.0e-3, 1)]
+        samples = list(sigp.synth_wave(iter(edges), 1.0e6, rise_time=1.0e-6))
+
+        cs = classify.channel_stats(iter(samples))
+        self.assertEqual(cs.edge_count, 0)
+        self.assertEqual(classify.rank_candidates(cs), [])
@@ -25,9 +25,12 @@
 from __future__ import print_function, division
 
 import unittest
+import sys
+import types
 
 import ripyl
 import ripyl.config as cfg
+import ripyl.backend as backend
 
 
 class TestCython(unittest.TestCase):
@@ -42,3 +45,76 @@ class TestCython(unittest.TestCase):
         print('\nCython patched objects:')
         for po in cfg.settings.patched_objs:
             print('  {}.{}\t{}'.format(po.py_mname, po.obj_name, 'ACTIVE' if po.active else 'inactive'))
+
+    def test_capabilities(self):
+        caps = cfg.settings.capabilities()
+
+        print('\nCython modules:')
+        for mname, (status, detail) in sorted(caps['cython']['modules'].iteritems()):
+            print('  {}\t{} {}'.format(mname, status, detail))
+
+        self.assertEqual(caps['version'], ripyl.__version__)
+        self.assertEqual(caps['cython']['active'], cfg.settings.cython_active)
+
+        # Extensions are never compiled at import unless requested
+        if not cfg.settings.cython_pyximport:
+            self.assertFalse('pyximport' in sys.modules, 'pyximport was loaded')
+
+        if not cfg.settings.use_cython:
+            self.assertEqual(caps['cython']['modules'], {})
+            self.assertEqual(caps['patched'], [])
+
+        loaded = [m for m, (status, _) in caps['cython']['modules'].iteritems() if status == 'loaded']
+        if 'decode' in loaded:
+            self.assertTrue('cython' in caps['functions']['decode.find_edges']['backends'])
+            self.assertTrue('ripyl.decode.EdgeSequence' in caps['patched'])
+        else:
+            self.assertEqual(caps['functions']['decode.find_edges']['backends'], ['python'])
+
+
+    def test_patch_new_modules(self):
+        # Modules that import a patched object by name after patching follow cython_active
+        class Orig(object): pass
+        class Patched(object): pass
+
+        mnames = ['ripyl._patch_test_{}'.format(i) for i in xrange(3)]
+        for mname in mnames:
+            sys.modules[mname] = types.ModuleType(mname)
+
+        cy_disabled = 'cython' in backend.registry.disabled
+        try:
+            settings = cfg.ConfigSettings()
+            sys.modules[mnames[0]].Obj = Orig
+            po = cfg.PatchObject(mnames[0], 'Obj', Patched, Orig)
+            po.activate()
+            settings.patched_objs = [po]
+
+            sys.modules[mnames[1]].Obj = Patched # Imported while active
+            settings.cython_active = False
+            self.assertTrue(all(sys.modules[m].Obj is Orig for m in mnames[:2]), 'Patch not reverted')
+
+            sys.modules[mnames[2]].Obj = Orig # Imported while inactive
+            settings.cython_active = True
+            self.assertTrue(all(sys.modules[m].Obj is Patched for m in mnames), 'Patch not applied')
+            self.assertEqual(len(settings.patched_objs), 3)
+        finally:
+            backend.registry.enable_backend('cython', not cy_disabled)
+            for mname in mnames:
+                del sys.modules[mname]
+
+
+    def test_toggle_after_import(self):
+        import ripyl.decode as decode
+        if cfg.settings.find_patch_obj('ripyl.decode.EdgeSequence') is None:
+            self.skipTest('Cython EdgeSequence is not loaded')
+
+        import ripyl.protocol.uart as uart
+        was_active = cfg.settings.cython_active
+        try:
+            for active in (False, True, False):
+                cfg.settings.cython_active = active
+                self.assertTrue(uart.EdgeSequence is decode.EdgeSequence, \
+                    'Mismatched EdgeSequence with cython_active={}'.format(active))
+                self.assertTrue(uart.MultiEdgeSequence is decode.MultiEdgeSequence)
+        finally:
+            cfg.settings.cython_active = was_active
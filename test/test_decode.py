@@ -29,7 +29,10 @@ import random
 import math
 import sys
 
+import numpy as np
+
 import ripyl.decode as decode
+import ripyl.streaming as stream
 import ripyl.sigproc as sigp
 import test.test_support as tsup
 
@@ -195,7 +198,223 @@ class TestDecodeFuncs(tsup.RandomSeededTestCase):
                 self.assertRelativelyEqual(e[0], f[0], epsilon=0.5, msg='Edge times not close enough {} != {}'.format(e[0], f[0]))
                 self.assertEqual(e[1], f[1], msg='Edges not the same index={}, edge={}, found={}'.format(i, e[1], f[1]))
 
-    
+
+    #@unittest.skip('debug')
+    def test_find_packed_edges(self):
+        self.test_name = 'find_packed_edges() test'
+        self.trial_count = 20
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            dtype = random.choice((np.uint8, np.uint16))
+            channels = 8 if dtype == np.uint8 else 16
+            sample_period = 1.0e-3
+
+            # Use long runs of each word so that channels have sparse edges
+            words = []
+            for _ in xrange(random.randint(1, 100)):
+                words.extend([random.randint(0, 2**channels-1)] * random.randint(1, 50))
+
+            bits = random.sample(xrange(channels), random.randint(1, channels))
+            chunk_size = random.randint(1, 300)
+
+            # Expand each channel into a sample stream for find_edges()
+            expected = {}
+            for b in bits:
+                ch_samples = [(w >> b) & 1 for w in words]
+                ch_stream = stream.samples_to_sample_stream(ch_samples, sample_period, chunk_size=chunk_size)
+                expected[b] = list(decode.find_edges(ch_stream, (0.0, 1.0)))
+
+            packed = stream.packed_samples_to_stream(np.array(words, dtype=dtype), sample_period, chunk_size=chunk_size)
+            edge_streams = decode.packed_edge_streams(packed, bits)
+
+            for b in bits:
+                got = list(edge_streams[b])
+                self.assertEqual([e[1] for e in expected[b]], [e[1] for e in got], 'Mismatched states')
+                for e, g in zip(expected[b], got):
+                    self.assertAlmostEqual(e[0], g[0], places=9)
+
+            # Single channel
+            b = bits[0]
+            packed = stream.packed_samples_to_stream(words, sample_period, chunk_size=chunk_size, dtype=dtype)
+            got = list(decode.find_packed_edges(packed, b))
+            self.assertEqual([e[1] for e in expected[b]], [e[1] for e in got], 'Mismatched states')
+
+
+    def test_find_edge_arrays(self):
+        self.test_name = 'find_edge_arrays() test'
+        self.trial_count = 20
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            channels = []
+            for _ in xrange(random.randint(1, 4)):
+                levels = np.repeat(np.random.randint(0, 2, random.randint(1, 200)), random.randint(1, 30))
+                channels.append(levels + np.random.normal(0.0, random.uniform(0.0, 0.3), len(levels)))
+
+            sample_period = random.uniform(1.0e-9, 1.0e-3)
+            hysteresis = random.uniform(0.1, 0.6)
+            results = decode.find_edge_arrays_parallel(channels, (0.0, 1.0), hysteresis, threads=2)
+
+            for samples, (edge_ix, edge_states) in zip(channels, results):
+                expected = list(decode.find_edges(stream.samples_to_sample_stream(samples, 1.0, \
+                    chunk_size=random.randint(1, 500)), (0.0, 1.0), hysteresis))
+
+                self.assertEqual([int(e[0]) for e in expected], edge_ix.tolist(), 'Mismatched edge indices')
+                self.assertEqual([e[1] for e in expected], edge_states.tolist(), 'Mismatched edge states')
+
+                edges = list(decode.edge_arrays_to_edges(edge_ix, edge_states, 0.5, sample_period))
+                self.assertEqual(len(expected), len(edges), 'Mismatched edge count')
+                for e, g in zip(expected, edges):
+                    self.assertAlmostEqual(0.5 + e[0] * sample_period, g[0], places=9)
+
+
+    def test_skip_idle(self):
+        self.test_name = 'skip_idle() test'
+        self.trial_count = 20
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # Bursts of edges separated by long idle stretches
+            runs = []
+            for _ in xrange(random.randint(1, 10)):
+                burst = np.random.randint(0, 2, random.randint(1, 50))
+                runs.append(np.repeat(burst, random.randint(1, 30)))
+                runs.append(np.repeat(burst[-1:], random.randint(0, 5000)))
+            levels = np.concatenate(runs)
+            samples = levels + np.random.normal(0.0, random.uniform(0.0, 0.3), len(levels))
+
+            hysteresis = random.uniform(0.1, 0.6)
+            edge_ix, edge_states = decode.find_edge_arrays(samples, (0.0, 1.0), hysteresis)
+
+            chunks = list(stream.samples_to_sample_stream(samples, 1.0, chunk_size=random.randint(1, 3000)))
+            reduced = list(decode.skip_idle(iter(chunks), (0.0, 1.0), hysteresis, \
+                block_size=random.choice((1, 7, 256))))
+            self.assertTrue(sum(len(sc.samples) for sc in reduced) <= len(samples))
+
+            for backend in decode.find_edges.hot_function.order:
+                edges = list(decode.find_edges(iter(reduced), (0.0, 1.0), hysteresis, backend=backend))
+                self.assertEqual([int(round(e[0])) for e in edges], edge_ix.tolist(), 'Mismatched edge indices')
+                self.assertEqual([e[1] for e in edges], edge_states.tolist(), 'Mismatched edge states')
+
+        # Scaled integer samples keep their scale and offset
+        codes = np.repeat(np.array([0, 200, 0], dtype=np.int16), 1000)
+        chunks = [stream.SampleChunk(codes, 0.0, 1.0, scale=0.01, offset=-0.5)]
+        reduced = list(decode.skip_idle(iter(chunks), (-0.5, 1.5), block_size=100))
+        self.assertEqual([sc.start_time for sc in reduced], [0.0, 1000.0, 2000.0])
+        self.assertEqual([len(sc.samples) for sc in reduced], [1, 1, 1])
+        self.assertTrue(all(sc.scale == 0.01 and sc.offset == -0.5 for sc in reduced))
+
+
+    def test_find_edges_skip_idle(self):
+        self.test_name = 'find_edges() skip_idle test'
+        self.trial_count = 10
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # A mostly idle capture with short bursts
+            runs = []
+            for _ in xrange(random.randint(1, 6)):
+                runs.append(np.repeat(np.random.randint(0, 2, random.randint(1, 20)), random.randint(1, 20)))
+                runs.append(np.repeat(runs[-1][-1:], random.randint(2000, 20000)))
+            samples = np.concatenate(runs) + np.random.normal(0.0, 0.1, sum(len(r) for r in runs))
+
+            # Chunk sizes that aren't multiples of the idle block size put the
+            # chunk boundaries inside idle blocks
+            chunks = list(stream.samples_to_sample_stream(samples, 1.0, chunk_size=random.randint(300, 5000)))
+
+            expected = None
+            for backend in decode.find_edges.hot_function.order:
+                for skip in (True, False):
+                    edges = list(decode.find_edges(iter(chunks), (0.0, 1.0), skip_idle=skip, backend=backend))
+                    if expected is None:
+                        expected = edges
+                    self.assertEqual(edges, expected, \
+                        'Mismatched edges from {} with skip_idle={}'.format(backend, skip))
+
+
+    def test_decimated_edges(self):
+        self.test_name = 'decimated find_edges() test'
+        self.trial_count = 10
+
+        import ripyl.protocol.uart as uart
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            baud = 9600
+            sample_rate = baud * random.randint(200, 1000)
+            msg = bytearray(random.randint(0, 255) for _ in xrange(10))
+            edges = uart.uart_synth(msg, bits=8, baud=baud, idle_start=3.0 / baud, idle_end=3.0 / baud)
+            samples = list(sigp.noisify(sigp.synth_wave(edges, sample_rate, rise_time=0.2 / baud), \
+                snr_db=random.choice((30, 90))))
+
+            # Min/max decimation with logic levels keeps the original edge times
+            dec_samples = list(sigp.auto_decimate(iter(samples), baud, 20, logic=(0.0, 1.0)))
+            self.assertTrue(sum(len(sc.samples) for sc in dec_samples) < sum(len(sc.samples) for sc in samples) / 2)
+
+            expected = list(decode.find_edges(iter(samples), (0.0, 1.0)))
+            for backend in decode.find_edges.hot_function.order:
+                found = list(decode.find_edges(iter(dec_samples), (0.0, 1.0), backend=backend))
+                self.assertEqual([e[1] for e in found], [e[1] for e in expected], 'Mismatched edge states')
+                for f, e in zip(found, expected):
+                    self.assertAlmostEqual(f[0], e[0], delta=0.01 / sample_rate)
+
+
+    def test_shared_edge_decode(self):
+        self.test_name = 'shared_edge_decode() test'
+        self.trial_count = 5
+
+        import ripyl.protocol.uart as uart
+        import ripyl.protocol.iso_k_line as kline
+
+        def bounds(records):
+            return [(type(r), stream._record_bounds(r)) for r in records]
+
+        def bad_decoder(edges, stream_type):
+            for e in edges:
+                raise stream.StreamError('Not this protocol')
+            yield
+
+        baud = 10400
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            data = [random.randint(0, 255) for _ in xrange(random.randint(5, 30))]
+            edges = list(uart.uart_synth(data, bits=8, baud=baud, idle_start=8.0 / baud, idle_end=8.0 / baud))
+            samples = list(sigp.noisify(sigp.synth_wave(iter(edges), baud * 20.0, \
+                sigp.min_rise_time(baud * 20.0) * 10.0), snr_db=30))
+
+            decoders = [(uart.uart_decode, {'bits': 8, 'baud_rate': baud}), \
+                (uart.uart_decode, {'bits': 7, 'baud_rate': baud}), \
+                (kline.iso_k_line_decode, {}), (bad_decoder, {})]
+
+            errors = {}
+            records = list(decode.shared_edge_decode(iter(samples), decoders, logic_levels=(0.0, 1.0), \
+                errors=errors))
+            self.assertEqual(errors.keys(), [3])
+
+            # Each decoder gets the same records as when it is run by itself
+            for sid, (decoder, kwargs) in enumerate(decoders[:3]):
+                expected = list(decoder(iter(samples), logic_levels=(0.0, 1.0), **kwargs))
+                self.assertEqual(bounds(r for r in records if r.stream_id == sid), bounds(expected))
+
+            self.assertEqual([r.data for r in records if r.stream_id == 0], data)
+
+            # The edges are only pulled from the source once
+            pulled = [0]
+            def count_edges():
+                for e in edges:
+                    pulled[0] += 1
+                    yield e
+
+            list(decode.shared_edge_decode(count_edges(), decoders[:3], stream_type=stream.StreamType.Edges))
+            self.assertEqual(pulled[0], len(edges))
+
+        self.assertRaises(stream.StreamError, list, decode.shared_edge_decode(iter(edges), decoders, \
+            stream_type=stream.StreamType.Edges))
+
+
 class TestEdgeSequence(unittest.TestCase):
     @unittest.skip('debug')
     def test_es(self):
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   feed.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+import time
+import threading
+
+import numpy as np
+
+import ripyl.feed as feed
+import ripyl.sigproc as sigp
+import ripyl.streaming as stream
+import ripyl.protocol.uart as uart
+import test.test_support as tsup
+
+
+def _uart_samples(msg, baud, sample_rate):
+    edges = uart.uart_synth(msg, bits=8, baud=baud, idle_start=200.0 / baud, idle_end=200.0 / baud)
+    samples = sigp.synth_wave(edges, sample_rate, rise_time=0.35 / (baud * 4))
+    return stream.extract_all_samples(samples)[0]
+
+
+class TestFeed(tsup.RandomSeededTestCase):
+    def test_feed_decoder(self):
+        self.test_name = 'FeedDecoder test'
+        self.trial_count = 10
+
+        baud = 115200
+        sample_rate = baud * 10.0
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # Several channels served from one polling loop
+            channels = []
+            for _ in xrange(random.randint(1, 4)):
+                msg = bytearray(random.randint(0, 255) for _ in xrange(random.randint(20, 60)))
+                samples = _uart_samples(msg, baud, sample_rate)
+                dec = feed.FeedDecoder(uart.uart_decode, sample_period=1.0 / sample_rate, maxsize=4, \
+                    bits=8, logic_levels=(0.0, 1.0), baud_rate=baud if random.random() < 0.5 else None)
+                channels.append([msg, samples, dec, []])
+
+            pending = len(channels)
+            while pending > 0:
+                pending = 0
+                for ch in channels:
+                    msg, samples, dec, recs = ch
+                    if len(samples) > 0:
+                        size = random.randint(100, 2000)
+                        if dec.try_feed_samples(samples[:size]):
+                            ch[1] = samples[size:]
+                        if len(ch[1]) == 0:
+                            dec.close()
+
+                    recs.extend(dec.poll())
+                    if not dec.finished:
+                        pending += 1
+
+            for msg, _, dec, recs in channels:
+                self.assertEqual(bytearray(r.data for r in recs), msg, 'Message mismatch')
+
+                # Chunk times continue from one feed to the next
+                self.assertTrue(recs[0].start_time < recs[-1].start_time)
+
+
+    def test_backpressure(self):
+        sample_period = 1.0e-6
+        blocked = []
+        dec = feed.FeedDecoder(uart.uart_decode, sample_period=sample_period, maxsize=2, max_records=1, \
+            bits=8, baud_rate=9600, logic_levels=(0.0, 1.0))
+
+        # Records are never collected so the decoder stalls and the feed fills
+        samples = _uart_samples(bytearray('0123456789'), 9600, 1.0 / sample_period)
+        for _ in xrange(200):
+            if not dec.try_feed_samples(samples):
+                break
+        else:
+            self.fail('Feed never filled')
+
+        self.assertTrue(len(dec.source) <= 2)
+        self.assertFalse(dec.ready)
+        dec.close()
+        recs = list(dec)
+        self.assertEqual(len(recs) % 10, 0)
+        self.assertTrue(dec.finished)
+
+
+    def test_decoder_error(self):
+        def bad_decoder(samples):
+            for sc in samples:
+                yield sc
+                raise ValueError('bad decode')
+
+        dec = feed.FeedDecoder(bad_decoder, sample_period=1.0)
+        dec.feed_samples(np.zeros(10))
+        dec.join(5.0)
+        self.assertRaises(ValueError, dec.poll)
+        self.assertRaises(ValueError, dec.try_feed_samples, np.zeros(10))
+
+        f = feed.SampleFeed()
+        f.close()
+        self.assertRaises(stream.StreamError, f.put, 1)
+        self.assertRaises(stream.StreamError, f.put_samples, [1, 2, 3])
+
+
+    def test_live_decode(self):
+        self.test_name = 'Live FeedDecoder test'
+        self.trial_count = 6
+
+        baud = 115200
+        sample_rate = baud * 10.0
+        bit_samples = int(sample_rate / baud)
+
+        def wait_for(dec, recs, count, timeout=5.0):
+            t_end = time.time() + timeout
+            while len(recs) < count and time.time() < t_end:
+                recs.extend(dec.poll())
+                time.sleep(0.002)
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            msg = bytearray(random.randint(0, 255) for _ in xrange(random.randint(5, 20)))
+            edges = uart.uart_synth(msg, bits=8, baud=baud, idle_start=10.0 / baud, idle_end=0.0)
+            samples = stream.extract_all_samples(sigp.synth_wave(edges, sample_rate, \
+                rise_time=0.35 / (baud * 4)))[0]
+
+            # Stop feeding part way through the last stop bit
+            samples = samples[:-bit_samples // 2 - 2]
+
+            mode = i % 3
+            dec = feed.FeedDecoder(uart.uart_decode, sample_period=1.0 / sample_rate, live=True, \
+                logic_levels=(0.0, 1.0), idle_timeout=0.05 if mode == 2 else None, bits=8, baud_rate=baud)
+
+            chunk_size = random.randint(50, 500)
+            for s in xrange(0, len(samples), chunk_size):
+                dec.feed_samples(samples[s:s + chunk_size])
+
+            # Everything but the last frame is reported without waiting for more edges
+            recs = []
+            wait_for(dec, recs, len(msg) - 1)
+            self.assertEqual(bytearray(r.data for r in recs), msg[:-1], 'Frames were held back')
+
+            if mode == 0: # No more data so the last frame can't be finished
+                time.sleep(0.05)
+                recs.extend(dec.poll())
+                self.assertEqual(len(recs), len(msg) - 1)
+            elif mode == 1: # Explicit flush
+                self.assertTrue(dec.flush())
+            # mode 2 flushes from poll() after the idle timeout
+
+            if mode > 0:
+                wait_for(dec, recs, len(msg))
+                self.assertEqual(bytearray(r.data for r in recs), msg, 'Flush failed')
+                self.assertTrue(0.0 < dec.max_latency < 5.0)
+                self.assertTrue(0.0 <= dec.latency.mean() <= dec.max_latency)
+
+            dec.close()
+            recs.extend(list(dec))
+            self.assertEqual(bytearray(r.data for r in recs), msg)
+
+
+    def test_record_handoff(self):
+        self.test_name = 'Record handoff test'
+        self.trial_count = 10
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # The consumer polls like an event loop. Wake calls stand in for
+            # call_soon_threadsafe() and are only made while it is waiting.
+            maxsize = random.randint(1, 5)
+            wakes = []
+            handoff = feed._RecordHandoff(maxsize, lambda: wakes.append(handoff.waiting))
+            count = random.randint(0, 200)
+            max_held = [0]
+
+            def produce():
+                for r in xrange(count):
+                    handoff.put(r)
+                    max_held[0] = max(max_held[0], len(handoff))
+                    if random.random() < 0.1:
+                        time.sleep(0.001)
+                handoff.finish()
+
+            producer = threading.Thread(target=produce)
+            producer.start()
+
+            recs = []
+            t_end = time.time() + 10.0
+            while time.time() < t_end:
+                rec = handoff.take()
+                if rec is feed._END:
+                    break
+                if rec is None:
+                    time.sleep(0.0005)
+                else:
+                    recs.append(rec)
+
+            producer.join(5.0)
+            self.assertEqual(recs, range(count), 'Records lost or out of order')
+            self.assertTrue(max_held[0] <= maxsize, 'Queue exceeded maxsize')
+            self.assertTrue(all(wakes), 'Woken without a waiting consumer')
+            self.assertTrue(handoff.take() is feed._END)
+
+        # The feed reports each item as it is consumed
+        got = []
+        f = feed.SampleFeed()
+        f.on_get = lambda: got.append(len(f))
+        for x in xrange(3):
+            f.put(x)
+        f.close()
+        self.assertEqual(list(f), range(3))
+        self.assertEqual(got, [2, 1, 0])
+
+
+    @unittest.skipIf(feed.asyncio is None, 'asyncio is not available')
+    def test_async_decoder(self):
+        self.test_name = 'AsyncFeedDecoder test'
+        self.trial_count = 4
+
+        baud = 115200
+        sample_rate = baud * 10.0
+
+        class AsyncBlocks(object):
+            '''Asynchronous iterator over blocks of samples'''
+            def __init__(self, loop, samples, size):
+                self.loop = loop
+                self.blocks = [samples[s:s + size] for s in xrange(0, len(samples), size)]
+
+            def __aiter__(self):
+                return self
+
+            def __anext__(self):
+                fut = self.loop.create_future()
+                if self.blocks:
+                    self.loop.call_soon(fut.set_result, self.blocks.pop(0))
+                else:
+                    self.loop.call_soon(fut.set_exception, StopAsyncIteration())
+                return fut
+
+        def collect(dec):
+            recs = []
+            it = dec.__aiter__()
+            while True:
+                try:
+                    recs.append(loop.run_until_complete(it.__anext__()))
+                except StopAsyncIteration:
+                    break
+            return recs
+
+        loop = feed.asyncio.new_event_loop()
+        try:
+            for i in xrange(self.trial_count):
+                self.update_progress(i+1)
+
+                # Several channels share one event loop
+                channels = []
+                for _ in xrange(random.randint(1, 4)):
+                    msg = bytearray(random.randint(0, 255) for _ in xrange(random.randint(20, 60)))
+                    samples = _uart_samples(msg, baud, sample_rate)
+                    dec = feed.AsyncFeedDecoder(uart.uart_decode, loop=loop, sample_period=1.0 / sample_rate, \
+                        maxsize=2, max_records=4, bits=8, logic_levels=(0.0, 1.0), baud_rate=baud)
+                    pumped = dec.pump(AsyncBlocks(loop, samples, random.randint(100, 2000)))
+                    channels.append((msg, dec, pumped))
+
+                for msg, dec, pumped in channels:
+                    recs = collect(dec)
+                    self.assertEqual(bytearray(r.data for r in recs), msg, 'Message mismatch')
+                    self.assertTrue(pumped.done())
+
+                # Feeding a closed decoder fails
+                dec = channels[0][1]
+                self.assertRaises(stream.StreamError, loop.run_until_complete, dec.feed_samples(np.zeros(10)))
+        finally:
+            loop.close()
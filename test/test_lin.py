@@ -28,6 +28,7 @@ import unittest
 import random
 
 import ripyl.protocol.lin as lin
+import ripyl.sigproc as sigp
 import ripyl.streaming as stream
 import test.test_support as tsup
 
@@ -111,3 +112,49 @@ class TestLINFuncs(tsup.RandomSeededTestCase):
                 self.assertEqual(r.data, o, 'Frames are different')
             
 
+
+    def test_lin_decimated_decode(self):
+        self.test_name = 'LIN decimated decode'
+        self.trial_count = 10
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            frames = []
+            for _ in xrange(random.randint(1, 3)):
+                data = [random.randint(0,0xFF) for b in xrange(random.randint(0, 8))]
+                frames.append(lin.LINFrame(random.randint(0, 50), data))
+
+            baud = 9600
+            sample_rate = baud * random.randint(200, 500)
+            rise_time = 0.2 / baud
+
+            edges = list(lin.lin_synth(frames, baud, frame_interval=10.0 / baud, \
+                idle_start=4.0 / baud, idle_end=8.0 / baud, byte_interval=3.0 / baud))
+            samples = list(sigp.synth_wave(iter(edges), sample_rate, rise_time))
+
+            method = random.choice(('minmax', 'fir'))
+            dec_samples = list(sigp.auto_decimate(iter(samples), baud, 20, method))
+            dec_spb = 1.0 / (dec_samples[0].sample_period * baud)
+            self.assertTrue(19.99 < dec_spb < 23.0, 'Wrong decimated sample rate: {}'.format(dec_spb))
+
+            records = list(lin.lin_decode(iter(samples), baud_rate=baud, samples_per_bit=20))
+            ref_records = list(lin.lin_decode(iter(samples), baud_rate=baud))
+
+            self.assertEqual(len(records), len(frames), 'Decoded frame count mismatch: {} -> {}'.format(len(frames), len(records)))
+            for r, ref, o in zip(records, ref_records, frames):
+                self.assertEqual(r.data, o, 'Frames are different')
+                self.assertAlmostEqual(r.start_time, ref.start_time, delta=0.01 / sample_rate, \
+                    msg='Frame timing is inaccurate')
+
+            # Auto-baud with enough frames for the rate to be found
+            frames = [lin.LINFrame(random.randint(0, 50), [random.randint(0, 0xFF) for b in xrange(8)]) \
+                for _ in xrange(6)]
+            edges = list(lin.lin_synth(frames, baud, frame_interval=10.0 / baud, \
+                idle_start=4.0 / baud, idle_end=8.0 / baud, byte_interval=3.0 / baud))
+            samples = list(sigp.synth_wave(iter(edges), sample_rate, rise_time))
+
+            param_info = {}
+            records = list(lin.lin_decode(iter(samples), samples_per_bit=20, param_info=param_info))
+            self.assertEqual([r.data for r in records], frames, 'Frames are different with auto-baud')
+            self.assertRelativelyEqual(baud, param_info['baud_rate'], 0.01, \
+                'Decoded incorrect baud rate {} -> {}'.format(baud, param_info['baud_rate']))
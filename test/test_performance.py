@@ -28,9 +28,19 @@ import unittest
 import random
 import time
 
+import sys
+import subprocess
+import json
+
 import ripyl
 import ripyl.decode as decode
 import ripyl.sigproc as sigp
+import ripyl.streaming as stream
+import ripyl.protocol.uart as uart
+import ripyl.protocol.can as can
+import ripyl.protocol.i2c as i2c
+import ripyl.protocol.infrared as ir
+import ripyl.protocol.infrared.nec as nec
 import test.test_support as tsup
 
 
@@ -118,3 +128,124 @@ class TestPerformance(unittest.TestCase):
         return (iterations, samples_processed, 'samples')
 
 
+    def test_edge_sequence_decoders(self):
+        print('\nComparing decoder rates with Python and Cython edge sequences...')
+
+        # Decoder modules that hold their own reference to the edge sequence classes
+        seq_names = ('EdgeSequence', 'MultiEdgeSequence')
+        seq_modules = [decode, uart, can, i2c, ir.ir_common]
+        py_classes = dict((n, getattr(ripyl.decode, n)) for n in seq_names)
+        cy_classes = {}
+        for n in seq_names:
+            po = ripyl.config.settings.find_patch_obj('ripyl.decode.' + n)
+            if po is not None:
+                py_classes[n] = po.orig_obj
+                cy_classes[n] = po.obj
+
+        def use_classes(classes):
+            for m in seq_modules:
+                for n, c in classes.iteritems():
+                    if n in m.__dict__:
+                        m.__dict__[n] = c
+
+        random.seed(1234)
+
+        uart_edges = list(uart.uart_synth([random.randint(0, 255) for _ in xrange(500)], bits=8, baud=115200))
+
+        can_frames = [can.CANStandardFrame(random.randint(0, 0x7FF), [random.randint(0, 255) for _ in xrange(8)]) \
+            for _ in xrange(50)]
+        can_edges = list(can.can_synth(can_frames, 500.0e3, idle_start=1.0e-5)[1])
+
+        nec_msgs = [nec.NECMessage(cmd=random.randint(0, 255), addr_low=random.randint(0, 255)) for _ in xrange(5)]
+        nec_edges = list(ir.modulate(nec.nec_synth(nec_msgs), 38.0e3, duty_cycle=0.3))
+
+        transfers = [i2c.I2CTransfer(i2c.I2C.Write, 0x23, [random.randint(0, 255) for _ in xrange(20)]) \
+            for _ in xrange(20)]
+        scl, sda = i2c.i2c_synth(transfers, 100.0e3, idle_start=3.0e-5, idle_end=3.0e-5)
+        scl = list(scl)
+        sda = list(sda)
+
+        decoders = [
+            ('UART', lambda: uart.uart_decode(iter(uart_edges), bits=8, baud_rate=115200, \
+                stream_type=stream.StreamType.Edges)),
+            ('CAN', lambda: can.can_decode(iter(can_edges), bit_rate=500.0e3, stream_type=stream.StreamType.Edges)),
+            ('NEC', lambda: nec.nec_decode(iter(nec_edges), stream_type=stream.StreamType.Edges)),
+            ('I2C', lambda: i2c.i2c_decode(iter(scl), iter(sda), stream_type=stream.StreamType.Edges))
+        ]
+
+        iterations = 5
+        impls = [('Python', py_classes)]
+        if cy_classes:
+            impls.append(('Cython', cy_classes))
+
+        try:
+            for name, decoder in decoders:
+                times = []
+                for impl_name, classes in impls:
+                    use_classes(classes)
+                    t_start = time.time()
+                    for _ in xrange(iterations):
+                        records = list(decoder())
+                    times.append((time.time() - t_start) / iterations)
+
+                    self.assertTrue(len(records) > 0, 'No records decoded')
+
+                report = '  {:<6} '.format(name) + ', '.join('{} {:.2f} ms'.format(impl[0], t * 1.0e3) \
+                    for impl, t in zip(impls, times))
+                if len(times) > 1:
+                    report += ', speedup {:.2f}x'.format(times[0] / times[1])
+                print(report)
+
+        finally:
+            use_classes(cy_classes if ripyl.config.settings.cython_active else py_classes)
+
+
+    def test_import_time(self):
+        print('\nMeasuring cold import time...')
+
+        # Each import runs in a fresh interpreter so nothing is cached in sys.modules
+        probe = 'import time, sys, json; t = time.time(); import {}; t = time.time() - t; ' \
+            'print(json.dumps([t, sorted(m for m in sys.modules if sys.modules[m] is not None)]))'
+
+        def import_time(mname):
+            best = None
+            for _ in xrange(3):
+                out = subprocess.check_output([sys.executable, '-c', probe.format(mname)])
+                t, modules = json.loads(out.splitlines()[-1])
+                best = t if best is None else min(best, t)
+            return best, modules
+
+        np_time, _ = import_time('numpy')
+        ripyl_time, modules = import_time('ripyl')
+        print('  numpy: {:.1f} ms, ripyl: {:.1f} ms'.format(np_time * 1.0e3, ripyl_time * 1.0e3))
+
+        # Heavy dependencies and protocol modules must not load until they are used
+        for prefix in ('scipy.signal', 'scipy.stats', 'matplotlib', 'ripyl.protocol.', 'ripyl.util.plot'):
+            loaded = [m for m in modules if m == prefix or m.startswith(prefix + '.') or \
+                (prefix.endswith('.') and m.startswith(prefix))]
+            self.assertEqual(loaded, [], 'Modules imported eagerly: {}'.format(loaded))
+
+        self.assertTrue(ripyl_time < np_time + 0.5, 'Import of ripyl is too slow')
+
+
+    def test_benchmark_suite(self):
+        import test.benchmark as bench
+
+        print('\nRunning benchmark suite at reduced scale...')
+        results = bench.run_suite(scales=[0.1], repeat=1, isolate=False)
+
+        self.assertEqual(len(results['results']), len(bench.cases))
+        for key, r in results['results'].iteritems():
+            self.assertTrue(len(r['rates']) > 0, 'No rates for {}'.format(key))
+            for unit, rate in r['rates'].iteritems():
+                self.assertTrue(rate > 0.0, 'Nothing processed by {} ({})'.format(key, unit))
+
+        # A baseline twice as fast should flag every case as a regression
+        baseline = json.loads(json.dumps(results))
+        for r in baseline['results'].itervalues():
+            r['time'] /= 2.0
+
+        comparison = bench.compare(results, baseline)
+        self.assertEqual(len(comparison), len(results['results']))
+        self.assertTrue(all(regressed for _, _, regressed in comparison))
+        self.assertFalse(any(regressed for _, _, regressed in bench.compare(results, results)))
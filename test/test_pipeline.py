@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   pipeline.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+
+import ripyl.pipeline as pipeline
+import ripyl.sigproc as sigp
+import ripyl.decode as decode
+import ripyl.streaming as stream
+import ripyl.protocol.uart as uart
+import test.test_support as tsup
+
+
+def _fail_after(items, count):
+    for i, item in enumerate(items):
+        if i == count:
+            raise ValueError('Stage failed')
+        yield item
+
+def _take(items, count):
+    for i, item in enumerate(items):
+        if i == count:
+            break
+        yield item
+
+
+class TestPipeline(tsup.RandomSeededTestCase):
+    def test_uart_pipeline(self):
+        self.test_name = 'Pipeline UART test'
+        self.trial_count = 6
+
+        baud = 115200
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            msg = bytearray(random.randint(0, 255) for _ in xrange(random.randint(10, 100)))
+            edges = list(uart.uart_synth(msg, bits=8, baud=baud, idle_start=1.0e-4, idle_end=1.0e-4))
+            samples = list(sigp.noisify(sigp.synth_wave(iter(edges), 20 * baud, \
+                rise_time=0.35 / (baud * 4)), snr_db=30.0))
+            samples = list(stream.rechunkify(iter(samples), random.randint(100, 5000)))
+
+            mode = random.choice(('thread', 'process'))
+            pipe = pipeline.Pipeline(maxsize=random.randint(1, 4), batch=random.choice((None, 1, 7)))
+            src = pipe.source('samples', samples)
+            found = pipe.stage('edges', decode.find_edges, (src, (0.0, 1.0)), mode=mode)
+
+            # Two decoders sharing the edges
+            kwargs = {'bits': 8, 'baud_rate': baud, 'stream_type': stream.StreamType.Edges}
+            rec_a = pipe.stage('uart_a', uart.uart_decode, (found,), kwargs)
+            rec_b = pipe.stage('uart_b', uart.uart_decode, (found,), kwargs, mode=mode)
+            out_a = pipe.sink('out_a', rec_a)
+            out_b = pipe.sink('out_b', rec_b)
+            self.assertTrue(pipe.run(20.0), 'Pipeline timed out')
+
+            self.assertEqual(bytearray(r.data for r in out_a.results), msg)
+            self.assertEqual(bytearray(r.data for r in out_b.results), msg)
+
+            self.assertEqual(pipe['samples'].stats.samples, sum(len(sc.samples) for sc in samples))
+            self.assertEqual(pipe['edges'].stats.edges, len(list(decode.find_edges(iter(samples), (0.0, 1.0)))))
+            self.assertEqual(pipe['uart_b'].stats.records, len(msg))
+            self.assertEqual(pipe['out_a'].stats.records, len(msg))
+            self.assertTrue(all(s.finished for s in pipe.stats))
+            self.assertEqual(len(pipe.report().splitlines()), len(pipe.nodes) + 2)
+
+
+    def test_errors(self):
+        self.test_name = 'Pipeline error test'
+        self.trial_count = 4
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # A failure in any node stops the others even when they are blocked
+            mode = ('thread', 'process')[i % 2]
+            pipe = pipeline.Pipeline(maxsize=2, batch=1)
+            src = pipe.source('count', xrange(100000))
+            stage = pipe.stage('fail', _fail_after, (src, random.randint(0, 1000)), mode=mode)
+            pipe.stage('unused', _take, (src, 10))
+            pipe.sink('out', stage)
+            self.assertRaises(ValueError, pipe.run, 20.0)
+            self.assertFalse(pipe['out'].stats.finished)
+
+        # A stage that stops early doesn't block its source
+        pipe = pipeline.Pipeline(maxsize=2, batch=1)
+        src = pipe.source('count', xrange(1000))
+        out = pipe.sink('out', pipe.stage('take', _take, (src, 10)))
+        self.assertRaises(ValueError, pipe.source, 'count', [])
+        self.assertTrue(pipe.run(20.0))
+        self.assertEqual(out.results, range(10))
+        self.assertTrue(pipe['count'].stats.finished)
+
+        self.assertRaises(stream.StreamError, pipe.start)
+        other = pipeline.Pipeline()
+        self.assertRaises(ValueError, other.sink, 'out', src)
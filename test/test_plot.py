@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   plot.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+import os
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+import ripyl.util.plot as rplot
+import ripyl.streaming as stream
+import test.test_support as tsup
+
+class TestPlotFuncs(tsup.RandomSeededTestCase):
+
+    def setUp(self):
+        super(TestPlotFuncs, self).setUp()
+
+        self.out_dir = os.path.join('test', 'test-output')
+        if not os.path.exists(self.out_dir):
+            os.mkdir(self.out_dir)
+
+    def test_envelope_pyramid(self):
+        self.test_name = 'EnvelopePyramid test'
+        self.trial_count = 20
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            sample_count = random.randint(1, 200000)
+            samples = np.random.normal(0.0, 1.0, sample_count)
+            sample_period = random.uniform(1.0e-9, 1.0e-3)
+            start_time = random.uniform(-1.0, 1.0)
+            chunk_size = random.randint(1, 20000)
+
+            raw_limit = random.choice((0, 1000000))
+            env = rplot.EnvelopePyramid(stream.samples_to_sample_stream(samples, sample_period, start_time, \
+                chunk_size), base_factor=random.randint(1, 64), ratio=random.randint(2, 8), raw_limit=raw_limit)
+
+            self.assertEqual(env.sample_count, sample_count, 'Wrong sample count')
+            self.assertEqual(env.bounds(), (samples.min(), samples.max()), 'Wrong bounds')
+
+            # Random window
+            ix0 = random.randint(0, sample_count - 1)
+            ix1 = random.randint(ix0 + 1, sample_count)
+            width = random.randint(1, 2000)
+            t, mins, maxs = env.envelope(start_time + ix0 * sample_period, start_time + ix1 * sample_period, width)
+
+            self.assertTrue(len(t) <= width, 'Envelope is too wide')
+            self.assertEqual(len(t), len(mins), 'Mismatched length')
+            self.assertEqual(len(t), len(maxs), 'Mismatched length')
+            self.assertTrue(np.all(mins <= maxs), 'Min exceeds max')
+
+            # The envelope covers the window
+            t_ix = np.round((t - start_time) / sample_period).astype(int)
+            self.assertTrue(t_ix[0] <= ix0, 'Envelope starts late')
+            self.assertTrue(mins.min() <= samples[ix0:ix1].min(), 'Missing minimum')
+            self.assertTrue(maxs.max() >= samples[ix0:ix1].max(), 'Missing maximum')
+
+            # Each point is the true envelope of the samples it spans
+            spans = list(t_ix) + [min(t_ix[-1] + (t_ix[1] - t_ix[0] if len(t_ix) > 1 else sample_count), sample_count)]
+            for j in xrange(len(t) - 1):
+                self.assertEqual(mins[j], samples[spans[j]:spans[j+1]].min(), 'Bad envelope minimum')
+                self.assertEqual(maxs[j], samples[spans[j]:spans[j+1]].max(), 'Bad envelope maximum')
+
+
+    def test_plot_envelope(self):
+        self.test_name = 'Plotter envelope test'
+        self.trial_count = 1
+        self.update_progress(1)
+
+        samples = np.sin(np.arange(500000) * 0.001)
+        channels = {'sin': stream.samples_to_sample_stream(samples, 1.0e-6)}
+
+        plotter = rplot.Plotter()
+        plotter.plot(channels, title='Envelope')
+
+        trace_t, trace_v = plotter.traces['sin'].get_data()
+        width = int(plotter.fig.get_size_inches()[0] * plotter.fig.dpi)
+        self.assertTrue(len(trace_t) <= 2 * width, 'Too many points plotted')
+        self.assertAlmostEqual(max(trace_v), 1.0, places=6)
+
+        # Zooming recomputes the envelope
+        plotter.axes[-1].set_xlim(0.1, 0.1 + 100.0e-6)
+        trace_t, trace_v = plotter.traces['sin'].get_data()
+        self.assertTrue(trace_t[0] <= 0.1 and trace_t[-1] >= 0.1 + 99.0e-6, 'Wrong zoom window')
+
+        # A zoom on the shared x-axis triggers a single redraw
+        plotter = rplot.Plotter(headless=True)
+        plotter.plot(dict(('ch{}'.format(i), stream.samples_to_sample_stream(samples, 1.0e-6)) for i in xrange(3)))
+        self.assertEqual(1, sum(len(ax.callbacks.callbacks.get('xlim_changed', {})) for ax in plotter.axes))
+
+
+    def test_annotation_culling(self):
+        self.test_name = 'Plotter annotation culling test'
+        self.trial_count = 1
+        self.update_progress(1)
+
+        samples = np.sin(np.arange(1000000) * 0.01)
+        channels = {'data': stream.samples_to_sample_stream(samples, 1.0e-6)}
+
+        # 10^5 frames with a data subrecord each
+        records = []
+        for i in xrange(100000):
+            frame = stream.StreamSegment((i * 10.0e-6, i * 10.0e-6 + 8.0e-6), kind='frame')
+            frame.annotate('frame')
+            data = stream.StreamSegment((i * 10.0e-6 + 2.0e-6, i * 10.0e-6 + 6.0e-6), i & 0xFF, kind='data')
+            data.annotate('data')
+            frame.subrecords.append(data)
+            records.append(frame)
+
+        plotter = rplot.Plotter()
+        plotter.plot(channels, records, title='Culling', max_artists=500)
+
+        self.assertTrue(len(plotter.ann_artists) <= 500, 'Too many artists')
+        labels = [a.get_text() for a in plotter.ann_artists if hasattr(a, 'get_text')]
+        self.assertTrue(any(l.endswith(' frames') for l in labels), 'Missing aggregate frames')
+
+        # Zoomed in, the individual frames and their data are drawn
+        plotter.axes[-1].set_xlim(0.5, 0.5 + 100.0e-6)
+        patch_count = len([a for a in plotter.ann_artists if not hasattr(a, 'get_text')])
+        self.assertTrue(20 <= patch_count <= 24, 'Wrong number of visible patches: {}'.format(patch_count))
+        labels = [a.get_text() for a in plotter.ann_artists if hasattr(a, 'get_text')]
+        self.assertFalse(any(l.endswith(' frames') for l in labels), 'Unexpected aggregate frames')
+
+
+    def test_render_windows(self):
+        self.test_name = 'render_windows() test'
+        self.trial_count = 2
+
+        sample_period = 1.0e-6
+        records = []
+        for i in xrange(1000):
+            frame = stream.StreamSegment((i * 1.0e-3, i * 1.0e-3 + 0.8e-3), i & 0xFF, kind='frame')
+            frame.annotate('frame')
+            records.append(frame)
+
+        for i, processes in enumerate((1, 2)):
+            self.update_progress(i+1)
+
+            samples = np.sin(np.arange(1000000) * 0.01)
+            channels = OrderedDict([('A', stream.samples_to_sample_stream(samples, sample_period)), \
+                ('B', stream.samples_to_sample_stream(samples * 2.0, sample_period))])
+
+            windows = [(t, t + 5.0e-3) for t in (0.0, 0.25, 0.5, 0.99)]
+            fnames = [os.path.join(self.out_dir, 'render_{}_{}.png'.format(processes, j)) \
+                for j in xrange(len(windows))]
+            for f in fnames:
+                if os.path.exists(f):
+                    os.remove(f)
+
+            rendered = rplot.render_windows(channels, windows, fnames, records, processes=processes, \
+                figsize=(4.0, 2.0), title='Window')
+
+            self.assertEqual(rendered, fnames, 'Wrong rendered files')
+            for f in fnames:
+                with open(f, 'rb') as fh:
+                    self.assertEqual(fh.read(8), b'\x89PNG\r\n\x1a\n', 'Not a PNG file')
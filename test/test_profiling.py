@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   profiling.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+
+import ripyl.util.profiling as prof
+import ripyl.sigproc as sigp
+import ripyl.decode as decode
+import ripyl.streaming as stream
+import ripyl.protocol.uart as uart
+import test.test_support as tsup
+
+
+class _FakeClock(object):
+    '''Deterministic timer that only advances when told to'''
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, duration):
+        self.now += duration
+
+def _slow_stage(items, clock, duration):
+    for i in items:
+        clock.advance(duration)
+        yield i
+
+
+class TestPipelineProfiler(tsup.RandomSeededTestCase):
+    def test_stage_counts(self):
+        msg = bytearray('Hello, world')
+        baud = 115200
+
+        p = prof.PipelineProfiler()
+        edges = p.stage('synth', uart.uart_synth(msg, bits=8, baud=baud, idle_start=1.0e-4))
+        samples = p.stage('samples', sigp.synth_wave(edges, 20 * baud, rise_time=0.35 / (baud * 4)))
+        samples = p.stage('noisify', sigp.noisify(samples, snr_db=30.0))
+        found_edges = p.stage('edges', decode.find_edges(samples, (0.0, 1.0)))
+        records = list(p.stage('decode', uart.uart_decode(found_edges, bits=8, baud_rate=baud, \
+            stream_type=stream.StreamType.Edges)))
+
+        self.assertEqual(bytearray(r.data for r in records), msg)
+        self.assertEqual([s.name for s in p.stages], ['synth', 'samples', 'noisify', 'edges', 'decode'])
+        self.assertTrue(all(s.finished for s in p.stages))
+
+        self.assertTrue(p['synth'].edges > 0)
+        self.assertTrue(p['samples'].samples > 0)
+        self.assertEqual(p['samples'].samples, p['noisify'].samples)
+        self.assertEqual(p['decode'].records, len(msg))
+        self.assertEqual(p['decode'].items, len(msg))
+
+        report = p.report()
+        for s in p.stages:
+            self.assertTrue(s.name in report)
+
+
+    def test_exclusive_time(self):
+        clock = _FakeClock()
+        p = prof.PipelineProfiler(timer=clock)
+        s = p.stage('a', _slow_stage(xrange(10), clock, 0.002))
+        s = p.stage('b', _slow_stage(s, clock, 0.004))
+        s = p.stage('c', _slow_stage(s, clock, 0.001))
+        self.assertEqual(list(s), range(10))
+
+        # Exclusive times should sum to the inclusive time of the last stage
+        self.assertAlmostEqual(sum(st.time for st in p.stages), p['c'].total_time, places=9)
+        self.assertAlmostEqual(p['a'].time, 0.020, places=9)
+        self.assertAlmostEqual(p['b'].time, 0.040, places=9)
+        self.assertAlmostEqual(p['c'].time, 0.010, places=9)
+        self.assertAlmostEqual(p['b'].total_time, 0.060, places=9)
+
+        # Reusing a stage name accumulates statistics
+        list(p.stage('a', xrange(5)))
+        self.assertEqual(p['a'].items, 15)
+
+        p.reset()
+        self.assertEqual(p.stages, [])
+
+
+    def test_disabled(self):
+        p = prof.PipelineProfiler(enabled=False)
+        src = iter(xrange(5))
+        self.assertTrue(p.stage('a', src) is src)
+        self.assertEqual(p.stages, [])
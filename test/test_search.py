@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   search.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+
+import ripyl.search as search
+import ripyl.decode as decode
+import ripyl.sigproc as sigp
+import ripyl.streaming as stream
+import ripyl.protocol.can as can
+import ripyl.protocol.i2c as i2c
+import test.test_support as tsup
+
+
+def _sample_wave(edges, sample_rate, rise_time, chunk_size):
+    samples = sigp.noisify(sigp.synth_wave(iter(edges), sample_rate, rise_time), snr_db=30.0)
+    return list(stream.rechunkify(samples, chunk_size))
+
+
+class TestSearch(tsup.RandomSeededTestCase):
+    def test_active_regions(self):
+        self.test_name = 'Active region search'
+        self.trial_count = 20
+
+        min_gap = 1.0e-3
+        sample_rate = 100.0e3
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # Bursts of edges separated by idle gaps
+            edges = [(0.0, 0)]
+            bursts = 0
+            t = random.uniform(0.0, 2.0e-3)
+            for _ in xrange(random.randint(1, 20)):
+                for _ in xrange(random.randint(1, 30)):
+                    edges.append((t, 1 - edges[-1][1]))
+                    t += random.uniform(0.05e-3, 0.6e-3)
+                bursts += 1
+                t += random.uniform(1.2e-3, 10.0e-3)
+            edges.append((t, edges[-1][1]))
+
+            samples = _sample_wave(edges, sample_rate, sigp.min_rise_time(sample_rate) * 2, random.randint(10, 20000))
+            regions = list(search.find_active_regions([iter(samples)], (0.0, 1.0), min_gap, \
+                block_size=random.choice((None, 1, 7))))
+
+            self.assertEqual(len(regions), bursts)
+
+            # Every edge is inside a region with some idle time before it
+            found_edges = list(decode.find_edges(iter(samples), (0.0, 1.0)))[1:]
+            for t, _ in found_edges:
+                self.assertTrue(any(r.start_time < t < r.end_time for r in regions), \
+                    'Edge at {} outside of regions'.format(t))
+
+        # An idle stream has no regions
+        samples = _sample_wave([(0.0, 1), (0.1, 1)], sample_rate, sigp.min_rise_time(sample_rate) * 2, 5000)
+        self.assertEqual(list(search.find_active_regions([iter(samples)], (0.0, 1.0), min_gap)), [])
+
+
+    def test_can_search(self):
+        self.test_name = 'CAN frame search'
+        self.trial_count = 10
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            bit_rate = random.choice((125.0e3, 250.0e3, 500.0e3))
+            ids = [random.randint(0, 0x7FF), random.randint(0, 0x1FFFFFFF)]
+
+            frames = []
+            for _ in xrange(random.randint(10, 40)):
+                data = [random.randint(0, 255) for _ in xrange(random.randint(0, 8))]
+                ifs_bits = random.choice((3, random.randint(3, 2000)))
+                if random.random() < 0.3:
+                    frame_id = random.choice((ids[1], random.randint(0, 0x1FFFFFFF)))
+                    frames.append(can.CANExtendedFrame(frame_id, data, ifs_bits=ifs_bits))
+                else:
+                    frame_id = random.choice((ids[0], random.randint(0, 0x7FF)))
+                    frames.append(can.CANStandardFrame(frame_id, data, ifs_bits=ifs_bits))
+
+            ch, _ = can.can_synth(frames, bit_rate, idle_start=1.0e-4, idle_end=1.0e-4)
+            sample_rate = 10.0 * bit_rate
+            samples = _sample_wave(ch, sample_rate, 0.35 / (bit_rate * 4), random.randint(100, 20000))
+
+            expected = [r for r in can.can_decode(iter(samples), polarity=can.CANConfig.IdleLow, \
+                bit_rate=bit_rate, logic_levels=(0.0, 1.0)) if r.kind == 'CAN frame' and r.data.full_id in ids]
+
+            info = {}
+            # Long idle periods can defeat auto level detection
+            found = list(search.can_search(iter(samples), ids, bit_rate, polarity=can.CANConfig.IdleLow, \
+                logic_levels=(0.0, 1.0), search_info=info))
+
+            self.assertEqual([r.data for r in found], [r.data for r in expected])
+            for f, e in zip(found, expected):
+                self.assertAlmostEqual(f.start_time, e.start_time, delta=1.0e-12)
+                self.assertAlmostEqual(f.end_time, e.end_time, delta=2.0 / sample_rate)
+
+            self.assertEqual(info['samples'], sum(len(sc.samples) for sc in samples))
+            self.assertEqual(info['headers'], len(frames))
+            self.assertEqual(info['decoded'], sum(1 for f in frames if f.full_id in ids))
+
+
+    def test_i2c_search(self):
+        self.test_name = 'I2C transfer search'
+        self.trial_count = 10
+
+        clock_freq = 100.0e3
+        sample_rate = 20.0 * clock_freq
+        addresses = (0x48, 0x183)
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # Groups of transfers joined by restarts with idle time between groups
+            scl = [(0.0, 1)]
+            sda = [(0.0, 1)]
+            transfers = []
+            for _ in xrange(random.randint(1, 10)):
+                group = []
+                for _ in xrange(random.randint(1, 4)):
+                    addr = random.choice(addresses + (random.randint(1, 0x3FF),))
+                    data = [random.randint(0, 255) for _ in xrange(random.randint(1, 6))]
+                    r_wn = random.choice((i2c.I2C.Write, i2c.I2C.Read))
+                    if r_wn == i2c.I2C.Read and addr > 0x77: # 10-bit reads follow a write
+                        group.append(i2c.I2CTransfer(i2c.I2C.Write, addr, data))
+                    group.append(i2c.I2CTransfer(r_wn, addr, data))
+
+                g_scl, g_sda = i2c.i2c_synth(group, clock_freq, idle_start=random.uniform(0.2e-3, 2.0e-3))
+                offset = max(scl[-1][0], sda[-1][0])
+                scl.extend((t + offset, s) for t, s in list(g_scl)[1:])
+                sda.extend((t + offset, s) for t, s in list(g_sda)[1:])
+                transfers.extend(group)
+
+            end_time = max(scl[-1][0], sda[-1][0]) + 1.0e-4
+            scl.append((end_time, 1))
+            sda.append((end_time, 1))
+
+            chunk_size = random.randint(100, 20000)
+            scl_s = _sample_wave(scl, sample_rate, 0.35 / (clock_freq * 8), chunk_size)
+            sda_s = _sample_wave(sda, sample_rate, 0.35 / (clock_freq * 8), chunk_size)
+
+            info = {}
+            found = list(search.i2c_search(iter(scl_s), iter(sda_s), addresses, search_info=info))
+            expected = [t for t in transfers if t.address in addresses]
+            self.assertEqual(found, expected)
+
+            decoded = [t for t in i2c.reconstruct_i2c_transfers(i2c.i2c_decode(iter(scl_s), iter(sda_s), \
+                logic_levels=(0.0, 1.0))) if t.address in addresses]
+            for f, d in zip(found, decoded):
+                self.assertAlmostEqual(f.start_time, d.start_time, delta=1.0e-12)
+                self.assertAlmostEqual(f.end_time, d.end_time, delta=1.0e-12)
+
+            self.assertTrue(info['decoded'] <= info['headers'])
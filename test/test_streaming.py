@@ -27,10 +27,24 @@ from __future__ import print_function, division
 import unittest
 import random
 import os
+import io
 
 import ripyl.streaming as stream
 import test.test_support as tsup
 
+
+class _ReadOnly(object):
+    '''A file-like object without tell() or seek()'''
+    def __init__(self, data):
+        self._buf = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buf.read(size)
+
+    def readline(self):
+        return self._buf.readline()
+
+
 class TestStreamingFuncs(tsup.RandomSeededTestCase):
 
     def test_save_stream(self):
@@ -72,3 +86,166 @@ class TestStreamingFuncs(tsup.RandomSeededTestCase):
                     self.assertEqual(r, s, 'Mismatched records')
 
 
+    def test_indexed_stream(self):
+        self.test_name = 'save_indexed_stream() test'
+        self.trial_count = 20
+
+        out_dir = os.path.join('test', 'test-output')
+        if not os.path.exists(out_dir):
+            os.mkdir(out_dir)
+
+        save_file = os.path.join(out_dir, 'test_indexed_stream.bin')
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            rec_count = random.randint(0, 500)
+
+            records = []
+            t = 0.0
+            for r in xrange(rec_count):
+                t += random.uniform(0.0, 1.0)
+                if random.random() < 0.2:
+                    rec = stream.StreamEvent(t, data=r)
+                else:
+                    rec = stream.StreamSegment((t, t + random.uniform(0.0, 3.0)), data=r)
+                records.append(rec)
+
+            stream.save_indexed_stream(iter(records), save_file, block_size=random.randint(1, 50))
+
+            self.assertEqual(records, stream.load_stream(save_file), 'Mismatched records')
+
+            with stream.IndexedStream(save_file) as ixs:
+                self.assertEqual(len(records), len(ixs), 'Mismatch record count')
+
+                for _ in xrange(10):
+                    t0 = random.uniform(-1.0, t + 1.0)
+                    t1 = t0 + random.uniform(0.0, 10.0)
+
+                    expected = [r for r in records if stream._record_bounds(r)[1] >= t0 and \
+                        stream._record_bounds(r)[0] <= t1]
+
+                    self.assertEqual(expected, ixs.query(t0, t1), 'Mismatched query')
+
+            # A stream embedded in a larger file
+            buf = io.BytesIO()
+            buf.write(b'header')
+            stream.save_indexed_stream(iter(records), buf, block_size=random.randint(1, 50))
+            buf.write(b'trailer')
+
+            buf.seek(len(b'header'))
+            ixs = stream.IndexedStream(buf)
+            self.assertEqual(records, list(ixs), 'Mismatched embedded records')
+            self.assertEqual(records, ixs.query(-1.0, t + 5.0), 'Mismatched embedded query')
+
+            # Handles that can't seek
+            unseekable = _ReadOnly(buf.getvalue()[len(b'header'):])
+            self.assertEqual(records, stream.load_stream(unseekable), 'Mismatched unseekable records')
+
+        # Records without a time can't be indexed
+        untimed = [stream.StreamEvent(1.0), stream.StreamRecord(kind='untimed'), stream.StreamEvent(2.0)]
+        self.assertRaises(stream.StreamError, stream.save_indexed_stream, iter(untimed), io.BytesIO())
+
+    def test_merge_many_streams(self):
+        self.test_name = 'merge_many_streams() test'
+        self.trial_count = 20
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            stream_count = random.randint(0, 12)
+            record_streams = []
+            for s in xrange(stream_count):
+                records = []
+                t = 0.0
+                for r in xrange(random.randint(0, 50)):
+                    t += random.choice((0.0, random.uniform(0.0, 1.0)))
+                    if random.random() < 0.2:
+                        records.append(stream.StreamEvent(t, data=(s, r)))
+                    else:
+                        records.append(stream.StreamSegment((t, t + 0.5), data=(s, r)))
+                record_streams.append(records)
+
+            stream_ids = [random.randint(0, 1000) for _ in xrange(stream_count)]
+            merged = list(stream.merge_many_streams([iter(rs) for rs in record_streams], stream_ids))
+
+            self.assertEqual(sum(len(rs) for rs in record_streams), len(merged), 'Mismatch record count')
+
+            times = [stream._record_bounds(r)[0] for r in merged]
+            self.assertEqual(sorted(times), times, 'Records out of order')
+
+            # Each stream's records remain in order and are stamped with their id
+            for s, rs in enumerate(record_streams):
+                m_recs = [r for r in merged if r.data[0] == s]
+                self.assertEqual([r.data for r in rs], [r.data for r in m_recs], 'Mismatched stream order')
+                self.assertTrue(all(r.stream_id == stream_ids[s] for r in m_recs), 'Bad stream_id')
+
+
+    def test_sample_dtype(self):
+        self.test_name = 'sample dtype test'
+        self.trial_count = 20
+
+        import numpy as np
+        import ripyl.decode as decode
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            # Logic levels stored as int16 digitizer codes with scale and offset
+            scale = random.uniform(0.001, 0.01)
+            offset = random.uniform(-1.0, 1.0)
+            bits = [random.randint(0, 1) for _ in xrange(random.randint(2, 30))]
+            hold = random.randint(1, 20)
+            volts = np.repeat(np.array(bits, dtype=float) * 3.3, hold)
+            codes = np.round((volts - offset) / scale).astype(np.int16)
+
+            chunk_size = random.randint(5, 100)
+            samples = list(stream.samples_to_sample_stream(codes, 1.0, chunk_size=chunk_size, \
+                dtype=None, scale=scale, offset=offset))
+            self.assertTrue(all(sc.samples.dtype == np.int16 for sc in samples), 'Lost int16 dtype')
+
+            # The extractor keeps the compact representation
+            ce = stream.ChunkExtractor(iter(samples))
+            sc = ce.next_chunk(chunk_size * 2 + 1)
+            self.assertEqual(sc.samples.dtype, np.int16, 'Extractor lost int16 dtype')
+            self.assertEqual((sc.scale, sc.offset), (scale, offset), 'Extractor lost scale')
+
+            all_samples = stream.extract_all_samples(iter(samples))[0]
+            self.assertEqual(all_samples.dtype, np.float32, 'Wrong processing dtype')
+            np.testing.assert_allclose(all_samples, volts, atol=scale)
+
+            # Decoding operates on physical values
+            f_edges = list(decode.find_edges(iter(samples), (0.0, 3.3)))
+            f_samples = list(stream.samples_to_sample_stream(volts.astype(np.float32), 1.0, \
+                chunk_size=chunk_size, dtype=None))
+            self.assertEqual(f_samples[0].samples.dtype, np.float32, 'Lost float32 dtype')
+            f_edges2 = list(decode.find_edges(iter(f_samples), (0.0, 3.3)))
+            self.assertEqual(f_edges, f_edges2, 'Mismatched edges')
+
+
+    def test_lookahead_stream(self):
+        self.test_name = 'LookaheadStream test'
+        self.trial_count = 50
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            items = range(random.randint(0, 100))
+            max_la = random.randint(1, 50)
+            la = stream.LookaheadStream(iter(items), max_la)
+
+            # Peeking doesn't consume and never buffers more than max_lookahead items
+            n = random.randint(0, 80)
+            peeked = la.peek(n)
+            self.assertEqual(peeked, items[:min(n, max_la)], 'Bad peek')
+            self.assertEqual(la.peek(n), peeked, 'Peek consumed items')
+            self.assertTrue(len(la._buf) <= max_la, 'Buffer exceeded limit')
+
+            # Consume a few items directly before releasing the rest
+            skip = random.randint(0, 5)
+            taken = [x for _, x in zip(xrange(skip), la)]
+            self.assertEqual(taken, items[:len(taken)], 'Bad next()')
+
+            rest = la.release()
+            self.assertEqual(taken + list(rest), items, 'Released stream is incomplete')
+            self.assertRaises(stream.StreamError, la.peek, 1)
@@ -77,6 +77,34 @@ class TestUARTFuncs(tsup.RandomSeededTestCase):
                 "Message not decoded successfully msg:'{0}', baud:{1}, parity:{2}, bits:{3}".format(msg, \
                 baud, parity, bits))
 
+    def test_uart_decimated_decode(self):
+        self.test_name = 'UART decimated decode'
+        self.trial_count = 6
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            msg = bytearray(random.randint(0, 255) for _ in xrange(30))
+            baud = random.choice((9600, 19200, 115200))
+            sample_rate = baud * random.randint(200, 500)
+
+            edges = uart.uart_synth(msg, 8, baud, idle_start=4.0 / baud, idle_end=4.0 / baud)
+            samples = list(sigp.noisify(sigp.synth_wave(edges, sample_rate, 0.2 / baud), snr_db=30))
+
+            # Auto-baud runs on the full rate samples before decimation
+            ref_info = {}
+            ref_frames = list(uart.uart_decode(iter(samples), bits=8, param_info=ref_info))
+            info = {}
+            frames = list(uart.uart_decode(iter(samples), bits=8, param_info=info, samples_per_bit=20))
+
+            self.assertEqual(bytearray(f.data for f in frames), msg, 'Message not decoded successfully')
+            self.assertEqual(info['baud_rate'], ref_info['baud_rate'])
+            self.assertEqual(info['raw_symbol_rate'], ref_info['raw_symbol_rate'])
+
+            # Edges keep the original sample timing
+            for f, ref in zip(frames, ref_frames):
+                self.assertAlmostEqual(f.start_time, ref.start_time, delta=0.01 / sample_rate)
+                self.assertAlmostEqual(f.end_time, ref.end_time, delta=0.01 / sample_rate)
+
     #@unittest.skip('debug')            
     def test_uart_hello(self):
     
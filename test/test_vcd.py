@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''Ripyl protocol decode library
+   vcd.py test suite
+'''
+
+# Copyright © 2013 Kevin Thibedeau
+
+# This file is part of Ripyl.
+
+# Ripyl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# Ripyl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with Ripyl. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function, division
+
+import unittest
+import random
+import itertools
+import os
+
+import ripyl.io.vcd as vcd
+import ripyl.sigproc as sigp
+import ripyl.protocol.spi as spi
+import test.test_support as tsup
+
+
+class TestVCDFuncs(tsup.RandomSeededTestCase):
+
+    def setUp(self):
+        super(TestVCDFuncs, self).setUp()
+
+        self.out_dir = os.path.join('test', 'test-output')
+        if not os.path.exists(self.out_dir):
+            os.mkdir(self.out_dir)
+
+    def test_vcd_read(self):
+        vcd_file = os.path.join(self.out_dir, 'test_vcd_read.vcd')
+        vcd_text = '''$date today $end
+$timescale
+  10 us
+$end
+$scope module top $end
+$var wire 1 ! clk $end
+$scope module sub $end
+$var wire 4 # bus [3:0] $end
+$var real 1 % level $end
+$upscope $end
+$upscope $end
+$enddefinitions
+          $end
+$comment 1! is not a change $end
+#0
+$dumpvars
+0! bx0x0 # r0.5 %
+$end
+#5
+1!
+b1010 #
+#10 0! x! #12 1! r1.25 %
+#20
+b1010 #
+b11 #
+'''
+
+        # Offsets into the file must be in bytes regardless of the line endings
+        for newline, block_size in itertools.product(('\n', '\r\n'), (1, 7, 1024)):
+            with open(vcd_file, 'wb') as fh:
+                fh.write(vcd_text.replace('\n', newline))
+
+            r = vcd.VCDReader(vcd_file, block_size=block_size)
+
+            self.assertEqual(1.0e-5, r.timescale)
+            self.assertEqual(['top.clk', 'top.sub.bus', 'top.sub.level'], [c.name for c in r.channels])
+            self.assertEqual(4, r.channels[1].bits)
+
+            es = r.edge_streams(['clk', 'top.sub.bus', 'level'])
+            es = dict((k, [(round(t, 12), v) for t, v in e]) for k, e in es.iteritems())
+            self.assertEqual([(0.0, 0), (5.0e-5, 1), (1.0e-4, 0), (1.2e-4, 1)], es['clk'])
+            self.assertEqual([(5.0e-5, 10), (2.0e-4, 3)], es['top.sub.bus'])
+            self.assertEqual([(0.0, 0.5), (1.2e-4, 1.25)], es['level'])
+
+            self.assertRaises(ValueError, r.edges, 'foo')
+
+
+    def test_vcd_round_trip(self):
+        self.test_name = 'VCD round trip'
+        self.trial_count = 10
+
+        vcd_file = os.path.join(self.out_dir, 'test_vcd_round_trip.vcd')
+
+        for i in xrange(self.trial_count):
+            self.update_progress(i+1)
+
+            data = [random.randint(0, 255) for _ in xrange(random.randint(1, 20))]
+            clk, mosi, cs = spi.spi_synth(data, 8, 100e3)
+            channels = [
+                vcd.VCDChannel('clk', list(clk)),
+                vcd.VCDChannel('mosi', list(mosi)),
+                vcd.VCDChannel('cs', list(cs))
+            ]
+
+            vcd.VCDInfo(channels, timescale=1.0e-9).write(vcd_file)
+
+            r = vcd.VCDReader(vcd_file, block_size=random.randint(16, 4096))
+            es = r.edge_streams()
+
+            # Consume channels in parallel
+            edges = dict((c.name, []) for c in channels)
+            active = True
+            while active:
+                active = False
+                for c in channels:
+                    e = next(es['logic.' + c.name], None)
+                    if e is not None:
+                        edges[c.name].append(e)
+                        active = True
+
+            for c in channels:
+                # Drop the trailing end marker that has no state change
+                expected = list(sigp.remove_excess_edges(iter(c.states)))[:-1]
+                got = edges[c.name]
+                self.assertEqual([e[1] for e in expected], [e[1] for e in got], 'Mismatched states')
+                for e, g in zip(expected, got):
+                    self.assertAlmostEqual(e[0], g[0], places=12)
+